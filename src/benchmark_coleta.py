@@ -0,0 +1,442 @@
+import os
+import io
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import localidades
+import tabnet_prn
+import tabnet_local
+import dengue_dataset
+import epicalendario
+import ibge_pop_data
+import ipea_idhm_data
+
+# Benchmark offline das etapas de cada coletor sobre fixtures gravadas:
+#   tabnet     (coletar_dados_ano)     páginas PRN do TabNet
+#   meteostat  (collect_weather_data)  séries diárias por município
+#   idhm       (collect_idhm_data)     respostas OData do Ipeadata
+#   ibge_api   (collect_from_api)      resposta da API de agregados do IBGE
+#   tabela2022 (process_2022_csv)      tabela2022.csv do repositório
+#   tabela2023 (process_2023_csv)      tabela2023.csv do repositório
+# Cada coletor é medido em parse, transformação e escrita, separadamente, na escala
+# de um estado e na nacional: melhor tempo de N repetições e pico de memória
+# (tracemalloc, numa execução à parte; buffers internos do Arrow não entram). O relatório vai para JSON com o commit,
+# para comparar com o de outro commit (--comparar).
+#
+# Uso:
+#   python src/benchmark_coleta.py                       # gera fixtures sintéticas se faltarem
+#   python src/benchmark_coleta.py --fixtures DIR        # fixtures gravadas em outro diretório
+#   python src/benchmark_coleta.py --gravar              # grava fixtures reais (precisa de rede)
+#   python src/benchmark_coleta.py --comparar cache/benchmarks/abc1234.json
+#   python src/benchmark_coleta.py --comparar-bs4        # parser PRN atual x antigo (BeautifulSoup)
+
+FIXTURES_PADRAO = os.path.join("cache", "benchmark_fixtures")
+RELATORIOS_PADRAO = os.path.join("cache", "benchmarks")
+ANO_FIXTURE = 2023
+ANOS_API = ['2021', '2024']
+COLETORES = ('tabnet', 'meteostat', 'idhm', 'ibge_api', 'tabela2022', 'tabela2023')
+
+def _caminhos(fixtures):
+    return {
+        'registro': os.path.join(fixtures, 'ibge', 'localidades_municipios.json'),
+        'sidra': os.path.join(fixtures, 'ibge', 'sidra_populacao.json'),
+        'tabnet': os.path.join(fixtures, 'tabnet', 'dengueb{uf}_{ano}.html'),
+        'idhm': os.path.join(fixtures, 'ipea', 'idhm_{uf}.json'),
+        'meteostat': os.path.join(fixtures, 'meteostat', '{uf}.parquet'),
+    }
+
+def _escrever(caminho, texto, encoding='utf-8'):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'w', encoding=encoding) as f:
+        f.write(texto)
+
+def gerar_fixtures_sinteticas(fixtures, tabela2023="tabela2023.csv"):
+    """Fixtures determinísticas no formato das respostas reais.
+
+    Os municípios são os nomes de tabela2023.csv com códigos sintéticos alinhados
+    aos das páginas de tabnet_local (mesmo código de 6 dígitos).
+    """
+    caminhos = _caminhos(fixtures)
+    rng = np.random.default_rng(2023)
+    nomes = pd.read_csv(tabela2023, encoding='utf-8', skiprows=1, dtype=str)
+    nomes.columns = ['UF', 'Municipio', 'Populacao']
+    nomes['UF'] = nomes['UF'].str.strip().str.strip('()')
+    nomes = nomes[nomes['UF'].isin(list(localidades.ESTADOS))]
+
+    registro = []
+    for uf, grupo in nomes.groupby('UF', sort=True):
+        codigo_uf = int(localidades.ESTADOS[uf][1])
+        for m, nome in enumerate(grupo['Municipio'].str.strip()):
+            registro.append([(codigo_uf * 10000 + m * 5 + 5) * 10, nome])
+    os.makedirs(os.path.dirname(caminhos['registro']), exist_ok=True)
+    with open(caminhos['registro'], 'w', encoding='utf-8') as f:
+        json.dump(registro, f, ensure_ascii=False)
+
+    series = [{'localidade': {'id': str(codigo), 'nome': f"{nome} - XX"},
+               'serie': {ano: str(int(rng.integers(1000, 500000))) for ano in ANOS_API}}
+              for codigo, nome in registro]
+    _escrever(caminhos['sidra'], json.dumps([{'resultados': [{'series': series}]}], ensure_ascii=False))
+
+    por_uf = {}
+    for codigo, _ in registro:
+        por_uf.setdefault(localidades.SIGLA_POR_CODIGO[codigo // 100000], []).append(codigo)
+    datas = pd.date_range(f"{ANO_FIXTURE}-01-01", f"{ANO_FIXTURE}-12-31")
+    for uf, codigos in por_uf.items():
+        _escrever(caminhos['tabnet'].format(uf=uf.lower(), ano=ANO_FIXTURE),
+                  tabnet_local.gerar_pagina_prn(uf, ANO_FIXTURE, n_municipios=len(codigos), n_semanas=52),
+                  encoding='iso-8859-1')
+        valores = [{'TERCODIGO': str(codigo), 'VALVALOR': round(float(rng.uniform(0.45, 0.85)), 3)} for codigo in codigos]
+        _escrever(caminhos['idhm'].format(uf=uf), json.dumps({'@odata.context': 'fixture', 'value': valores}))
+
+        n = len(codigos) * len(datas)
+        tavg = rng.normal(25, 3, n)
+        diario = pd.DataFrame({
+            'date': np.tile(datas.to_numpy(), len(codigos)),
+            'code_muni': np.repeat(np.array(codigos, dtype='int32'), len(datas)),
+            'tavg': tavg, 'tmin': tavg - rng.uniform(2, 6, n), 'tmax': tavg + rng.uniform(2, 6, n),
+            'prcp': np.where(rng.random(n) < 0.6, 0.0, rng.gamma(1.5, 8, n)),
+        })
+        # Dias sem medição, como nas séries reais
+        for coluna in ('tavg', 'tmin', 'tmax', 'prcp'):
+            diario.loc[rng.random(n) < 0.05, coluna] = np.nan
+        os.makedirs(os.path.dirname(caminhos['meteostat']), exist_ok=True)
+        diario.to_parquet(caminhos['meteostat'].format(uf=uf), index=False)
+    print(f"Fixtures sintéticas gravadas em {fixtures} ({len(registro)} municípios).")
+
+def gravar_fixtures(fixtures, ufs, inicio=date(ANO_FIXTURE, 1, 1), fim=date(ANO_FIXTURE, 12, 31)):
+    """Grava respostas reais das fontes como fixtures (precisa de rede)."""
+    import http_cache
+    import sinan_scrapper
+    import meteostat_brazil_data
+    caminhos = _caminhos(fixtures)
+
+    os.makedirs(os.path.dirname(caminhos['registro']), exist_ok=True)
+    with open(caminhos['registro'], 'w', encoding='utf-8') as f:
+        json.dump(localidades.carregar_municipios(), f, ensure_ascii=False)
+
+    url = ibge_pop_data.URL_SIDRA_POPULACAO.format(periodos='|'.join(ANOS_API), localidades='N6[all]')
+    resposta = http_cache.get(url, source='ibge', timeout=120)
+    resposta.raise_for_status()
+    _escrever(caminhos['sidra'], resposta.text)
+
+    for uf in ufs:
+        pagina = sinan_scrapper.requisitar_pagina_ano(ANO_FIXTURE, uf)
+        if pagina is not None:
+            _escrever(caminhos['tabnet'].format(uf=uf.lower(), ano=ANO_FIXTURE), pagina, encoding='iso-8859-1')
+
+        resposta = http_cache.get(ipea_idhm_data.idhm_url(localidades.ESTADOS[uf][1]), source='ipea', timeout=120)
+        resposta.raise_for_status()
+        _escrever(caminhos['idhm'].format(uf=uf), resposta.text)
+
+        diario = meteostat_brazil_data.collect_weather_data(uf, datetime.combine(inicio, datetime.min.time()),
+                                                            datetime.combine(fim, datetime.min.time()))
+        os.makedirs(os.path.dirname(caminhos['meteostat']), exist_ok=True)
+        diario[['date', 'code_muni', 'tavg', 'tmin', 'tmax', 'prcp']].to_parquet(
+            caminhos['meteostat'].format(uf=uf), index=False)
+        print(f"Fixtures de {uf} gravadas.")
+
+def medir(funcao, repeticoes):
+    """(melhor tempo em s, pico de memória em bytes, resultado); a saída de print é descartada."""
+    melhor = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            resultado = funcao()
+            melhor = min(melhor, time.perf_counter() - inicio)
+
+        tracemalloc.start()
+        try:
+            resultado = funcao()
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return melhor, pico, resultado
+
+def _linhas(resultado):
+    """Linhas produzidas por uma etapa (para conferir que os commits comparados fazem o mesmo trabalho)."""
+    if isinstance(resultado, (pd.DataFrame, pa.Table)):
+        return len(resultado)
+    if isinstance(resultado, dict):
+        if 'Casos' in resultado:
+            return tabnet_prn.n_registros(resultado)
+        if 'TERCODIGO' in resultado:
+            return len(resultado['TERCODIGO'])
+        return sum(_linhas(valor) for valor in resultado.values())
+    return int(resultado or 0)
+
+def _ler(caminho, encoding='utf-8'):
+    with open(caminho, encoding=encoding) as f:
+        return f.read()
+
+def etapas(coletor, ufs, caminhos, saida):
+    """[(etapa, função)] do coletor; cada função recebe a saída da etapa anterior."""
+    if coletor == 'tabnet':
+        paginas = {uf: _ler(caminhos['tabnet'].format(uf=uf.lower(), ano=ANO_FIXTURE), 'iso-8859-1') for uf in ufs}
+
+        def escrever(tabelas):
+            for uf, tabela in tabelas.items():
+                caminho = dengue_dataset.caminho_particao(uf, ANO_FIXTURE, saida)
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                pq.write_table(tabela, caminho, compression='zstd')
+            return sum(t.num_rows for t in tabelas.values())
+        return [
+            ('parse', lambda _: {uf: tabnet_prn.parse_prn(pagina, ANO_FIXTURE) for uf, pagina in paginas.items()}),
+            ('transformacao', lambda tabelas: {uf: dengue_dataset.tabela_para_arrow(t) for uf, t in tabelas.items()}),
+            ('escrita', escrever),
+        ]
+
+    if coletor == 'meteostat':
+        def escrever(semanal):
+            semanal.to_parquet(os.path.join(saida, 'clima_semanal.parquet'), index=False)
+            return len(semanal)
+        return [
+            ('parse', lambda _: pd.concat([pd.read_parquet(caminhos['meteostat'].format(uf=uf)) for uf in ufs],
+                                          ignore_index=True)),
+            ('transformacao', epicalendario.agregar_semanal),
+            ('escrita', escrever),
+        ]
+
+    if coletor == 'idhm':
+        textos = {uf: _ler(caminhos['idhm'].format(uf=uf)) for uf in ufs}
+
+        def pedacos(texto, tamanho=65536):
+            return (texto[i:i + tamanho] for i in range(0, len(texto), tamanho))
+
+        def escrever(frames):
+            for uf, df in frames.items():
+                df.to_csv(os.path.join(saida, f"idhm_{uf}.csv"), index=False, encoding='utf-8-sig')
+            return sum(len(df) for df in frames.values())
+        return [
+            ('parse', lambda _: {uf: ipea_idhm_data.parse_idhm_values(pedacos(t)) for uf, t in textos.items()}),
+            ('transformacao', lambda colunas: {uf: ipea_idhm_data.build_idhm_frame(c) for uf, c in colunas.items()}),
+            ('escrita', escrever),
+        ]
+
+    if coletor == 'ibge_api':
+        texto = _ler(caminhos['sidra'])
+
+        def escrever(frames):
+            for uf, df in frames.items():
+                df.to_csv(os.path.join(saida, f"populacao_{uf}_2021.csv"), index=False, encoding='utf-8-sig')
+            return sum(len(df) for df in frames.values())
+        return [
+            ('parse', lambda _: ibge_pop_data.parse_population_json(json.loads(texto), ANOS_API)),
+            ('transformacao', lambda populacao: {uf: ibge_pop_data.collect_from_api(uf, '2021', populacao) for uf in ufs}),
+            ('escrita', escrever),
+        ]
+
+    if coletor in ('tabela2022', 'tabela2023'):
+        arquivo = f"{coletor}.csv"
+        parser = ibge_pop_data._parse_tabela2022 if coletor == 'tabela2022' else ibge_pop_data._parse_tabela2023
+        processar = ibge_pop_data.process_2022_csv if coletor == 'tabela2022' else ibge_pop_data.process_2023_csv
+
+        def transformar(_):
+            # A tabela nacional fica em memória (como no processo real); mede o recorte e a correspondência
+            ibge_pop_data.load_national_table(arquivo, parser, cache_dir=os.path.join(saida, 'tabelas'))
+            return {uf: processar(uf, arquivo) for uf in ufs}
+
+        def escrever(frames):
+            for uf, df in frames.items():
+                if df is not None:
+                    df.to_csv(os.path.join(saida, f"{coletor}_{uf}.csv"), index=False, encoding='utf-8-sig')
+            return sum(len(df) for df in frames.values() if df is not None)
+        return [
+            ('parse', lambda _: parser(arquivo)),
+            ('transformacao', transformar),
+            ('escrita', escrever),
+        ]
+
+    raise ValueError(f"Coletor desconhecido: {coletor}")
+
+def executar(fixtures, coletores=COLETORES, escalas=('estado', 'nacional'), uf='PE', repeticoes=3):
+    """Roda o benchmark e retorna a lista de medições."""
+    caminhos = _caminhos(fixtures)
+    # Registro de localidades das fixtures (substitui o do cache, se houver)
+    localidades._registro = None
+    localidades.registro(caminhos['registro'])
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as saida:
+        for escala in escalas:
+            ufs = [uf.upper()] if escala == 'estado' else sorted(localidades.ESTADOS)
+            for coletor in coletores:
+                pasta = os.path.join(saida, f"{coletor}_{escala}")
+                os.makedirs(pasta, exist_ok=True)
+                entrada = None
+                for etapa, funcao in etapas(coletor, ufs, caminhos, pasta):
+                    segundos, pico, saida_etapa = medir(lambda: funcao(entrada), repeticoes)
+                    resultados.append({'coletor': coletor, 'etapa': etapa, 'escala': escala,
+                                       'segundos': round(segundos, 6), 'pico_mb': round(pico / 2**20, 2),
+                                       'linhas': _linhas(saida_etapa)})
+                    print(f"{coletor:<11} {escala:<9} {etapa:<14} {segundos * 1000:>10.1f} ms "
+                          f"{pico / 2**20:>9.1f} MB {resultados[-1]['linhas']:>9}")
+                    entrada = saida_etapa
+                shutil.rmtree(pasta, ignore_errors=True)
+    return resultados
+
+def parse_legado(pagina, ano):
+    """Parser PRN anterior (BeautifulSoup), mantido só como referência do benchmark.
+
+    Retorna [[ano, semana, municipio, casos]] com os casos como texto, como no CSV antigo.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(pagina, "html.parser")
+    pre_tag = soup.find("pre")
+    if not pre_tag:
+        return []
+    table_data = pre_tag.text.strip().splitlines()
+    if table_data[-1].endswith('&'):
+        table_data[-1] = table_data[-1][:-1]
+
+    semanas = []
+    dados = []
+    for i, line in enumerate(table_data):
+        row = [item.strip('"') for item in line.split(';')]
+        if i == 0:
+            semanas = row[1:]
+        else:
+            municipio = row[0].strip().upper()
+            for idx, val in enumerate(row[1:]):
+                semana = semanas[idx].strip().upper()
+                if semana == 'TOTAL':
+                    continue
+                valor = val.strip()
+                if valor == '' or valor == '-':
+                    valor = '0'
+                dados.append([ano, semana, municipio, valor])
+    return dados
+
+def comparar_bs4(fixtures, escalas=('estado', 'nacional'), uf='PE', repeticoes=3):
+    """Mede o parse das páginas TabNet com o parser atual e com o antigo (BeautifulSoup).
+
+    Confere que os dois devolvem os mesmos registros em cada página. Retorna a lista
+    de medições, ou None se o bs4 não estiver instalado.
+    """
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        print("bs4 não está instalado; comparação com o parser antigo ignorada (pip install beautifulsoup4).")
+        return None
+
+    caminhos = _caminhos(fixtures)
+    resultados = []
+    print(f"{'escala':<9} {'parser':<8} {'tempo':>13} {'pico':>12} {'linhas':>9}")
+    for escala in escalas:
+        ufs = [uf.upper()] if escala == 'estado' else sorted(localidades.ESTADOS)
+        paginas = {sigla: _ler(caminhos['tabnet'].format(uf=sigla.lower(), ano=ANO_FIXTURE), 'iso-8859-1')
+                   for sigla in ufs}
+        parsers = {
+            'atual': lambda: {sigla: tabnet_prn.parse_prn(p, ANO_FIXTURE) for sigla, p in paginas.items()},
+            'bs4': lambda: {sigla: parse_legado(p, ANO_FIXTURE) for sigla, p in paginas.items()},
+        }
+        saidas = {}
+        for nome, funcao in parsers.items():
+            segundos, pico, saidas[nome] = medir(funcao, repeticoes)
+            linhas = sum(len(v) if nome == 'bs4' else tabnet_prn.n_registros(v) for v in saidas[nome].values())
+            resultados.append({'escala': escala, 'parser': nome, 'segundos': round(segundos, 6),
+                               'pico_mb': round(pico / 2**20, 2), 'linhas': linhas})
+            print(f"{escala:<9} {nome:<8} {segundos * 1000:>10.1f} ms {pico / 2**20:>9.1f} MB {linhas:>9}")
+
+        divergentes = [sigla for sigla in ufs
+                       if [[a, s, m, str(c)] for a, s, m, c in tabnet_prn.linhas(saidas['atual'][sigla])]
+                       != saidas['bs4'][sigla]]
+        atual, legado = resultados[-2], resultados[-1]
+        ganho = legado['segundos'] / atual['segundos'] if atual['segundos'] else float('nan')
+        print(f"{escala:<9} {ganho:.1f}x mais rápido que o bs4; "
+              + (f"saídas DIFERENTES em {', '.join(divergentes)}" if divergentes else "saídas idênticas"))
+        for r in resultados[-2:]:
+            r['identicos'] = not divergentes
+    return resultados
+
+def _commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        sujo = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                              text=True).stdout.strip()
+        return commit + ('-sujo' if sujo else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+def relatorio(resultados, fixtures, repeticoes):
+    return {
+        'commit': _commit(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pacotes': {'pandas': pd.__version__, 'numpy': np.__version__, 'pyarrow': pa.__version__},
+        'maquina': platform.machine(),
+        'fixtures': fixtures,
+        'repeticoes': repeticoes,
+        'resultados': resultados,
+    }
+
+def comparar(atual, base):
+    """Tabela com a razão de tempo e memória (atual / base) de cada medição."""
+    chave = lambda r: (r['coletor'], r['escala'], r['etapa'])
+    anteriores = {chave(r): r for r in base['resultados']}
+    print(f"\nComparação com {base['commit']} ({base['data']}):")
+    print(f"{'coletor':<11} {'escala':<9} {'etapa':<14} {'base ms':>10} {'atual ms':>10} {'tempo':>7} {'memória':>8}")
+    for r in atual['resultados']:
+        b = anteriores.get(chave(r))
+        if b is None:
+            continue
+        razao_tempo = r['segundos'] / b['segundos'] if b['segundos'] else float('nan')
+        razao_mem = r['pico_mb'] / b['pico_mb'] if b['pico_mb'] else float('nan')
+        print(f"{r['coletor']:<11} {r['escala']:<9} {r['etapa']:<14} {b['segundos'] * 1000:>10.1f} "
+              f"{r['segundos'] * 1000:>10.1f} {razao_tempo:>6.2f}x {razao_mem:>7.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline das etapas dos coletores.")
+    parser.add_argument('--fixtures', default=FIXTURES_PADRAO, help="Diretório das fixtures")
+    parser.add_argument('--gerar', action='store_true', help="Regera as fixtures sintéticas")
+    parser.add_argument('--gravar', action='store_true', help="Grava fixtures reais das fontes (precisa de rede)")
+    parser.add_argument('--coletores', default=','.join(COLETORES), help="Lista separada por vírgulas")
+    parser.add_argument('--escalas', default='estado,nacional', help="estado, nacional ou ambas")
+    parser.add_argument('--uf', default='PE', help="UF da escala de um estado")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--saida', help="Arquivo JSON do relatório (padrão: cache/benchmarks/<commit>.json)")
+    parser.add_argument('--comparar', help="Relatório JSON de outro commit para comparar")
+    parser.add_argument('--comparar-bs4', action='store_true',
+                        help="Só compara o parser PRN atual com o antigo (BeautifulSoup) nas páginas TabNet")
+    args = parser.parse_args(argv)
+
+    if args.gravar:
+        gravar_fixtures(args.fixtures, sorted(localidades.ESTADOS))
+    elif args.gerar or not os.path.exists(_caminhos(args.fixtures)['registro']):
+        gerar_fixtures_sinteticas(args.fixtures)
+
+    if args.comparar_bs4:
+        resultados = comparar_bs4(args.fixtures, args.escalas.split(','), args.uf, args.repeticoes)
+        if resultados is not None and not all(r['identicos'] for r in resultados):
+            raise SystemExit(1)
+        return
+
+    print(f"{'coletor':<11} {'escala':<9} {'etapa':<14} {'tempo':>13} {'pico':>12} {'linhas':>9}")
+    resultados = executar(args.fixtures, args.coletores.split(','), args.escalas.split(','), args.uf,
+                          args.repeticoes)
+    atual = relatorio(resultados, args.fixtures, args.repeticoes)
+
+    saida = args.saida or os.path.join(RELATORIOS_PADRAO, f"{atual['commit']}.json")
+    os.makedirs(os.path.dirname(saida) or '.', exist_ok=True)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(atual, f, ensure_ascii=False, indent=1)
+    print(f"\nRelatório gravado em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(atual, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Benchmark do tempo de importação dos coletores. Cada módulo é importado num
+# interpretador novo (sem nada em cache no processo), N vezes; o tempo medido é só
+# o do `import`, sem a partida do Python. Também confere que nenhuma dependência
+# pesada (pandas, numpy, pyarrow, meteostat, geobr...) é carregada por um import puro:
+# elas só devem entrar quando a coleta roda.
+#
+# Uso:
+#   python src/benchmark_importacao.py                 # coletores, melhor de 5
+#   python src/benchmark_importacao.py --limite-ms 200 --modulos painel,scoring
+# Sai com código 1 se algum módulo passar do limite ou carregar uma dependência pesada.
+
+MODULOS = ('sinan_scrapper', 'meteostat_brazil_data', 'ipea_idhm_data', 'ibge_pop_data',
+           'localidades', 'http_cache', 'metricas', 'normalizacao', 'tabnet_prn', 'sinan_store')
+PESADOS = ('pandas', 'numpy', 'pyarrow', 'meteostat', 'geobr', 'geopandas', 'shapely', 'sklearn', 'joblib')
+LIMITE_MS = 300
+REPETICOES = 5
+
+_SONDA = """
+import sys, time, json
+inicio = time.perf_counter()
+import {modulo}
+duracao = time.perf_counter() - inicio
+print(json.dumps({{'ms': 1000 * duracao, 'pesados': [m for m in {pesados!r} if m in sys.modules]}}))
+"""
+
+def medir_importacao(modulo, repeticoes=REPETICOES, diretorio=None):
+    """Melhor tempo (ms) de `import modulo` em interpretadores novos e os pesados carregados."""
+    diretorio = diretorio or os.path.dirname(os.path.abspath(__file__))
+    tempos = []
+    pesados = set()
+    for _ in range(repeticoes):
+        saida = subprocess.run([sys.executable, '-c', _SONDA.format(modulo=modulo, pesados=PESADOS)],
+                               cwd=diretorio, capture_output=True, text=True)
+        if saida.returncode != 0:
+            erro = saida.stderr.strip().splitlines()
+            return {'modulo': modulo, 'erro': erro[-1] if erro else f"código {saida.returncode}"}
+        resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+        tempos.append(resultado['ms'])
+        pesados.update(resultado['pesados'])
+    return {'modulo': modulo, 'ms': min(tempos), 'mediana_ms': sorted(tempos)[len(tempos) // 2],
+            'pesados': sorted(pesados)}
+
+def executar(modulos=MODULOS, repeticoes=REPETICOES, limite_ms=LIMITE_MS):
+    """Mede todos os módulos e imprime a tabela; retorna (resultados, ok)."""
+    resultados = [medir_importacao(modulo, repeticoes) for modulo in modulos]
+    ok = True
+    print(f"{'módulo':<24}{'melhor (ms)':>12}{'mediana (ms)':>14}  pesados")
+    for r in resultados:
+        if 'erro' in r:
+            ok = False
+            print(f"{r['modulo']:<24}{'-':>12}{'-':>14}  ERRO: {r['erro']}")
+            continue
+        falhou = r['ms'] > limite_ms or r['pesados']
+        ok = ok and not falhou
+        print(f"{r['modulo']:<24}{r['ms']:>12.1f}{r['mediana_ms']:>14.1f}  "
+              f"{', '.join(r['pesados']) or '-'}{'  <-- FALHOU' if falhou else ''}")
+    print(f"\nLimite: {limite_ms} ms por módulo, sem dependências pesadas. {'OK' if ok else 'FALHOU'}.")
+    return resultados, ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de importação dos coletores.")
+    parser.add_argument('--modulos', default=','.join(MODULOS))
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES)
+    parser.add_argument('--limite-ms', type=float, default=LIMITE_MS)
+    parser.add_argument('--saida', help="grava os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    resultados, ok = executar(args.modulos.split(','), args.repeticoes, args.limite_ms)
+    if args.saida:
+        os.makedirs(os.path.dirname(args.saida) or '.', exist_ok=True)
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'limite_ms': args.limite_ms, 'resultados': resultados}, f, indent=1)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import glob
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+
+# Saída em streaming do clima diário do Meteostat, em Parquet particionado por
+# estado, com um arquivo por município:
+#   clima_parquet/uf=PE/municipio=2611606.parquet
+# Cada município é gravado assim que a sua série chega, então a memória de pico da
+# coleta fica no tamanho de um lote de municípios, e não do estado inteiro.
+# Medidas em float32 com nulos de verdade (dia sem medição não vira zero),
+# code_muni em int32 e os nomes (município e estado) codificados em dicionário.
+
+DIRETORIO_PADRAO = "clima_parquet"
+COLUNAS_MEDIDAS = ['tavg', 'tmin', 'tmax', 'prcp', 'snow', 'wdir', 'wspd', 'wpgt', 'pres', 'tsun']
+
+ESQUEMA = pa.schema(
+    [('date', pa.date32()), ('code_muni', pa.int32()),
+     ('city', pa.dictionary(pa.int8(), pa.string())), ('state', pa.dictionary(pa.int8(), pa.string()))]
+    + [(coluna, pa.float32()) for coluna in COLUNAS_MEDIDAS]
+)
+
+def caminho_estado(estado, diretorio=DIRETORIO_PADRAO):
+    return os.path.join(diretorio, f"uf={estado.upper()}")
+
+def caminho_municipio(estado, code_muni, diretorio=DIRETORIO_PADRAO):
+    """Arquivo de um município dentro da partição do estado."""
+    return os.path.join(caminho_estado(estado, diretorio), f"municipio={int(code_muni)}.parquet")
+
+def _rotulo(valor, n):
+    """Coluna constante codificada em dicionário: um único valor no dicionário, n índices zero."""
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype='int8')), pa.array([valor], pa.string()))
+
+def tabela_municipio(data, code_muni, city, state):
+    """Converte a série diária de um município (índice de datas do Meteostat) na tabela Arrow tipada."""
+    n = len(data)
+    datas = np.asarray(data.index.values, dtype='datetime64[D]')
+    colunas = {
+        'date': pa.array(datas, pa.date32()),
+        'code_muni': pa.array(np.full(n, code_muni, dtype='int32')),
+        'city': _rotulo(city, n),
+        'state': _rotulo(state, n),
+    }
+    for coluna in COLUNAS_MEDIDAS:
+        if coluna in data:
+            valores = data[coluna].to_numpy(dtype='float32', na_value=np.nan)
+            colunas[coluna] = pa.array(valores, pa.float32(), mask=np.isnan(valores))
+        else:
+            colunas[coluna] = pa.nulls(n, pa.float32())
+    return pa.table(colunas, schema=ESQUEMA)
+
+def salvar_municipio(estado, code_muni, tabela, diretorio=DIRETORIO_PADRAO):
+    """Grava (ou substitui) o arquivo do município de forma atômica. Retorna o caminho."""
+    caminho = caminho_municipio(estado, code_muni, diretorio)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    pq.write_table(tabela, tmp, compression='zstd')
+    os.replace(tmp, caminho)
+    return caminho
+
+def _codigo(arquivo):
+    return int(os.path.basename(arquivo)[len("municipio="):-len(".parquet")])
+
+def municipios_gravados(estado, diretorio=DIRETORIO_PADRAO):
+    """Códigos dos municípios do estado que já têm arquivo no dataset."""
+    return {_codigo(arquivo) for arquivo in arquivos(estado, diretorio)}
+
+def arquivos(estado=None, diretorio=DIRETORIO_PADRAO):
+    """Arquivos de município do dataset (de um estado ou de todos), sem os temporários."""
+    pasta = caminho_estado(estado, diretorio) if estado is not None else os.path.join(diretorio, "uf=*")
+    return sorted(glob.glob(os.path.join(pasta, "municipio=*.parquet")))
+
+def carregar(estado=None, diretorio=DIRETORIO_PADRAO, colunas=None, municipios=None):
+    """Lê o clima como DataFrame (date em datetime64), só do estado e dos municípios pedidos."""
+    selecionados = arquivos(estado, diretorio)
+    if municipios is not None:
+        # O código está no nome do arquivo: nem abre os outros
+        pedidos = {int(m) for m in municipios}
+        selecionados = [arquivo for arquivo in selecionados if _codigo(arquivo) in pedidos]
+    if not selecionados:
+        raise FileNotFoundError(f"Nenhum arquivo de clima em {caminho_estado(estado, diretorio) if estado else diretorio}.")
+    dataset = ds.dataset(selecionados, schema=ESQUEMA, format='parquet')
+    return dataset.to_table(columns=colunas).to_pandas(date_as_object=False)
@@ -0,0 +1,102 @@
+import os
+import re
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+import requests
+import localidades
+
+# Saída colunar dos casos de dengue em Parquet, particionada por estado e ano:
+#   dengue_parquet/uf=PE/ano=2023/part-0.parquet
+# Casos em int32, Semana e Municipio codificados em dicionário e o código IBGE em
+# int32: CodMunicipio com 6 dígitos (como no rótulo do TabNet) e code_muni com os
+# 7 dígitos do registro de localidades.
+
+DIRETORIO_PADRAO = "dengue_parquet"
+
+_CODIGO_MUNICIPIO = re.compile(r'^(\d{6})\s')
+
+ESQUEMA = pa.schema([
+    ('Ano', pa.int16()),
+    ('Semana', pa.dictionary(pa.int8(), pa.string())),
+    ('NumSemana', pa.int8()),
+    ('Municipio', pa.dictionary(pa.int16(), pa.string())),
+    ('CodMunicipio', pa.int32()),
+    ('code_muni', pa.int32()),
+    ('Casos', pa.int32()),
+])
+
+def _codificar(valores):
+    """Retorna (índices, categorias) para uma coluna de rótulos repetidos."""
+    categorias = list(dict.fromkeys(valores))
+    posicao = {valor: i for i, valor in enumerate(categorias)}
+    return [posicao[v] for v in valores], categorias
+
+def tabela_para_arrow(tabela):
+    """Converte a tabela colunar de tabnet_prn em uma tabela Arrow tipada.
+
+    A linha 'TOTAL' do TabNet não tem código de município e fica de fora.
+    """
+    indices_mun, municipios = _codificar(tabela['Municipio'])
+    codigos_cat = []
+    for municipio in municipios:
+        match = _CODIGO_MUNICIPIO.match(municipio)
+        codigos_cat.append(int(match.group(1)) if match else None)
+    manter = [i for i, idx in enumerate(indices_mun) if codigos_cat[idx] is not None]
+
+    try:
+        codigos7_cat = [localidades.codigo7(c) if c is not None else None for c in codigos_cat]
+    except (requests.RequestException, ValueError, OSError) as e:
+        # Rede fora, JSON do cache corrompido ou disco ilegível: os casos são gravados mesmo assim
+        print(f"Aviso: registro de localidades indisponível, code_muni ficará vazio ({e}).")
+        codigos7_cat = [None] * len(codigos_cat)
+
+    indices_sem, semanas = _codificar([tabela['Semana'][i] for i in manter])
+    numeros_cat = []
+    for semana in semanas:
+        digitos = ''.join(c for c in semana if c.isdigit())
+        numeros_cat.append(int(digitos) if digitos else None)
+
+    indices_mun = [indices_mun[i] for i in manter]
+    return pa.table({
+        'Ano': pa.array([tabela['Ano'][i] for i in manter], pa.int16()),
+        'Semana': pa.DictionaryArray.from_arrays(pa.array(indices_sem, pa.int8()), pa.array(semanas, pa.string())),
+        'NumSemana': pa.array([numeros_cat[i] for i in indices_sem], pa.int8()),
+        'Municipio': pa.DictionaryArray.from_arrays(pa.array(indices_mun, pa.int16()), pa.array(municipios, pa.string())),
+        'CodMunicipio': pa.array([codigos_cat[i] for i in indices_mun], pa.int32()),
+        'code_muni': pa.array([codigos7_cat[i] for i in indices_mun], pa.int32()),
+        'Casos': pa.array([tabela['Casos'][i] for i in manter], pa.int32()),
+    }, schema=ESQUEMA)
+
+def caminho_particao(estado, ano, diretorio=DIRETORIO_PADRAO):
+    """Caminho do arquivo de uma partição (estado, ano)."""
+    return os.path.join(diretorio, f"uf={estado.upper()}", f"ano={int(ano)}", "part-0.parquet")
+
+def salvar_particoes(estado, tabela, diretorio=DIRETORIO_PADRAO):
+    """Grava uma partição por ano do estado, substituindo as existentes. Retorna os caminhos."""
+    tabela_arrow = tabela_para_arrow(tabela)
+    caminhos = []
+    anos = sorted(set(tabela_arrow.column('Ano').to_pylist()))
+    for ano in anos:
+        particao = tabela_arrow.filter(pc.equal(tabela_arrow['Ano'], ano))
+        caminho = caminho_particao(estado, ano, diretorio)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        pq.write_table(particao, caminho, compression='zstd')
+        caminhos.append(caminho)
+    return caminhos
+
+def carregar(estado=None, ano=None, diretorio=DIRETORIO_PADRAO, colunas=None):
+    """Lê os casos como DataFrame (Semana e Municipio categóricos), lendo só as partições pedidas."""
+    if estado is not None and ano is not None:
+        # Partição única: abre direto o arquivo, sem varrer o diretório
+        return pq.read_table(caminho_particao(estado, ano, diretorio), columns=colunas).to_pandas()
+
+    dataset = ds.dataset(diretorio, format='parquet', partitioning='hive')
+    filtro = None
+    if estado is not None:
+        filtro = ds.field('uf') == estado.upper()
+    if ano is not None:
+        filtro_ano = ds.field('ano') == int(ano)
+        filtro = filtro_ano if filtro is None else filtro & filtro_ano
+    return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
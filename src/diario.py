@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+# Diário (journal) das unidades de trabalho de uma execução longa, para retomar de
+# onde parou. Uma unidade é uma tupla como ('tabnet', 'PE', 2021),
+# ('meteostat', 'PE', 2611606) ou ('etapa', 'clima', 'PE'). Cada unidade concluída
+# (ou que falhou) vira uma linha JSON acrescentada ao arquivo, gravada em disco
+# na hora (flush + fsync):
+#   cache/diario/<nome>.jsonl
+# Na retomada, uma unidade é pulada se o último registro dela é 'ok' e os
+# arquivos que ela gerou ainda existem; as que falharam ou nunca terminaram são
+# refeitas. Uma linha cortada no fim (processo morto no meio da escrita) é ignorada.
+
+DIRETORIO_PADRAO = os.path.join("cache", "diario")
+
+def chave(unidade):
+    return '/'.join(str(parte) for parte in unidade)
+
+def ler(caminho):
+    """{chave: último registro} de um diário existente ({} se não houver)."""
+    estado = {}
+    if not os.path.exists(caminho):
+        return estado
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue
+            estado[chave(registro['unidade'])] = registro
+    return estado
+
+class Diario:
+    """Diário de uma execução; seguro para uso por várias threads."""
+
+    def __init__(self, nome, retomar=False, diretorio=DIRETORIO_PADRAO):
+        """Sem `retomar`, começa um diário novo (o anterior fica em <nome>.jsonl.anterior)."""
+        self.caminho = os.path.join(diretorio, f"{nome}.jsonl")
+        os.makedirs(diretorio, exist_ok=True)
+        if retomar:
+            self._estado = ler(self.caminho)
+        else:
+            if os.path.exists(self.caminho):
+                os.replace(self.caminho, f"{self.caminho}.anterior")
+            self._estado = {}
+        self._lock = threading.Lock()
+        self._arquivo = open(self.caminho, 'a', encoding='utf-8')
+
+    def concluida(self, *unidade):
+        """True se a unidade terminou com sucesso e os arquivos dela ainda existem."""
+        registro = self._estado.get(chave(unidade))
+        return (registro is not None and registro['status'] == 'ok'
+                and all(os.path.exists(caminho) for caminho in registro.get('artefatos', [])))
+
+    def pendentes(self, unidades):
+        """As unidades (tuplas) que ainda precisam rodar."""
+        return [unidade for unidade in unidades if not self.concluida(*unidade)]
+
+    def falhas(self, *prefixo):
+        """Unidades (tuplas) começadas por `prefixo` cujo último registro não é 'ok'."""
+        with self._lock:
+            registros = list(self._estado.values())
+        return [tuple(registro['unidade']) for registro in registros
+                if registro['status'] != 'ok' and tuple(registro['unidade'][:len(prefixo)]) == prefixo]
+
+    def artefatos(self, *unidade):
+        registro = self._estado.get(chave(unidade))
+        return list(registro.get('artefatos', [])) if registro else []
+
+    def registrar(self, unidade, status, artefatos=(), **detalhes):
+        """Acrescenta o resultado de uma unidade ('ok' ou 'falhou') e o grava em disco."""
+        registro = {'unidade': list(unidade), 'status': status, 'artefatos': list(artefatos),
+                    'ts': datetime.now().isoformat(timespec='seconds'), **detalhes}
+        linha = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self._arquivo.write(linha)
+            self._arquivo.flush()
+            os.fsync(self._arquivo.fileno())
+            self._estado[chave(unidade)] = registro
+
+    def resumo(self):
+        """Contagem de unidades por status (último registro de cada uma)."""
+        contagem = {}
+        for registro in self._estado.values():
+            contagem[registro['status']] = contagem.get(registro['status'], 0) + 1
+        return contagem
+
+    def fechar(self):
+        with self._lock:
+            self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.fechar()
+        return False
@@ -0,0 +1,109 @@
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+# Calendário epidemiológico (semanas de domingo a sábado; a semana 1 é a que contém
+# 4 de janeiro) pré-calculado como tabela de consulta dia -> (ano, semana), para
+# converter milhões de datas de uma vez sem chamar epiweeks.Week.fromdate por linha.
+# E a agregação do clima diário em semanas epidemiológicas por município, com a
+# contagem de dias observados em cada semana.
+
+ANO_MIN = 2000
+ANO_MAX = 2040
+
+COLUNAS_CLIMA = ['tavg', 'tmin', 'tmax', 'prcp']
+
+# Como cada medida diária vira semanal (demais medidas: média)
+AGREGACOES = {'tavg': 'media', 'tmin': 'minimo', 'tmax': 'maximo', 'prcp': 'soma',
+              'wspd': 'media', 'pres': 'media', 'tsun': 'soma'}
+
+def inicio_ano_epi(ano):
+    """Domingo que abre a semana epidemiológica 1 do ano (a semana que contém 4 de janeiro)."""
+    quatro_jan = date(ano, 1, 4)
+    return quatro_jan - timedelta(days=(quatro_jan.weekday() + 1) % 7)
+
+def eixo_semanas(ano_inicio, ano_fim):
+    """Semanas epidemiológicas de ano_inicio a ano_fim, contíguas.
+
+    Retorna (anos int16, semanas int8, inícios datetime64[D]); a semana t começa
+    em inícios[0] + 7 * t dias.
+    """
+    anos, semanas = [], []
+    for ano in range(ano_inicio, ano_fim + 1):
+        n_semanas = (inicio_ano_epi(ano + 1) - inicio_ano_epi(ano)).days // 7
+        anos.extend([ano] * n_semanas)
+        semanas.extend(range(1, n_semanas + 1))
+    inicios = np.datetime64(inicio_ano_epi(ano_inicio), 'D') + 7 * np.arange(len(anos))
+    return np.array(anos, dtype='int16'), np.array(semanas, dtype='int8'), inicios
+
+# Tabela de consulta: uma entrada por dia de ANO_MIN a ANO_MAX
+_ANOS, _SEMANAS, _INICIOS = eixo_semanas(ANO_MIN, ANO_MAX)
+ORIGEM = _INICIOS[0]
+ANO_POR_DIA = np.repeat(_ANOS, 7)
+SEMANA_POR_DIA = np.repeat(_SEMANAS, 7)
+
+def indice_dia(datas):
+    """Dias desde ORIGEM (int64) para um array/Series de datas; erro se sair da tabela."""
+    dias = (pd.to_datetime(np.asarray(datas)).to_numpy('datetime64[D]') - ORIGEM).astype('int64')
+    if len(dias) and (dias.min() < 0 or dias.max() >= len(ANO_POR_DIA)):
+        raise ValueError(f"Datas fora do calendário pré-calculado ({ANO_MIN}–{ANO_MAX}).")
+    return dias
+
+def semana_epi(datas):
+    """(ano_epi int16, semana_epi int8) de cada data, por consulta direta à tabela."""
+    dias = indice_dia(datas)
+    return ANO_POR_DIA[dias], SEMANA_POR_DIA[dias]
+
+def _vazio(colunas):
+    tipos = {'code_muni': 'int32', 'ano_epi': 'int16', 'semana_epi': 'int8', 'dias': 'int8'}
+    for coluna in colunas:
+        tipos[coluna] = 'float32'
+        tipos[f'dias_{coluna}'] = 'int8'
+    return pd.DataFrame({coluna: np.array([], dtype=tipo) for coluna, tipo in tipos.items()})
+
+def agregar_semanal(clima, colunas=COLUNAS_CLIMA):
+    """Agrega o clima diário (date, code_muni e medidas) por município e semana epidemiológica.
+
+    Retorna uma linha por (code_muni, ano_epi, semana_epi) com a agregação de cada
+    medida em AGREGACOES (float32), `dias` (linhas diárias na semana) e `dias_<medida>`
+    (dias com a medida observada). Semana sem nenhum dia observado de uma medida
+    fica nula nela, em vez de virar zero.
+    """
+    if clima.empty:
+        return _vazio(colunas)
+
+    dias = indice_dia(clima['date'])
+    municipios, posicao = np.unique(clima['code_muni'].to_numpy('int32'), return_inverse=True)
+    semana = dias // 7
+    primeira = semana.min()
+    n_semanas = semana.max() - primeira + 1
+
+    # Uma única ordenação pela chave (município, semana); cada grupo vira um trecho contíguo
+    chave = posicao.astype('int64') * n_semanas + (semana - primeira)
+    ordem = np.argsort(chave, kind='stable')
+    chave = chave[ordem]
+    inicios = np.flatnonzero(np.r_[True, chave[1:] != chave[:-1]])
+    grupo_municipio, grupo_semana = np.divmod(chave[inicios], n_semanas)
+
+    resultado = {
+        'code_muni': municipios[grupo_municipio].astype('int32'),
+        'ano_epi': _ANOS[grupo_semana + primeira],
+        'semana_epi': _SEMANAS[grupo_semana + primeira],
+        'dias': np.diff(np.r_[inicios, len(chave)]).astype('int8'),
+    }
+    for coluna in colunas:
+        valores = clima[coluna].to_numpy('float64')[ordem]
+        observado = ~np.isnan(valores)
+        n_dias = np.add.reduceat(observado.astype('int64'), inicios)
+        agregacao = AGREGACOES.get(coluna, 'media')
+        if agregacao == 'minimo':
+            agregado = np.fmin.reduceat(valores, inicios)
+        elif agregacao == 'maximo':
+            agregado = np.fmax.reduceat(valores, inicios)
+        else:
+            soma = np.add.reduceat(np.where(observado, valores, 0.0), inicios)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                agregado = np.where(n_dias > 0, soma if agregacao == 'soma' else soma / n_dias, np.nan)
+        resultado[coluna] = agregado.astype('float32')
+        resultado[f'dias_{coluna}'] = n_dias.astype('int8')
+    return pd.DataFrame(resultado)
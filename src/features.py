@@ -0,0 +1,89 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Preditores defasados e de janela móvel sobre matrizes município × semana
+# (as do painel/cubo de treinamento), sem groupby/shift/rolling do pandas:
+# defasagens por janelas deslizantes (views, sem cópia) e somas/médias móveis por
+# diferença de somas acumuladas.
+#
+# Todos os preditores da semana t usam só semanas anteriores (até t-1), para
+# prever os casos de t. Semanas sem dado suficiente ficam NaN.
+
+LAGS_CASOS = tuple(range(1, 13))
+JANELAS_PRCP = (2, 4, 8, 12)
+JANELA_ANOMALIA = 52
+TAMANHO_BLOCO = 512
+
+def nomes_features(lags=LAGS_CASOS, janelas=JANELAS_PRCP):
+    """Nomes das colunas do tensor, na ordem de gerar()."""
+    return ([f'casos_lag{lag}' for lag in lags]
+            + [f'prcp_soma{janela}' for janela in janelas]
+            + ['tavg_lag1', 'tmin_lag1', 'tmax_lag1', 'tavg_anomalia'])
+
+def defasagens(matriz, lags):
+    """(municípios, semanas, len(lags)) com matriz[:, t - lag] em cada semana t."""
+    maior = max(lags)
+    preenchida = np.pad(matriz.astype('float32', copy=False), ((0, 0), (maior, 0)), constant_values=np.nan)
+    # janelas[:, t, j] = matriz[:, t + j - maior]  (view sobre `preenchida`)
+    janelas = sliding_window_view(preenchida, maior + 1, axis=1)[:, :matriz.shape[1]]
+    return janelas[..., maior - np.asarray(lags)]
+
+def _acumulados(matriz):
+    """Somas acumuladas dos valores e da contagem de observados, com um zero à esquerda."""
+    observado = ~np.isnan(matriz)
+    soma = np.zeros((matriz.shape[0], matriz.shape[1] + 1), dtype='float64')
+    contagem = np.zeros_like(soma, dtype='int32')
+    np.cumsum(np.where(observado, matriz, 0.0), axis=1, out=soma[:, 1:])
+    np.cumsum(observado, axis=1, out=contagem[:, 1:])
+    return soma, contagem
+
+def _janela_anterior(acumulado, janela):
+    """Diferença do acumulado na janela [t - janela, t - 1] para cada semana t."""
+    n_semanas = acumulado.shape[1] - 1
+    t = np.arange(n_semanas)
+    return acumulado[:, t] - acumulado[:, np.maximum(t - janela, 0)]
+
+def somas_moveis(matriz, janela):
+    """Soma das `janela` semanas anteriores a t; NaN se faltar alguma delas."""
+    soma, contagem = _acumulados(matriz)
+    total = _janela_anterior(soma, janela)
+    completas = (_janela_anterior(contagem, janela) == janela)
+    return np.where(completas, total, np.nan).astype('float32')
+
+def anomalia(matriz, janela=JANELA_ANOMALIA):
+    """Valor de t-1 menos a média das `janela` semanas anteriores a t (exige metade observada)."""
+    soma, contagem = _acumulados(matriz)
+    n = _janela_anterior(contagem, janela)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(n >= janela // 2, _janela_anterior(soma, janela) / n, np.nan)
+    return (defasagens(matriz, (1,))[..., 0] - media).astype('float32')
+
+def gerar(matrizes, lags=LAGS_CASOS, janelas=JANELAS_PRCP):
+    """Tensor float32 (municípios, semanas, features) para um bloco de municípios.
+
+    `matrizes` tem as matrizes município × semana de casos, tavg, tmin, tmax e prcp.
+    """
+    partes = [defasagens(matrizes['casos'], lags)]
+    partes += [somas_moveis(np.asarray(matrizes['prcp'], dtype='float32'), janela)[..., None] for janela in janelas]
+    partes += [defasagens(matrizes[variavel], (1,)) for variavel in ('tavg', 'tmin', 'tmax')]
+    partes.append(anomalia(np.asarray(matrizes['tavg'], dtype='float32'))[..., None])
+    return np.concatenate(partes, axis=-1).astype('float32', copy=False)
+
+def gerar_em_blocos(matrizes, tamanho_bloco=TAMANHO_BLOCO, saida=None, lags=LAGS_CASOS, janelas=JANELAS_PRCP):
+    """Gera o tensor completo processando `tamanho_bloco` municípios por vez.
+
+    As matrizes podem ser memory-maps (ex.: cubo de treinamento); só o bloco atual
+    é lido. Com `saida` (caminho .npy), o tensor é escrito direto em disco com
+    memory-map, e a memória de pico fica no tamanho dos temporários de um bloco.
+    """
+    n_municipios, n_semanas = matrizes['casos'].shape
+    forma = (n_municipios, n_semanas, len(nomes_features(lags, janelas)))
+    if saida is None:
+        tensor = np.empty(forma, dtype='float32')
+    else:
+        tensor = np.lib.format.open_memmap(saida, mode='w+', dtype='float32', shape=forma)
+    for inicio in range(0, n_municipios, tamanho_bloco):
+        fim = min(inicio + tamanho_bloco, n_municipios)
+        bloco = {nome: np.asarray(matriz[inicio:fim]) for nome, matriz in matrizes.items()}
+        tensor[inicio:fim] = gerar(bloco, lags, janelas)
+    return tensor
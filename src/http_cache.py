@@ -0,0 +1,301 @@
+import os
+import json
+import gzip
+import time
+import codecs
+import hashlib
+import threading
+import requests
+import metricas
+import retentativas
+
+# Camada HTTP compartilhada pelos coletores, com cache em disco endereçado pelo
+# conteúdo da requisição (método, URL e corpo). Cada fonte tem seu TTL; respostas
+# vencidas são revalidadas com If-None-Match/If-Modified-Since quando o servidor
+# fornece ETag/Last-Modified. O corpo fica comprimido com gzip.
+#
+# Modo offline (replay): só serve o que está no cache, sem tocar a rede.
+# Ative com set_offline(True) ou com a variável de ambiente DOP_OFFLINE=1.
+#
+# Falhas transitórias (conexão, timeout, HTTP 429/5xx) são repetidas com espera
+# exponencial e jitter (ver retentativas); toda requisição tem timeout explícito
+# de conexão e de leitura.
+#
+# Com stream=True (respostas grandes, como a série inteira do Ipeadata), o corpo é
+# gravado no cache à medida que chega e a resposta o lê de volta do disco em
+# pedaços: em nenhum momento o corpo inteiro fica em memória.
+
+CACHE_DIR = os.path.join("cache", "http")
+
+# TTL em segundos por fonte
+TTLS = {
+    'tabnet': 6 * 3600,
+    'ibge': 7 * 24 * 3600,
+    'ipea': 7 * 24 * 3600,
+    'default': 24 * 3600,
+}
+
+# Timeout (conexão, leitura) em segundos por fonte; o TabNet demora a montar tabelas grandes
+TIMEOUTS = {
+    'tabnet': (10, 300),
+    'ibge': (10, 60),
+    'ipea': (10, 300),
+    'default': (10, 60),
+}
+
+# Respostas que valem nova tentativa
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+_offline = os.environ.get('DOP_OFFLINE', '') == '1'
+
+class CacheMiss(requests.exceptions.ConnectionError):
+    """Requisição sem resposta em cache no modo offline."""
+
+class CachedResponse:
+    """Resposta mínima compatível com o uso que os coletores fazem de requests.Response."""
+
+    def __init__(self, url, status_code, headers, content, encoding=None, from_cache=False, body_path=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self._content = content
+        self.encoding = encoding
+        self.from_cache = from_cache
+        self.body_path = body_path
+
+    @property
+    def content(self):
+        if self._content is None and self.body_path is not None:
+            with gzip.open(self.body_path, 'rb') as f:
+                self._content = f.read()
+        return self._content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size=65536, decode_unicode=False):
+        """Pedaços do corpo; numa resposta em stream, lidos do arquivo do cache sob demanda."""
+        if self._content is None and self.body_path is not None:
+            pedacos = _read_chunks(self.body_path, chunk_size)
+        else:
+            pedacos = (self._content[inicio:inicio + chunk_size] for inicio in range(0, len(self._content), chunk_size))
+        if not decode_unicode:
+            yield from pedacos
+            return
+        # Decodificador incremental: um caractere multibyte pode ficar dividido entre dois pedaços
+        decoder = codecs.getincrementaldecoder(self.encoding or 'utf-8')(errors='replace')
+        for pedaco in pedacos:
+            texto = decoder.decode(pedaco)
+            if texto:
+                yield texto
+        resto = decoder.decode(b'', final=True)
+        if resto:
+            yield resto
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+def set_offline(offline=True):
+    """Liga/desliga o modo offline (replay só do cache)."""
+    global _offline
+    _offline = offline
+
+def is_offline():
+    return _offline
+
+def cache_key(method, url, data=None):
+    """Chave do cache: sha256 de método, URL e corpo."""
+    corpo = data if isinstance(data, bytes) else (data or '').encode('utf-8')
+    return hashlib.sha256(method.upper().encode() + b'\n' + url.encode('utf-8') + b'\n' + corpo).hexdigest()
+
+def _paths(key, cache_dir):
+    pasta = os.path.join(cache_dir, key[:2])
+    return os.path.join(pasta, f"{key}.json"), os.path.join(pasta, f"{key}.body.gz")
+
+def _read(key, cache_dir, body=True):
+    """(meta, corpo) da entrada do cache; com body=False, o corpo fica no disco (None)."""
+    meta_path, body_path = _paths(key, cache_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None, None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if not body:
+        return meta, None
+    with gzip.open(body_path, 'rb') as f:
+        return meta, f.read()
+
+def _read_chunks(body_path, chunk_size):
+    with gzip.open(body_path, 'rb') as f:
+        while True:
+            pedaco = f.read(chunk_size)
+            if not pedaco:
+                return
+            yield pedaco
+
+def _write_atomic(path, dados, modo='wb'):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, modo) as f:
+        f.write(dados)
+    os.replace(tmp, path)
+
+def _store(key, meta, content, cache_dir):
+    meta_path, body_path = _paths(key, cache_dir)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    _write_atomic(body_path, gzip.compress(content, compresslevel=6))
+    _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+
+def _store_stream(key, meta, response, cache_dir, chunk_size=65536):
+    """Grava o corpo comprimido à medida que é lido da rede; retorna os bytes recebidos."""
+    meta_path, body_path = _paths(key, cache_dir)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    tmp = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    recebidos = 0
+    try:
+        with gzip.open(tmp, 'wb', compresslevel=6) as f:
+            for pedaco in response.iter_content(chunk_size):
+                f.write(pedaco)
+                recebidos += len(pedaco)
+        os.replace(tmp, body_path)
+    finally:
+        response.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+    return recebidos
+
+def _new_meta(url, method, source, response):
+    return {
+        'url': url,
+        'method': method.upper(),
+        'source': source,
+        'status_code': response.status_code,
+        'headers': {k: response.headers[k] for k in ('Content-Type', 'ETag', 'Last-Modified', 'Date')
+                    if k in response.headers},
+        'encoding': response.encoding,
+        'stored_at': time.time(),
+    }
+
+def _from_meta(meta, content, key=None, cache_dir=CACHE_DIR):
+    """Resposta a partir do cache; sem `content`, o corpo é lido do arquivo da entrada `key`."""
+    body_path = _paths(key, cache_dir)[1] if content is None else None
+    return CachedResponse(meta['url'], meta['status_code'], meta['headers'], content,
+                          encoding=meta.get('encoding'), from_cache=True, body_path=body_path)
+
+def request(method, url, data=None, headers=None, source='default', ttl=None,
+            session=None, timeout=None, cache_dir=CACHE_DIR, tentativas=retentativas.TENTATIVAS, stream=False,
+            valido=None):
+    """Faz a requisição passando pelo cache. Retorna um CachedResponse.
+
+    `timeout` é um número ou (conexão, leitura); sem ele, vale o da fonte em TIMEOUTS.
+    Falhas transitórias são tentadas até `tentativas` vezes no total.
+    Com `stream`, uma resposta de sucesso vai direto da rede para o arquivo do cache e
+    iter_content a lê de lá em pedaços.
+    `valido(resposta)`, se informado, rejeita respostas 200 que são na verdade erros
+    (ex.: página de erro do TabNet): elas não entram no cache nem são servidas dele.
+    Não se aplica com `stream`.
+    """
+    timeout = TIMEOUTS.get(source, TIMEOUTS['default']) if timeout is None else timeout
+    with metricas.span('fetch', fonte=source, url=url):
+        metricas.contar('requisicoes')
+        resposta = _request(method, url, data, headers, source, ttl, session, timeout, cache_dir, tentativas,
+                            stream, None if stream else valido)
+        if resposta.from_cache:
+            metricas.contar('cache_acertos')
+        if not resposta.ok:
+            metricas.contar('erros')
+        return resposta
+
+def _retry_after(response):
+    """Segundos pedidos pelo servidor em Retry-After (só a forma numérica), ou 0."""
+    valor = response.headers.get('Retry-After', '')
+    return min(float(valor), retentativas.ESPERA_MAXIMA) if valor.isdigit() else 0.0
+
+def _send(http, method, url, data, headers, timeout, tentativas, stream=False):
+    """Envia a requisição repetindo falhas de rede e respostas transitórias.
+
+    Na última tentativa, a exceção é propagada ou a resposta transitória é devolvida.
+    """
+    for tentativa in range(tentativas):
+        ultima = tentativa == tentativas - 1
+        try:
+            response = http.request(method, url, data=data, headers=headers, timeout=timeout, stream=stream)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if ultima:
+                raise
+            retentativas.aguardar(tentativa, f"{type(e).__name__} em {url}")
+            continue
+        if response.status_code not in STATUS_TRANSITORIOS or ultima:
+            return response
+        response.close()
+        retentativas.aguardar(tentativa, f"HTTP {response.status_code} em {url}", minimo=_retry_after(response))
+
+def _request(method, url, data, headers, source, ttl, session, timeout, cache_dir, tentativas, stream=False,
+             valido=None):
+    ttl = TTLS.get(source, TTLS['default']) if ttl is None else ttl
+    key = cache_key(method, url, data)
+    meta, content = _read(key, cache_dir, body=not stream)
+    if meta is not None and not _offline and valido is not None and not valido(_from_meta(meta, content)):
+        # Entrada inválida: nem serve nem revalida (um 304 devolveria o mesmo corpo)
+        meta, content = None, None
+
+    if meta is not None and time.time() - meta['stored_at'] < ttl:
+        return _from_meta(meta, content, key, cache_dir)
+
+    if _offline:
+        if meta is not None:
+            # No replay, uma cópia vencida ainda é melhor que nenhuma
+            return _from_meta(meta, content, key, cache_dir)
+        raise CacheMiss(f"Sem resposta em cache para {method} {url} (modo offline).")
+
+    headers = dict(headers or {})
+    if meta is not None:
+        if meta['headers'].get('ETag'):
+            headers['If-None-Match'] = meta['headers']['ETag']
+        if meta['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+
+    http = session if session is not None else requests
+    response = _send(http, method, url, data, headers, timeout, max(1, tentativas), stream)
+
+    if response.status_code == 304 and meta is not None:
+        # Revalidado: o corpo guardado continua válido (só os metadados são regravados)
+        response.close()
+        meta['stored_at'] = time.time()
+        _write_atomic(_paths(key, cache_dir)[0], json.dumps(meta).encode('utf-8'))
+        return _from_meta(meta, content, key, cache_dir)
+
+    if response.ok and stream:
+        meta = _new_meta(url, method, source, response)
+        metricas.contar('bytes_recebidos', _store_stream(key, meta, response, cache_dir))
+        return _from_meta(meta, None, key, cache_dir)
+
+    metricas.contar('bytes_recebidos', len(response.content))
+    resultado = CachedResponse(url, response.status_code, dict(response.headers), response.content,
+                               encoding=response.encoding)
+    if response.ok and (valido is None or valido(resultado)):
+        _store(key, _new_meta(url, method, source, response), response.content, cache_dir)
+    return resultado
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
@@ -1,94 +1,158 @@
 import requests
-import pandas as pd
-import unicodedata
 import warnings
 import os
-import re
+import argparse
+import hashlib
+import threading
 from datetime import datetime
+import http_cache
+import localidades
+import metricas
+import diario
+from normalizacao import normalize_text, normalize_series
+from localidades import get_state_code
 
-# Ignorar warnings
-warnings.filterwarnings("ignore", category=UserWarning)
-
-def normalize_text(text):
-    """Normaliza texto para remover acentos e espaços."""
-    if isinstance(text, str):
-        return unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII').replace(' ', '_')
-    return text
-
-def get_state_code(state_input):
-    """Retorna o código da UF com base no nome ou sigla do estado."""
-    state_dict = {
-        'AC': ('Acre', '12'), 'AL': ('Alagoas', '27'), 'AP': ('Amapá', '16'), 'AM': ('Amazonas', '13'),
-        'BA': ('Bahia', '29'), 'CE': ('Ceará', '23'), 'DF': ('Distrito Federal', '53'), 'ES': ('Espírito Santo', '32'),
-        'GO': ('Goiás', '52'), 'MA': ('Maranhão', '21'), 'MT': ('Mato Grosso', '51'), 'MS': ('Mato Grosso do Sul', '50'),
-        'MG': ('Minas Gerais', '31'), 'PA': ('Pará', '15'), 'PB': ('Paraíba', '25'), 'PR': ('Paraná', '41'),
-        'PE': ('Pernambuco', '26'), 'PI': ('Piauí', '22'), 'RJ': ('Rio de Janeiro', '33'), 'RN': ('Rio Grande do Norte', '24'),
-        'RS': ('Rio Grande do Sul', '43'), 'RO': ('Rondônia', '11'), 'RR': ('Roraima', '14'), 'SC': ('Santa Catarina', '42'),
-        'SP': ('São Paulo', '35'), 'SE': ('Sergipe', '28'), 'TO': ('Tocantins', '17')
-    }
-    
-    state_input = state_input.strip().title()
-    if state_input in [v[0] for v in state_dict.values()]:
-        for sigla, (nome, codigo) in state_dict.items():
-            if state_input == nome:
-                return sigla, nome, codigo
-    elif state_input.upper() in state_dict:
-        sigla = state_input.upper()
-        return sigla, state_dict[sigla][0], state_dict[sigla][1]
-    else:
-        raise ValueError("Estado não encontrado. Use nome completo ou sigla (ex.: 'PE' ou 'Pernambuco').")
+# pandas e numpy são importados dentro das funções que os usam: importar o módulo
+# (ex.: só para URL_SIDRA_POPULACAO ou collect_year a partir do pipeline) fica barato.
+
+URL_SIDRA_POPULACAO = ("https://servicodados.ibge.gov.br/api/v3/agregados/6579/periodos/{periodos}"
+                       "/variaveis/9324?localidades={localidades}")
+API_YEARS = ['2021', '2024']
+TABLE_CACHE_DIR = os.path.join("cache", "populacao")
+
+# Tabelas nacionais já carregadas neste processo: (caminho, hash) -> (tabela, intervalos por UF)
+_national_tables = {}
+# Hash dos CSVs já lidos neste processo: (caminho, mtime, tamanho) -> sha256
+_file_hashes = {}
+# Tabela nacional da API já separada por UF neste processo: anos -> {sigla: DataFrame}
+_api_by_state = {}
+_api_lock = threading.Lock()
 
 def get_municipios_codes(state_input):
-    """Obter códigos e nomes de municípios para um estado via API do IBGE."""
+    """Obter códigos e nomes de municípios para um estado a partir do registro de localidades."""
+    import pandas as pd
+
     sigla, state_name, state_code = get_state_code(state_input)
-    url = f"https://servicodados.ibge.gov.br/api/v1/localidades/estados/{state_code}/municipios"
     
     print(f"\nObtendo códigos de municípios para {state_name}...")
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        municipios = []
-        for item in data:
-            codigo = str(item['id'])
-            nome = normalize_text(item['nome'])
-            municipios.append({'TERCODIGO': codigo, 'Municipio': nome})
-        
-        df_municipios = pd.DataFrame(municipios)
-        return df_municipios
+        municipios = [
+            {'TERCODIGO': str(codigo), 'Municipio': normalize_text(nome, underscore=True)}
+            for codigo, nome in localidades.municipios_do_estado(sigla)
+        ]
+        return pd.DataFrame(municipios)
     
     except requests.exceptions.RequestException as e:
         print(f"Erro na requisição de códigos de municípios: {e}")
         return None
 
-def collect_from_api(state_input, year):
-    """Coletar dados de população via API do IBGE."""
+def fetch_population_api(years, state_code=None):
+    """Baixar a população estimada de vários anos em uma única requisição à API do IBGE.
+
+    Com `state_code`, o filtro de municípios da UF é feito no servidor (N6[N3[UF]]);
+    sem ele, vem a tabela nacional (N6[all]). Retorna um DataFrame tipado com
+    TERCODIGO (int32), Ano (int16), Populacao (Int64, nulo quando não divulgado)
+    e Municipio (categórico, nome como veio da API).
+    """
+    periodos = '|'.join(str(year) for year in years)
+    escopo = f"N6[N3[{state_code}]]" if state_code else "N6[all]"
+    url = URL_SIDRA_POPULACAO.format(periodos=periodos, localidades=escopo)
+    
+    response = http_cache.get(url, source='ibge', timeout=60)
+    response.raise_for_status()
+    with metricas.span('parse', fonte='ibge'):
+        return parse_population_json(response.json(), years)
+
+def parse_population_json(data, years):
+    """Converter a resposta da API de agregados do IBGE no DataFrame tipado de fetch_population_api."""
+    import pandas as pd
+
+    if not data or not data[0].get('resultados'):
+        raise ValueError(f"Resultados vazios para {'|'.join(str(year) for year in years)} na API.")
+    
+    codigos, anos, populacoes, nomes = [], [], [], []
+    for item in data[0]['resultados'][0]['series']:
+        codigo = int(item['localidade']['id'])
+        nome = item['localidade']['nome'].split(' - ')[0]
+        for year in years:
+            valor = item['serie'].get(str(year))
+            codigos.append(codigo)
+            nomes.append(nome)
+            anos.append(int(year))
+            # Valores não divulgados vêm como '-' ou '...'
+            populacoes.append(int(valor) if valor and valor.isdigit() else None)
+    
+    return pd.DataFrame({
+        'TERCODIGO': pd.array(codigos, dtype='int32'),
+        'Ano': pd.array(anos, dtype='int16'),
+        'Populacao': pd.array(populacoes, dtype='Int64'),
+        'Municipio': pd.Categorical(nomes),
+    })
+
+def fetch_population_api_all_states(years):
+    """Baixar a tabela nacional uma única vez e separá-la por UF localmente.
+
+    O resultado fica em memória por conjunto de anos: vários estados (ou threads
+    do pipeline) pedindo os mesmos anos fazem uma única requisição.
+    """
+    chave = tuple(str(year) for year in years)
+    with _api_lock:
+        if chave not in _api_by_state:
+            df = fetch_population_api(years)
+            codigo_uf = df['TERCODIGO'] // 100000
+            _api_by_state[chave] = {
+                localidades.SIGLA_POR_CODIGO[int(codigo)]: grupo.reset_index(drop=True)
+                for codigo, grupo in df.groupby(codigo_uf)
+                if int(codigo) in localidades.SIGLA_POR_CODIGO
+            }
+        return _api_by_state[chave]
+
+def population_api_by_state(states, years):
+    """Recortes da API por UF ({sigla: DataFrame}) quando mais de um estado é pedido.
+
+    Com mais de uma UF, vem da tabela nacional (uma requisição, separada localmente);
+    com uma só, ou se a requisição nacional falhar, devolve {} e cada UF consulta a sua.
+    """
+    api_years = [year for year in years if str(year) not in ('2022', '2023')]
+    if len(states) < 2 or not api_years:
+        return {}
+    try:
+        with metricas.contexto(fonte='ibge'):
+            nacional = fetch_population_api_all_states(api_years)
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"Erro ao consultar a tabela nacional do IBGE ({e}); consultando por UF.")
+        return {}
+    return {sigla: nacional[sigla] for sigla in states if sigla in nacional}
+
+def collect_from_api(state_input, year, populacao_api=None):
+    """Coletar dados de população via API do IBGE.
+
+    Se `populacao_api` (saída de fetch_population_api com vários anos) for informado,
+    apenas recorta o ano, sem nova requisição.
+    """
+    import pandas as pd
+
     sigla, state_name, state_code = get_state_code(state_input)
-    url = f"https://servicodados.ibge.gov.br/api/v3/agregados/6579/periodos/{year}/variaveis/9324?localidades=N6[all]"
     
     print(f"\nColetando dados de população para {state_name} em {year} via API...")
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        
-        if not data or not data[0].get('resultados'):
-            raise ValueError(f"Resultados vazios para {year} na API.")
+        if populacao_api is None:
+            populacao_api = fetch_population_api([year], state_code)
         
-        resultados = []
-        for item in data[0]['resultados'][0]['series']:
-            codigo = str(item['localidade']['id'])
-            municipio = normalize_text(item['localidade']['nome'].split(' - ')[0])
-            populacao = int(item['serie'][year])
-            resultados.append({'TERCODIGO': codigo, 'Municipio': municipio, 'Populacao': populacao})
+        df = populacao_api[
+            (populacao_api['Ano'] == int(year)) & (populacao_api['TERCODIGO'] // 100000 == int(state_code))
+        ]
         
-        df = pd.DataFrame(resultados)
-        df_state = df[df['TERCODIGO'].str.startswith(state_code)]
-        
-        if df_state.empty:
+        if df.empty:
             raise ValueError(f"Nenhum dado encontrado para {state_name} em {year}.")
         
+        with metricas.span('transform'):
+            df_state = pd.DataFrame({
+                'TERCODIGO': df['TERCODIGO'].astype(str).to_numpy(),
+                'Municipio': normalize_series(df['Municipio'].astype(str), underscore=True).to_numpy(),
+                'Populacao': df['Populacao'].fillna(0).astype(int).to_numpy(),
+            })
+        
         print(f"Encontrados {len(df_state)} municípios para {state_name} em {year}.")
         return df_state
     
@@ -99,36 +163,130 @@ def collect_from_api(state_input, year):
         print(f"Erro ao processar dados para {year}: {e}")
         return None
 
+def file_sha256(file_path):
+    """Hash do arquivo de origem, usado para invalidar o cache binário.
+
+    Calculado uma vez por (caminho, mtime, tamanho) no processo: as consultas por
+    UF seguintes não relêem o CSV inteiro.
+    """
+    info = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), info.st_mtime_ns, info.st_size)
+    if memo_key not in _file_hashes:
+        _file_hashes[memo_key] = _sha256(file_path)
+    return _file_hashes[memo_key]
+
+def _sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+def _parse_tabela2022(file_path):
+    import pandas as pd
+
+    # Ler CSV, ignorando linhas de cabeçalho irrelevantes
+    df = pd.read_csv(file_path, sep=';', encoding='utf-8', skiprows=5, dtype=str)
+    
+    # Renomear colunas
+    df.columns = ['Municipio', 'Forma_Declaracao', 'Populacao']
+    
+    # Filtrar linhas onde Forma_Declaracao é "Total"
+    df = df[df['Forma_Declaracao'].str.strip() == 'Total']
+    
+    # Separar nome e UF de "Nome (UF)" de uma vez para a tabela inteira
+    partes = df['Municipio'].str.extract(r'^\s*(?P<Nome>.*?)\s*\((?P<UF>[A-Z]{2})\)\s*$')
+    return pd.DataFrame({
+        'UF': partes['UF'],
+        'Municipio_Norm': normalize_series(partes['Nome'], underscore=True),
+        'Populacao': pd.to_numeric(df['Populacao'], errors='coerce').fillna(0).astype('int64'),
+    })
+
+def _parse_tabela2023(file_path):
+    import pandas as pd
+
+    # Ler CSV, pulando a linha de título
+    df = pd.read_csv(file_path, encoding='utf-8', skiprows=1, dtype=str)
+    
+    # Verificar número de colunas
+    if len(df.columns) != 3:
+        raise ValueError(f"Formato inesperado em {file_path}. Esperado 3 colunas, encontrado {len(df.columns)}.")
+    
+    df.columns = ['UF', 'Municipio', 'Populacao']
+    return pd.DataFrame({
+        'UF': df['UF'].str.strip().str.strip('()'),  # Remover parênteses (ex.: (RO) -> RO)
+        'Municipio_Norm': normalize_series(df['Municipio'].str.strip(), underscore=True),
+        # Limpar população (remover vírgulas, espaços)
+        'Populacao': pd.to_numeric(df['Populacao'].str.replace(',', '', regex=False).str.strip(),
+                                   errors='coerce').fillna(0).astype('int64'),
+    })
+
+def load_national_table(file_path, parser, cache_dir=TABLE_CACHE_DIR):
+    """Tabela nacional tipada e ordenada por UF, lida uma única vez.
+
+    O resultado é guardado em Parquet, com o hash do CSV no nome do arquivo: se o
+    CSV mudar, o cache antigo deixa de ser usado. Dentro do processo, a tabela e os
+    intervalos de cada UF ficam em memória.
+    """
+    import numpy as np
+    import pandas as pd
+
+    file_hash = file_sha256(file_path)
+    memo_key = (os.path.abspath(file_path), file_hash)
+    if memo_key in _national_tables:
+        return _national_tables[memo_key]
+    
+    cache_file = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(file_path))[0]}_{file_hash[:16]}.parquet")
+    if os.path.exists(cache_file):
+        table = pd.read_parquet(cache_file)
+    else:
+        with metricas.span('parse'):
+            table = parser(file_path)
+        table = table.dropna(subset=['UF']).sort_values('UF', kind='stable').reset_index(drop=True)
+        table['UF'] = table['UF'].astype('category')
+        os.makedirs(cache_dir, exist_ok=True)
+        table.to_parquet(cache_file, index=False)
+    
+    # Intervalo [início, fim) de cada UF na tabela ordenada
+    ufs = table['UF'].astype(str).to_numpy()
+    inicios = np.flatnonzero(np.r_[True, ufs[1:] != ufs[:-1]])
+    fins = np.r_[inicios[1:], len(ufs)]
+    offsets = {ufs[i]: (i, f) for i, f in zip(inicios, fins)}
+    
+    _national_tables[memo_key] = (table, offsets)
+    return table, offsets
+
+def state_slice(file_path, parser, sigla):
+    """Linhas de uma UF na tabela nacional (fatia direta pelos intervalos pré-calculados)."""
+    table, offsets = load_national_table(file_path, parser)
+    if sigla not in offsets:
+        return None
+    inicio, fim = offsets[sigla]
+    return table.iloc[inicio:fim]
+
+def assign_codes(df, name_column, sigla):
+    """Acrescentar TERCODIGO (str) casando os nomes com o registro de localidades."""
+    with metricas.span('transform'):
+        codigos, estatisticas = localidades.casar_municipios(df[name_column], sigla)
+    print(f"Correspondência de nomes ({sigla}): {localidades.resumo_correspondencia(estatisticas)}")
+    df = df.copy()
+    df['TERCODIGO'] = codigos.astype('string')
+    return df
+
 def process_2022_csv(state_input, file_path="tabela2022.csv"):
     """Processar tabela2022.csv (Censo 2022)."""
     sigla, state_name, state_code = get_state_code(state_input)
     
     print(f"\nProcessando dados de população para {state_name} em 2022 via {file_path}...")
     try:
-        # Ler CSV, ignorando linhas de cabeçalho irrelevantes
-        df = pd.read_csv(file_path, sep=';', encoding='utf-8', skiprows=5)
-        
-        # Renomear colunas
-        df.columns = ['Municipio', 'Forma_Declaracao', 'Populacao']
-        
-        # Filtrar linhas onde Forma_Declaracao é "Total"
-        df = df[df['Forma_Declaracao'].str.strip() == 'Total']
-        
-        # Limpar nome do município (remover UF)
-        df['Municipio_Norm'] = df['Municipio'].apply(lambda x: re.sub(r'\s*\(.*\)', '', x).strip())
-        df['Municipio_Norm'] = df['Municipio_Norm'].apply(normalize_text)
-        df['Populacao'] = pd.to_numeric(df['Populacao'], errors='coerce').fillna(0).astype(int)
-        
-        # Filtrar por estado usando a UF no nome original
-        df = df[df['Municipio'].str.contains(f'\({sigla}\)', na=False)]
-        
-        # Obter códigos de municípios
-        df_municipios = get_municipios_codes(state_input)
-        if df_municipios is None:
-            raise ValueError("Não foi possível obter códigos de municípios para mapear TERCODIGO.")
+        # Recorte da UF na tabela nacional (lida e tipada uma única vez)
+        df = state_slice(file_path, _parse_tabela2022, sigla)
+        if df is None:
+            print(f"Nenhum município de {state_name} encontrado em tabela2022.csv.")
+            return None
         
-        # Mapear TERCODIGO com base no nome normalizado
-        df = df.merge(df_municipios, left_on='Municipio_Norm', right_on='Municipio', how='left')
+        # Mapear TERCODIGO pelo índice (UF, nome normalizado), com busca aproximada para o resíduo
+        df = assign_codes(df, 'Municipio_Norm', sigla)
         
         # Verificar se há correspondências
         if df['TERCODIGO'].isna().all():
@@ -154,41 +312,14 @@ def process_2023_csv(state_input, file_path="tabela2023.csv"):
     
     print(f"\nProcessando dados de população para {state_name} em 2023 via {file_path}...")
     try:
-        # Ler CSV, pulando a linha de título
-        df = pd.read_csv(file_path, encoding='utf-8', skiprows=1)
-        
-        # Verificar número de colunas
-        if len(df.columns) != 3:
-            raise ValueError(f"Formato inesperado em {file_path}. Esperado 3 colunas, encontrado {len(df.columns)}.")
-        
-        # Renomear colunas
-        df.columns = ['UF', 'Municipio', 'Populacao']
-        
-        # Debug: Exibir colunas e UFs disponíveis
-        print(f"Colunas lidas em {file_path}: {list(df.columns)}")
-        df['UF'] = df['UF'].str.strip('()')  # Remover parênteses (ex.: (RO) -> RO)
-        unique_ufs = df['UF'].unique()
-        print(f"UF disponíveis em {file_path}: {unique_ufs}")
-        if sigla not in unique_ufs:
+        # Recorte da UF na tabela nacional (lida e tipada uma única vez)
+        df = state_slice(file_path, _parse_tabela2023, sigla)
+        if df is None:
             raise ValueError(f"Estado {state_name} (UF={sigla}) não encontrado em {file_path}.")
+        df = df.rename(columns={'Municipio_Norm': 'Municipio'})
         
-        # Limpar população (remover vírgulas, espaços)
-        df['Populacao'] = df['Populacao'].str.replace(r'[,]', '', regex=True).str.strip()
-        df['Populacao'] = pd.to_numeric(df['Populacao'], errors='coerce').fillna(0).astype(int)
-        
-        # Normalizar nome do município
-        df['Municipio'] = df['Municipio'].apply(normalize_text)
-        
-        # Filtrar por estado
-        df = df[df['UF'] == sigla]
-        
-        # Obter códigos de município
-        df_municipios = get_municipios_codes(state_input)
-        if df_municipios is None:
-            raise ValueError("Não foi possível obter códigos de municípios para mapear TERCODIGO.")
-        
-        # Mapear TERCODIGO com base no nome normalizado
-        df = df.merge(df_municipios, on='Municipio', how='left')
+        # Mapear TERCODIGO pelo índice (UF, nome normalizado), com busca aproximada para o resíduo
+        df = assign_codes(df, 'Municipio', sigla)
         
         # Verificar correspondências
         if df['TERCODIGO'].isna().all():
@@ -208,6 +339,25 @@ def process_2023_csv(state_input, file_path="tabela2023.csv"):
         print(f"Erro ao processar tabela2023.csv: {e}")
         return None
 
+def collect_year(state_input, year, populacao_api=None):
+    """População de um ano: 2022 e 2023 das tabelas locais, os demais da API."""
+    fonte = f'tabela{year}' if str(year) in ('2022', '2023') else 'ibge'
+    with metricas.contexto(fonte=fonte, uf=get_state_code(state_input)[0], ano=int(year)):
+        if str(year) == '2022':
+            df_state = process_2022_csv(state_input)
+        elif str(year) == '2023':
+            df_state = process_2023_csv(state_input)
+        else:
+            df_state = collect_from_api(state_input, str(year), populacao_api)
+        if df_state is None:
+            metricas.contar('erros')
+        else:
+            metricas.contar('linhas', len(df_state))
+        return df_state
+
+def output_file_name(state_name, year, output_dir):
+    return os.path.join(output_dir, f"populacao_{state_name}_{year}.csv")
+
 def save_to_csv(df_state, state_name, year, output_dir):
     """Salvar dados em um único CSV por ano dentro da pasta especificada."""
     if df_state is None or df_state.empty:
@@ -217,8 +367,9 @@ def save_to_csv(df_state, state_name, year, output_dir):
     os.makedirs(output_dir, exist_ok=True)
     
     # Criar DataFrame com todos os municípios
-    output_file = os.path.join(output_dir, f"populacao_{state_name}_{year}.csv")
-    df_state.to_csv(output_file, columns=['TERCODIGO', 'Municipio', 'Populacao'], index=False, encoding='utf-8-sig')
+    output_file = output_file_name(state_name, year, output_dir)
+    with metricas.span('write', ano=int(year)):
+        df_state.to_csv(output_file, columns=['TERCODIGO', 'Municipio', 'Populacao'], index=False, encoding='utf-8-sig')
     
     print(f"\nArquivo gerado: {output_file}")
     print(f"Total de registros para {year}: {len(df_state)}")
@@ -226,24 +377,37 @@ def save_to_csv(df_state, state_name, year, output_dir):
     print(df_state[['TERCODIGO', 'Municipio', 'Populacao']].head(5))
     return len(df_state)
 
-def main():
-    # Solicitar entrada
-    state_input = input("Digite o estado (ex.: 'PE' ou 'Pernambuco'): ")
-    years = ['2021', '2022', '2023', '2024']
+def collect_and_save(state_input, years, diario_execucao=None, populacao_api=None):
+    """Coletar todos os anos de um estado e salvar um CSV por ano em uma pasta nova.
+
+    Cada ano é uma unidade do `diario_execucao` (('ibge', uf, ano)): os já gravados numa
+    execução anterior são pulados e continuam valendo os arquivos de antes.
+    `populacao_api` é o recorte da UF já baixado (ver population_api_by_state);
+    sem ele, os anos da API vêm em uma requisição restrita à UF.
+    Retorna a lista de CSVs do estado (os novos e os retomados).
+    """
+    sigla, state_name, state_code = get_state_code(state_input)
+    arquivos = []
+    if diario_execucao is not None:
+        feitos = [year for year in years if diario_execucao.concluida('ibge', sigla, year)]
+        for year in feitos:
+            arquivos.extend(diario_execucao.artefatos('ibge', sigla, year))
+        if feitos:
+            print(f"Retomando {sigla}: anos já gravados serão pulados: {', '.join(feitos)}")
+        years = [year for year in years if year not in feitos]
+    if not years:
+        return arquivos
     
-    # Verificar arquivos locais
-    for file in ['tabela2022.csv', 'tabela2023.csv']:
-        if not os.path.exists(file):
-            print(f"Arquivo {file} não encontrado na pasta atual.")
-            return
+    # Anos da API em uma única requisição, já restrita à UF
+    api_years = [year for year in years if year not in ('2022', '2023')]
+    if api_years and populacao_api is None:
+        try:
+            with metricas.contexto(fonte='ibge', uf=sigla):
+                populacao_api = fetch_population_api(api_years, state_code)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"Erro ao consultar a API do IBGE para {api_years}: {e}")
     
     # Criar pasta de saída com timestamp
-    try:
-        _, state_name, _ = get_state_code(state_input)
-    except ValueError as e:
-        print(f"Erro: {e}")
-        return
-    
     timestamp = datetime.now().strftime("%Y%m%d_%H%M")
     output_dir = f"populacao_{state_name.replace(' ', '_').replace('Í', 'I').replace('Á', 'A')}_{timestamp}"
     
@@ -251,13 +415,7 @@ def main():
     
     # Processar cada ano
     for year in years:
-        df_state = None
-        if year == '2022':
-            df_state = process_2022_csv(state_input)
-        elif year == '2023':
-            df_state = process_2023_csv(state_input)
-        else:
-            df_state = collect_from_api(state_input, year)
+        df_state = collect_year(state_input, year, populacao_api)
         
         # Validação e salvamento
         if df_state is not None and not df_state.empty:
@@ -265,9 +423,52 @@ def main():
                 print(f"Dados válidos para {year}.")
             else:
                 print(f"Aviso: Alguns valores de população inválidos (<= 0) para {year}.")
-            save_to_csv(df_state, state_name.replace(' ', '_').replace('Í', 'I'), year, output_dir)
+            nome = state_name.replace(' ', '_').replace('Í', 'I')
+            with metricas.contexto(uf=sigla):
+                save_to_csv(df_state, nome, year, output_dir)
+            arquivos.append(output_file_name(nome, year, output_dir))
+            if diario_execucao is not None:
+                diario_execucao.registrar(('ibge', sigla, year), 'ok', artefatos=[arquivos[-1]], linhas=len(df_state))
         else:
             print(f"Erro: Falha ao coletar dados para {year}. Verifique os dados de entrada ou a API.")
+            if diario_execucao is not None:
+                diario_execucao.registrar(('ibge', sigla, year), 'falhou')
+    return arquivos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="População dos municípios de cada UF (IBGE e tabelas locais).")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano-inicio', type=int, default=2021)
+    parser.add_argument('--ano-fim', type=int, default=2024)
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help="pula os estados/anos já gravados na última execução")
+    args = parser.parse_args(argv)
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+    years = [str(year) for year in range(args.ano_inicio, args.ano_fim + 1)]
+    
+    # Verificar arquivos locais (2022 e 2023 vêm das tabelas do repositório)
+    for year in ('2022', '2023'):
+        if year in years and not os.path.exists(f"tabela{year}.csv"):
+            print(f"Arquivo tabela{year}.csv não encontrado na pasta atual.")
+            return
+    
+    # Ignorar warnings
+    warnings.filterwarnings("ignore", category=UserWarning)
+    
+    metricas.iniciar('populacao')
+    diario_execucao = diario.Diario('populacao', retomar=args.retomar)
+    try:
+        # Mais de uma UF: a API é consultada uma vez para o país inteiro
+        populacao_api = population_api_by_state(estados, years)
+        for sigla in estados:
+            collect_and_save(sigla, years, diario_execucao, populacao_api.get(sigla))
+    finally:
+        diario_execucao.fechar()
+        metricas.encerrar()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
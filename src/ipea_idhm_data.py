@@ -1,131 +1,194 @@
+import os
+import json
+import argparse
+from array import array
+from urllib.parse import quote
 import requests
-import pandas as pd
-import unicodedata
-
-def normalize_text(text):
-    """Normaliza texto para remover problemas de codificação."""
-    if isinstance(text, str):
-        return unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
-    return text
-
-def get_state_code(state_input):
-    """Retorna o código da UF com base no nome ou sigla do estado."""
-    state_dict = {
-        'AC': ('Acre', '12'), 'AL': ('Alagoas', '27'), 'AP': ('Amapá', '16'), 'AM': ('Amazonas', '13'),
-        'BA': ('Bahia', '29'), 'CE': ('Ceará', '23'), 'DF': ('Distrito Federal', '53'), 'ES': ('Espírito Santo', '32'),
-        'GO': ('Goiás', '52'), 'MA': ('Maranhão', '21'), 'MT': ('Mato Grosso', '51'), 'MS': ('Mato Grosso do Sul', '50'),
-        'MG': ('Minas Gerais', '31'), 'PA': ('Pará', '15'), 'PB': ('Paraíba', '25'), 'PR': ('Paraná', '41'),
-        'PE': ('Pernambuco', '26'), 'PI': ('Piauí', '22'), 'RJ': ('Rio de Janeiro', '33'), 'RN': ('Rio Grande do Norte', '24'),
-        'RS': ('Rio Grande do Sul', '43'), 'RO': ('Rondônia', '11'), 'RR': ('Roraima', '14'), 'SC': ('Santa Catarina', '42'),
-        'SP': ('São Paulo', '35'), 'SE': ('Sergipe', '28'), 'TO': ('Tocantins', '17')
-    }
+import http_cache
+import localidades
+import metricas
+import diario
+from localidades import get_state_code
+from normalizacao import normalize_text
+
+URL_ODATA = "http://www.ipeadata.gov.br/api/odata4"
+METADATA_CACHE = os.path.join("cache", "ipea_metadados_IDHM.json")
+QUOTE_SAFE = "'(),"
+
+def get_municipio_nome(tercodigo):
+    """Obtém o nome do município a partir do TERCODIGO usando o registro de localidades do IBGE."""
+    try:
+        nome = localidades.nome_municipio(tercodigo)
+    except requests.exceptions.RequestException as e:
+        print(f"Erro ao acessar API do IBGE: {e}")
+        return "Erro ao obter nome"
+    return normalize_text(nome) if nome else "Desconhecido"
+
+def check_idhm_series(cache_file=METADATA_CACHE):
+    """Confirma que a série IDHM existe no Ipeadata, consultando só o seu metadado (com cache em disco)."""
+    if os.path.exists(cache_file):
+        with open(cache_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    response = http_cache.get(f"{URL_ODATA}/Metadados('IDHM')?$select=SERCODIGO,SERNOME", source='ipea', timeout=60)
+    if response.status_code == 404:
+        raise ValueError("Série IDHM não encontrada nos metadados.")
+    response.raise_for_status()
+    metadata = response.json()
+    series = metadata.get('value', [metadata])
+    if not series or series[0].get('SERCODIGO') != 'IDHM':
+        raise ValueError("Série IDHM não encontrada nos metadados.")
+
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump(series[0], f, ensure_ascii=False)
+    return series[0]
+
+def iter_odata_values(chunks):
+    """Decodifica incrementalmente os objetos do array "value" de uma resposta OData.
+
+    Recebe pedaços de texto (ex.: response.iter_content(decode_unicode=True)) e produz
+    um dicionário por registro, sem materializar a resposta inteira.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_array = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = 0
+        if not in_array:
+            key = buffer.find('"value"')
+            bracket = buffer.find('[', key) if key >= 0 else -1
+            if bracket < 0:
+                continue
+            pos = bracket + 1
+            in_array = True
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                obj, pos_fim = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Objeto ainda incompleto: espera o próximo pedaço
+                break
+            yield obj
+            pos = pos_fim
+        buffer = buffer[pos:]
+
+def fetch_idhm_values(state_code, year=2010, level='Municípios'):
+    """Baixa só os valores de IDHM do nível, ano e UF pedidos (filtros no próprio OData).
+
+    Retorna colunas tipadas (TERCODIGO como str, IDHM como float64).
+    """
+    with http_cache.get(idhm_url(state_code, year, level), source='ipea', timeout=120, stream=True) as response:
+        response.raise_for_status()
+        response.encoding = response.encoding or 'utf-8'
+        with metricas.span('parse'):
+            columns = parse_idhm_values(response.iter_content(chunk_size=65536, decode_unicode=True))
+    metricas.contar('linhas', len(columns['TERCODIGO']))
+    return columns
+
+def idhm_url(state_code, year=2010, level='Municípios'):
+    """URL OData com filtro de nível, ano e UF e só as colunas usadas."""
+    filtro = f"NIVNOME eq '{level}' and year(VALDATA) eq {int(year)} and startswith(TERCODIGO,'{state_code}')"
+    return (f"{URL_ODATA}/ValoresSerie(SERCODIGO='IDHM')"
+            f"?$filter={quote(filtro, safe=QUOTE_SAFE)}&$select=TERCODIGO,VALVALOR")
+
+def parse_idhm_values(chunks):
+    """Colunas TERCODIGO/IDHM a partir dos pedaços de texto da resposta filtrada."""
+    codigos = []
+    valores = array('d')
+    for item in iter_odata_values(chunks):
+        codigos.append(item['TERCODIGO'])
+        valores.append(float(item['VALVALOR']))
+    return {'TERCODIGO': codigos, 'IDHM': valores}
+
+def fetch_idhm_values_unfiltered(state_code, year=2010, level='Municípios'):
+    """Caminho antigo: baixa a série inteira e filtra localmente (usado se o servidor recusar o filtro)."""
+    codigos = []
+    valores = array('d')
+    with http_cache.get(f"{URL_ODATA}/ValoresSerie(SERCODIGO='IDHM')", source='ipea', timeout=300,
+                        stream=True) as response:
+        response.raise_for_status()
+        response.encoding = response.encoding or 'utf-8'
+        with metricas.span('parse'):
+            for item in iter_odata_values(response.iter_content(chunk_size=65536, decode_unicode=True)):
+                if (item['NIVNOME'] == level and item['VALDATA'][:4] == str(year)
+                        and item['TERCODIGO'].startswith(state_code)):
+                    codigos.append(item['TERCODIGO'])
+                    valores.append(float(item['VALVALOR']))
+    metricas.contar('linhas', len(codigos))
+    return {'TERCODIGO': codigos, 'IDHM': valores}
+
+def fetch_idhm_state(state_code, year=2010):
+    """Valores de IDHM dos municípios da UF, com filtro no servidor e, se recusado, local."""
+    try:
+        return fetch_idhm_values(state_code, year)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 400:
+            raise
+        print(f"Filtro OData recusado pelo servidor ({e}); filtrando localmente.")
+        return fetch_idhm_values_unfiltered(state_code, year)
+
+def build_idhm_frame(columns, year=2010):
+    """Tabela Municipio/IDHM_<ano> ordenada por município a partir das colunas baixadas."""
+    import pandas as pd
+
+    df_state = pd.DataFrame({
+        'TERCODIGO': pd.Series(columns['TERCODIGO'], dtype='string'),
+        'IDHM': pd.Series(columns['IDHM'], dtype='float64'),
+    })
+    
+    # Mapear TERCODIGO para nomes de municípios
+    df_state['Municipio'] = df_state['TERCODIGO'].map(get_municipio_nome)
     
-    state_input = state_input.strip().title()
-    if state_input in [v[0] for v in state_dict.values()]:
-        for sigla, (nome, codigo) in state_dict.items():
-            if state_input == nome:
-                return sigla, nome, codigo
-    elif state_input.upper() in state_dict:
-        sigla = state_input.upper()
-        return sigla, state_dict[sigla][0], state_dict[sigla][1]
+    # Verificar valores de IDHM
+    if all(df_state['IDHM'].between(0.4, 0.9)):
+        print("Dados de IDHM validados com sucesso.")
     else:
-        raise ValueError("Estado não encontrado. Use nome completo ou sigla (ex.: 'PE' ou 'Pernambuco').")
-
-def get_municipio_nome(tercodigo, municipios_cache=None):
-    """Obtém o nome do município a partir do TERCODIGO usando a API do IBGE."""
-    if municipios_cache is None:
-        try:
-            url_municipios = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
-            response = requests.get(url_municipios)
-            response.raise_for_status()
-            municipios_cache = response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Erro ao acessar API do IBGE: {e}")
-            return "Erro ao obter nome"
+        print("Aviso: Alguns valores de IDHM estão fora do intervalo esperado (~0.4–0.9).")
     
-    for municipio in municipios_cache:
-        if str(municipio['id']) == tercodigo:
-            return normalize_text(municipio['nome'])
-    return "Desconhecido"
+    # Selecionar colunas relevantes e ordenar por município
+    df_state = df_state[['Municipio', 'IDHM']].rename(columns={'IDHM': f'IDHM_{year}'})
+    return df_state.sort_values(by='Municipio')
 
-def collect_idhm_data(state_input):
-    """Coletar dados de IDHM para os municípios do estado informado."""
+def output_file_name(state_name, year=2010):
+    """Nome do CSV exportado por collect_idhm_data."""
+    return f"{state_name.replace(' ', '_')}_idhm_{year}.csv"
+
+def collect_idhm_data(state_input, year=2010):
+    """Coletar dados de IDHM para os municípios do estado informado (anos censitários: 1991, 2000, 2010)."""
     # Obter sigla, nome e código do estado
     sigla, state_name, state_code = get_state_code(state_input)
     
-    # URL para metadados do Ipeadata
-    url_metadata = "http://www.ipeadata.gov.br/api/odata4/Metadados"
-    
+    with metricas.contexto(fonte='ipea', uf=sigla, ano=int(year)):
+        return _collect_idhm_state(sigla, state_name, state_code, int(year))
+
+def _collect_idhm_state(sigla, state_name, state_code, year):
     try:
-        # Verificar séries disponíveis
-        response_metadata = requests.get(url_metadata)
-        response_metadata.raise_for_status()
-        metadata = response_metadata.json()
-        
-        # Confirmar que a série IDHM existe
-        series = [s for s in metadata['value'] if s['SERCODIGO'] == 'IDHM']
-        if not series:
-            raise ValueError("Série IDHM não encontrada nos metadados.")
+        # Confirmar que a série IDHM existe (metadado em cache)
+        check_idhm_series()
         
         print(f"Série IDHM confirmada para {state_name} (código {state_code}).")
         
-        # URL para valores da série IDHM (sem filtros)
-        url_valores = "http://www.ipeadata.gov.br/api/odata4/ValoresSerie(SERCODIGO='IDHM')"
-        
-        # Fazer a requisição para valores
-        response_valores = requests.get(url_valores)
-        response_valores.raise_for_status()
-        data = response_valores.json()
-        
-        # Cache dos municípios do IBGE para evitar múltiplas chamadas
-        url_municipios = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
-        response_municipios = requests.get(url_municipios)
-        response_municipios.raise_for_status()
-        municipios_cache = response_municipios.json()
-        
-        # Lista para armazenar resultados
-        resultados = []
-        
-        # Processar os dados
-        for item in data['value']:
-            ano = item['VALDATA'][:4]
-            nivel = item['NIVNOME']
-            tercodigo = item['TERCODIGO']
-            idhm = float(item['VALVALOR'])
-            resultados.append({'Ano': ano, 'NIVNOME': nivel, 'TERCODIGO': tercodigo, 'IDHM': idhm})
-        
-        # Criar DataFrame
-        df = pd.DataFrame(resultados)
-        
-        # Filtrar para o estado (TERCODIGO começando com o código da UF), ano 2010 e nível Municípios
-        df_state = df[
-            (df['TERCODIGO'].str.startswith(state_code)) &
-            (df['Ano'] == '2010') &
-            (df['NIVNOME'] == 'Municípios')
-        ]
+        # Valores já filtrados por nível, ano e UF no servidor
+        columns = fetch_idhm_state(state_code, year)
         
         # Verificar se há dados
-        if df_state.empty:
-            raise ValueError(f"Nenhum dado encontrado para {state_name} em 2010 (Municípios). A série IDHM pode não conter dados para este ano.")
-        
-        # Mapear TERCODIGO para nomes de municípios
-        df_state['Municipio'] = df_state['TERCODIGO'].apply(lambda x: get_municipio_nome(x, municipios_cache))
-        
-        # Verificar valores de IDHM
-        if all(df_state['IDHM'].between(0.4, 0.9)):
-            print("Dados de IDHM validados com sucesso.")
-        else:
-            print("Aviso: Alguns valores de IDHM estão fora do intervalo esperado (~0.4–0.9).")
+        if not columns['TERCODIGO']:
+            raise ValueError(f"Nenhum dado encontrado para {state_name} em {year} (Municípios). A série IDHM pode não conter dados para este ano.")
         
-        # Selecionar colunas relevantes
-        df_state = df_state[['Municipio', 'IDHM']].rename(columns={'IDHM': 'IDHM_2010'})
-        
-        # Ordenar por município
-        df_state = df_state.sort_values(by='Municipio')
+        with metricas.span('transform'):
+            df_state = build_idhm_frame(columns, year)
         
         # Exportar para CSV
-        output_file = f"{state_name.replace(' ', '_')}_idhm_2010.csv"
-        df_state.to_csv(output_file, index=False, encoding='utf-8-sig')
+        output_file = output_file_name(state_name, year)
+        with metricas.span('write'):
+            df_state.to_csv(output_file, index=False, encoding='utf-8-sig')
         print(f"Dados exportados para {output_file}")
         print(f"Número de municípios encontrados: {len(df_state)}")
         
@@ -147,19 +210,44 @@ def collect_idhm_data(state_input):
         print(f"Erro: {e}")
         return None
 
-def main():
-    # Solicitar estado do usuário
-    state_input = input("Digite o nome ou sigla do estado (ex.: 'PE' ou 'Pernambuco'): ")
-    
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="IDHM dos municípios de cada UF (Ipeadata).")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano', type=int, default=2010, help="ano censitário do IDHM (1991, 2000 ou 2010)")
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help="pula os estados já exportados na última execução")
+    args = parser.parse_args(argv)
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+
     # Coletar dados
+    metricas.iniciar('idhm')
+    diario_execucao = diario.Diario('idhm', retomar=args.retomar)
     try:
-        idhm_data = collect_idhm_data(state_input)
-        if idhm_data is not None:
-            print("Coleta de dados concluída com sucesso.")
-        else:
-            print("Falha na coleta de dados. Considere usar o Atlas Brasil.")
-    except Exception as e:
-        print(f"Erro inesperado: {e}")
+        for sigla in estados:
+            unidade = ('ipea', sigla, args.ano)
+            if diario_execucao.concluida(*unidade):
+                print(f"Retomando: {sigla} já exportado, pulando.")
+                continue
+            try:
+                idhm_data = collect_idhm_data(sigla, args.ano)
+            except Exception as e:
+                print(f"Erro inesperado ({sigla}): {e}")
+                diario_execucao.registrar(unidade, 'falhou', erro=f"{type(e).__name__}: {e}")
+                continue
+            if idhm_data is not None:
+                print(f"Coleta de dados concluída com sucesso ({sigla}).")
+                arquivo = output_file_name(localidades.ESTADOS[sigla][0], args.ano)
+                diario_execucao.registrar(unidade, 'ok', artefatos=[arquivo])
+            else:
+                print(f"Falha na coleta de dados ({sigla}). Considere usar o Atlas Brasil.")
+                diario_execucao.registrar(unidade, 'falhou')
+    finally:
+        diario_execucao.fechar()
+        metricas.encerrar()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
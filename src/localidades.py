@@ -0,0 +1,170 @@
+import os
+import json
+import difflib
+import threading
+import http_cache
+from normalizacao import match_key, match_key_series
+
+# Registro único das localidades do IBGE (estados e municípios), compartilhado pelos
+# coletores. A lista de municípios é baixada uma vez, guardada em disco e indexada
+# em dicionários para consultas O(1) nos dois sentidos:
+#   código -> nome/UF   e   (UF, nome normalizado) -> código
+
+URL_MUNICIPIOS = "https://servicodados.ibge.gov.br/api/v1/localidades/municipios"
+CACHE_FILE = os.path.join("cache", "ibge_localidades_municipios.json")
+
+ESTADOS = {
+    'AC': ('Acre', '12'), 'AL': ('Alagoas', '27'), 'AP': ('Amapá', '16'), 'AM': ('Amazonas', '13'),
+    'BA': ('Bahia', '29'), 'CE': ('Ceará', '23'), 'DF': ('Distrito Federal', '53'), 'ES': ('Espírito Santo', '32'),
+    'GO': ('Goiás', '52'), 'MA': ('Maranhão', '21'), 'MT': ('Mato Grosso', '51'), 'MS': ('Mato Grosso do Sul', '50'),
+    'MG': ('Minas Gerais', '31'), 'PA': ('Pará', '15'), 'PB': ('Paraíba', '25'), 'PR': ('Paraná', '41'),
+    'PE': ('Pernambuco', '26'), 'PI': ('Piauí', '22'), 'RJ': ('Rio de Janeiro', '33'), 'RN': ('Rio Grande do Norte', '24'),
+    'RS': ('Rio Grande do Sul', '43'), 'RO': ('Rondônia', '11'), 'RR': ('Roraima', '14'), 'SC': ('Santa Catarina', '42'),
+    'SP': ('São Paulo', '35'), 'SE': ('Sergipe', '28'), 'TO': ('Tocantins', '17')
+}
+
+SIGLA_POR_CODIGO = {int(codigo): sigla for sigla, (_, codigo) in ESTADOS.items()}
+
+_registro = None
+_registro_lock = threading.Lock()
+
+def get_state_code(state_input):
+    """Retorna o código da UF com base no nome ou sigla do estado."""
+    state_input = state_input.strip()
+    if state_input.upper() in ESTADOS:
+        sigla = state_input.upper()
+        return sigla, ESTADOS[sigla][0], ESTADOS[sigla][1]
+    for sigla, (nome, codigo) in ESTADOS.items():
+        if chave_nome(state_input) == chave_nome(nome):
+            return sigla, nome, codigo
+    raise ValueError("Estado não encontrado. Use nome completo ou sigla (ex.: 'PE' ou 'Pernambuco').")
+
+def resolver_estados(entradas):
+    """Siglas das UFs pedidas na linha de comando, em ordem e sem repetição.
+
+    Aceita siglas ou nomes, separados por espaço ou vírgula, e 'TODOS' para todas as UFs.
+    """
+    siglas = []
+    for entrada in entradas:
+        for parte in entrada.split(','):
+            if not parte.strip():
+                continue
+            novas = list(ESTADOS) if parte.strip().upper() == 'TODOS' else [get_state_code(parte)[0]]
+            siglas.extend(sigla for sigla in novas if sigla not in siglas)
+    return siglas
+
+def chave_nome(nome):
+    """Chave de comparação de nomes (ver normalizacao.match_key)."""
+    return match_key(nome)
+
+def carregar_municipios(cache_file=CACHE_FILE, atualizar=False):
+    """Lista [(codigo, nome)] de todos os municípios, do cache em disco ou da API do IBGE."""
+    if not atualizar and os.path.exists(cache_file):
+        with open(cache_file, encoding='utf-8') as f:
+            return [tuple(item) for item in json.load(f)]
+
+    response = http_cache.get(URL_MUNICIPIOS, source='ibge', timeout=30)
+    response.raise_for_status()
+    municipios = [(int(item['id']), item['nome']) for item in response.json()]
+
+    # Grava num temporário e troca de uma vez: leitores concorrentes nunca veem o JSON pela metade
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    tmp = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(municipios, f, ensure_ascii=False)
+    os.replace(tmp, cache_file)
+    return municipios
+
+def _montar_registro(cache_file):
+    por_codigo = {}
+    por_nome = {}
+    por_codigo6 = {}
+    por_uf = {sigla: [] for sigla in ESTADOS}
+    chaves_uf = {sigla: {} for sigla in ESTADOS}
+    for codigo, nome in carregar_municipios(cache_file):
+        # Os dois primeiros dígitos do código são o código da UF
+        uf = SIGLA_POR_CODIGO.get(codigo // 100000)
+        if uf is None:
+            continue
+        por_codigo[codigo] = (nome, uf)
+        chave = chave_nome(nome)
+        por_nome[(uf, chave)] = codigo
+        chaves_uf[uf][chave] = codigo
+        por_codigo6[codigo // 10] = codigo
+        por_uf[uf].append(codigo)
+    return {'por_codigo': por_codigo, 'por_nome': por_nome, 'por_codigo6': por_codigo6,
+            'por_uf': por_uf, 'chaves_uf': chaves_uf}
+
+def registro(cache_file=CACHE_FILE):
+    """Índices do registro, montados uma vez por processo (mesmo com coletores em threads)."""
+    global _registro
+    if _registro is None:
+        with _registro_lock:
+            if _registro is None:
+                _registro = _montar_registro(cache_file)
+    return _registro
+
+def nome_municipio(codigo):
+    """Nome oficial do município a partir do código IBGE (6 ou 7 dígitos), ou None."""
+    codigo = int(codigo)
+    if codigo < 1000000:
+        codigo = registro()['por_codigo6'].get(codigo)
+    item = registro()['por_codigo'].get(codigo)
+    return item[0] if item else None
+
+def codigo_municipio(nome, uf):
+    """Código IBGE de 7 dígitos a partir do nome (qualquer grafia/acentuação) e da UF, ou None."""
+    return registro()['por_nome'].get((uf.upper(), chave_nome(nome)))
+
+def codigo7(codigo6):
+    """Converte o código de 6 dígitos (usado pelo DATASUS) no código IBGE de 7 dígitos."""
+    return registro()['por_codigo6'].get(int(codigo6))
+
+def municipios_do_estado(uf):
+    """Lista [(codigo, nome)] dos municípios de uma UF, em ordem de código."""
+    por_codigo = registro()['por_codigo']
+    return [(codigo, por_codigo[codigo][0]) for codigo in sorted(registro()['por_uf'][uf.upper()])]
+
+def casar_municipios(nomes, uf, corte_aproximado=0.85):
+    """Atribui o código IBGE a uma Series de nomes de municípios de uma UF.
+
+    Primeiro casa pela chave normalizada (vetorizado, via dicionário da UF). Os nomes
+    que sobram passam por uma busca aproximada determinística (difflib, candidatos em
+    ordem alfabética, maior similaridade acima de `corte_aproximado`) restrita à UF
+    e aos códigos ainda livres: um código já atribuído (exato ou aproximado) não é
+    dado a um segundo nome, que fica sem correspondência.
+    Retorna (codigos, estatisticas), com `codigos` alinhado ao índice de `nomes`
+    (Int64, nulo quando não houve correspondência).
+    """
+    chaves_uf = registro()['chaves_uf'][uf.upper()]
+    chaves = match_key_series(nomes)
+    codigos = chaves.map(chaves_uf).astype('Int64')
+
+    usados = set(codigos.dropna().tolist())
+    candidatos = sorted(chave for chave, codigo in chaves_uf.items() if codigo not in usados)
+    aproximados = []
+    for indice, chave in chaves[codigos.isna() & chaves.notna()].items():
+        melhor = difflib.get_close_matches(chave, candidatos, n=1, cutoff=corte_aproximado)
+        if melhor:
+            codigos.loc[indice] = chaves_uf[melhor[0]]
+            aproximados.append((nomes.loc[indice], melhor[0]))
+            candidatos.remove(melhor[0])
+
+    sem_correspondencia = nomes[codigos.isna()].tolist()
+    estatisticas = {
+        'total': len(nomes),
+        'exatos': len(nomes) - len(aproximados) - len(sem_correspondencia),
+        'aproximados': aproximados,
+        'sem_correspondencia': sem_correspondencia,
+    }
+    return codigos, estatisticas
+
+def resumo_correspondencia(estatisticas):
+    """Texto curto com as estatísticas de casar_municipios."""
+    texto = (f"{estatisticas['exatos']} exatos, {len(estatisticas['aproximados'])} aproximados, "
+             f"{len(estatisticas['sem_correspondencia'])} sem correspondência de {estatisticas['total']}")
+    for original, oficial in estatisticas['aproximados']:
+        texto += f"\n  ~ {original} -> {oficial}"
+    for nome in estatisticas['sem_correspondencia']:
+        texto += f"\n  ? {nome}"
+    return texto
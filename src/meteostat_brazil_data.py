@@ -1,125 +1,339 @@
-from datetime import datetime, date
-import pandas as pd
-from meteostat import Point, Daily
-import geobr
+from datetime import datetime
+import argparse
+import localidades
+import metricas
+import retentativas
+import diario
 import warnings
-import unicodedata
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
-warnings.filterwarnings("ignore", category=UserWarning, module="meteostat")
+# pandas, meteostat e a tabela de municípios (numpy) são importados só quando a
+# coleta roda, para que importar este módulo continue barato.
 
-def normalize_text(text):
-    """Normaliza texto para remover problemas de codificação."""
-    if isinstance(text, str):
-        # Normalizar para forma NFKD e converter para ASCII, removendo acentos incorretos
-        return unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
-    return text
+logger = logging.getLogger(__name__)
 
 def get_municipalities_by_state(state_input):
-    """Retorna lista de municípios para o estado informado (nome ou sigla)."""
-    # Carregar dados de todos os municípios brasileiros
-    municipalities = geobr.read_municipality(year=2020)
-    
-    # Dicionário de siglas para nomes completos dos estados
-    state_dict = {
-        'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas',
-        'BA': 'Bahia', 'CE': 'Ceará', 'DF': 'Distrito Federal', 'ES': 'Espírito Santo',
-        'GO': 'Goiás', 'MA': 'Maranhão', 'MT': 'Mato Grosso', 'MS': 'Mato Grosso do Sul',
-        'MG': 'Minas Gerais', 'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná',
-        'PE': 'Pernambuco', 'PI': 'Piauí', 'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte',
-        'RS': 'Rio Grande do Sul', 'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina',
-        'SP': 'São Paulo', 'SE': 'Sergipe', 'TO': 'Tocantins'
-    }
-    
-    # Normalizar entrada do estado
-    state_input = state_input.strip().title()
-    if state_input in state_dict.values():
-        state_name = state_input
-    elif state_input.upper() in state_dict:
-        state_name = state_dict[state_input.upper()]
-    else:
-        raise ValueError("Estado não encontrado. Use nome completo ou sigla (ex.: 'PE' ou 'Pernambuco').")
-    
-    # Filtrar municípios do estado
-    municipalities = municipalities[municipalities['name_state'] == state_name]
+    """Retorna lista de municípios para o estado informado (nome ou sigla).
+
+    Lê a tabela pré-calculada de municipios_table (nome já normalizado e centroide
+    em latitude/longitude), sem carregar as geometrias do geobr.
+    """
+    import municipios_table
+
+    # Resolver o estado pelo registro de localidades (nome ou sigla)
+    abbrev_state, state_name, _ = localidades.get_state_code(state_input)
+    municipalities = municipios_table.municipalities_for_state(abbrev_state)
     
     if municipalities.empty:
         raise ValueError(f"Nenhum município encontrado para o estado {state_name}.")
     
-    # Normalizar nomes dos municípios
-    municipalities['name_muni'] = municipalities['name_muni'].apply(normalize_text)
-    
+    municipalities['name_state'] = state_name
     return municipalities
 
-def collect_weather_data(state_input, start_date, end_date):
-    """Coletar dados meteorológicos para todos os municípios de um estado."""
+def fetch_municipality_weather(latitude, longitude, start_date, end_date):
+    """Baixa a série diária do Meteostat para um ponto (centroide do município)."""
+    from meteostat import Point, Daily
+    warnings.filterwarnings("ignore", category=UserWarning, module="meteostat")
+
+    # Criar objeto Point para o Meteostat
+    point = Point(latitude, longitude)
+    return Daily(point, start_date, end_date).fetch()
+
+def _fetch_instrumentado(uf, code_muni, latitude, longitude, start_date, end_date):
+    """fetch_municipality_weather dentro de um span com UF e município (roda nas threads).
+
+    Falhas são repetidas com espera exponencial e jitter (ver retentativas).
+    """
+    with metricas.contexto(fonte='meteostat', uf=uf), metricas.span('fetch', municipio=code_muni):
+        metricas.contar('requisicoes')
+        data = retentativas.repetir(fetch_municipality_weather, latitude, longitude, start_date, end_date)
+        metricas.contar('linhas', len(data))
+        return data
+
+def _em_janela(executor, funcao, tarefas, janela):
+    """Submete `funcao(*tarefa)` com no máximo `janela` tarefas em andamento.
+
+    Produz (tarefa, futuro) na ordem de conclusão; a próxima tarefa só é submetida
+    quando uma termina, então no máximo `janela` resultados existem ao mesmo tempo.
+    """
+    fila = iter(tarefas)
+    em_andamento = {executor.submit(funcao, *tarefa): tarefa for tarefa in itertools.islice(fila, janela)}
+    while em_andamento:
+        concluidos, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+        for futuro in concluidos:
+            tarefa = em_andamento.pop(futuro)
+            for proxima in itertools.islice(fila, 1):
+                em_andamento[executor.submit(funcao, *proxima)] = proxima
+            yield tarefa, futuro
+
+def iter_weather_data(state_input, start_date, end_date, max_workers=8, by_station=False, pular=()):
+    """Produz (city, code_muni, state, data, erro) por município, à medida que as séries chegam.
+
+    `data` é a série diária (índice de datas) ou None quando o município falhou ou
+    veio vazio (motivo em `erro`). Só um lote de ~2 × `max_workers` séries fica em memória.
+    Os códigos em `pular` (ex.: já gravados numa execução anterior) não são baixados.
+    """
+    if by_station:
+        yield from iter_weather_data_by_station(state_input, start_date, end_date, max_workers, pular)
+        return
+
     # Obter lista de municípios
     municipalities = get_municipalities_by_state(state_input)
-    
-    # Criar DataFrame vazio para armazenar todos os dados
-    all_data = pd.DataFrame()
-    
-    # Iterar sobre os municípios
-    for _, row in municipalities.iterrows():
-        city_name = row['name_muni']
-        code_muni = row['code_muni']
-        geometry = row['geometry']
-        centroid = geometry.centroid
-        latitude = centroid.y
-        longitude = centroid.x
-        
-        print(f"Coletando dados para {city_name} ({code_muni})...")
-        
-        # Criar objeto Point para o Meteostat
-        point = Point(latitude, longitude)
-        
-        # Obter dados diários
-        try:
-            data = Daily(point, start_date, end_date).fetch()
-            if not data.empty:
-                # Adicionar colunas de identificação
-                data['city'] = city_name
-                data['code_muni'] = code_muni
-                data['state'] = row['name_state']
-                # Preencher valores NaN com 0 para colunas numéricas
-                numeric_columns = ['tavg', 'tmin', 'tmax', 'prcp', 'wspd', 'pres', 'tsun']
-                data[numeric_columns] = data[numeric_columns].fillna(0)
-                all_data = pd.concat([all_data, data])
-            else:
-                print(f"Aviso: Nenhum dado disponível para {city_name}.")
-        except Exception as e:
-            print(f"Erro ao coletar dados para {city_name}: {e}")
-    
-    # Resetar índice e renomear coluna de data
-    all_data = all_data.reset_index().rename(columns={'index': 'date'})
-    
+    municipalities = municipalities[~municipalities['code_muni'].isin(list(pular))]
+    uf = localidades.get_state_code(state_input)[0]
+
+    tarefas = list(zip(
+        [uf] * len(municipalities), municipalities['code_muni'], municipalities['latitude'],
+        municipalities['longitude'], [start_date] * len(municipalities), [end_date] * len(municipalities)
+    ))
+    nomes = dict(zip(municipalities['code_muni'], zip(municipalities['name_muni'], municipalities['name_state'])))
+    total = len(tarefas)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        resultados = _em_janela(executor, _fetch_instrumentado, tarefas, 2 * max_workers)
+        for concluidos, (tarefa, futuro) in enumerate(resultados, start=1):
+            code_muni = tarefa[1]
+            city_name, state = nomes[code_muni]
+            try:
+                data = futuro.result()
+            except Exception as e:
+                logger.error("[%d/%d] Erro ao coletar dados para %s (%s): %s", concluidos, total, city_name, code_muni, e)
+                yield city_name, code_muni, state, None, str(e)
+                continue
+
+            if data.empty:
+                logger.warning("[%d/%d] Nenhum dado disponível para %s (%s).", concluidos, total, city_name, code_muni)
+                yield city_name, code_muni, state, None, "nenhum dado disponível"
+                continue
+
+            logger.info("[%d/%d] %s (%s): %d dias coletados.", concluidos, total, city_name, code_muni, len(data))
+            yield city_name, code_muni, state, data, None
+
+def collect_weather_data(state_input, start_date, end_date, max_workers=8, by_station=False):
+    """Coletar dados meteorológicos para todos os municípios de um estado.
+
+    As requisições ao Meteostat rodam em paralelo (`max_workers` threads; 1 = sequencial).
+    Com `by_station=True`, cada estação é baixada uma vez (com cache em disco) e a série
+    é distribuída aos municípios que dependem dela (ver meteostat_stations).
+    Os municípios que falharam ficam em `all_data.attrs['falhas']` ({code_muni: erro}).
+    Para um estado grande (ou o país), prefira stream_weather_data, que não acumula as séries.
+    """
+    import pandas as pd
+
+    uf = localidades.get_state_code(state_input)[0]
+    frames = {}
+    falhas = {}
+    for city_name, code_muni, state, data, erro in iter_weather_data(state_input, start_date, end_date,
+                                                                     max_workers, by_station):
+        if data is None:
+            falhas[code_muni] = erro
+            continue
+        # Adicionar colunas de identificação
+        data['city'] = city_name
+        data['code_muni'] = code_muni
+        data['state'] = state
+        # Dias sem medição ficam nulos (a agregação semanal conta os dias observados)
+        frames[code_muni] = data
+
+    # Concatena uma única vez, na ordem original dos municípios
+    with metricas.span('transform', fonte='meteostat', uf=uf):
+        ordered = [frames[code_muni] for code_muni in sorted(frames)]
+        all_data = pd.concat(ordered) if ordered else pd.DataFrame()
+
+        # Resetar índice e renomear coluna de data
+        all_data = all_data.reset_index().rename(columns={'index': 'date', 'time': 'date'})
+    all_data.attrs['falhas'] = falhas
+
+    logger.info("%d de %d municípios coletados; %d falhas.", len(frames), len(frames) + len(falhas), len(falhas))
     return all_data
 
-def main():
-    # Configurar período de tempo (de 2021 até hoje)
-    start = datetime(2021, 1, 1)
-    end = datetime.now()  # Data atual
-    
-    # Solicitar estado do usuário
-    state_input = input("Digite o nome ou sigla do estado (ex.: 'PE' ou 'Pernambuco'): ")
-    
-    # Coletar dados
-    try:
-        weather_data = collect_weather_data(state_input, start, end)
+def stream_weather_data(state_input, start_date, end_date, diretorio=None, max_workers=8, by_station=False,
+                        diario_execucao=None):
+    """Coleta o estado gravando cada município no dataset de clima_dataset assim que chega.
+
+    Nada é acumulado: a memória de pico fica em um lote de séries em andamento.
+    Cada município é uma unidade do `diario_execucao` (('meteostat', uf, code_muni)); os já
+    concluídos numa execução anterior são pulados.
+    Retorna {'arquivos': [caminhos], 'falhas': {code_muni: erro}, 'linhas': total de dias},
+    com os arquivos dos municípios pulados incluídos.
+    """
+    import clima_dataset
+
+    diretorio = diretorio or clima_dataset.DIRETORIO_PADRAO
+    uf = localidades.get_state_code(state_input)[0]
+    resultado = {'arquivos': [], 'falhas': {}, 'linhas': 0}
+    pular = set()
+    if diario_execucao is not None:
+        pular = {code_muni for code_muni in clima_dataset.municipios_gravados(uf, diretorio)
+                 if diario_execucao.concluida('meteostat', uf, code_muni)}
+        resultado['arquivos'] = [clima_dataset.caminho_municipio(uf, code_muni, diretorio) for code_muni in sorted(pular)]
+        if pular:
+            logger.info("Retomando %s: %d municípios já gravados serão pulados.", uf, len(pular))
+
+    for city_name, code_muni, state, data, erro in iter_weather_data(state_input, start_date, end_date,
+                                                                     max_workers, by_station, pular):
+        if data is None:
+            resultado['falhas'][code_muni] = erro
+            if diario_execucao is not None:
+                diario_execucao.registrar(('meteostat', uf, code_muni), 'falhou', erro=erro)
+            continue
+        with metricas.contexto(fonte='meteostat', uf=uf):
+            with metricas.span('transform', municipio=code_muni):
+                tabela = clima_dataset.tabela_municipio(data, code_muni, city_name, state)
+            with metricas.span('write', municipio=code_muni):
+                caminho = clima_dataset.salvar_municipio(uf, code_muni, tabela, diretorio)
+        resultado['arquivos'].append(caminho)
+        resultado['linhas'] += len(data)
+        if diario_execucao is not None:
+            diario_execucao.registrar(('meteostat', uf, code_muni), 'ok', artefatos=[caminho], linhas=len(data))
+
+    logger.info("%d municípios gravados em %s; %d falhas.", len(resultado['arquivos']),
+                clima_dataset.caminho_estado(uf, diretorio), len(resultado['falhas']))
+    return resultado
+
+def _fetch_estacao_instrumentado(uf, station_id, start_date, end_date):
+    import meteostat_stations
+
+    with metricas.contexto(fonte='meteostat', uf=uf), metricas.span('fetch', estacao=station_id):
+        metricas.contar('requisicoes')
+        data = retentativas.repetir(meteostat_stations.fetch_station_daily, station_id, start_date, end_date)
+        metricas.contar('linhas', len(data))
+        return data
+
+def iter_weather_data_by_station(state_input, start_date, end_date, max_workers=8, pular=()):
+    """Coleta por estação: resolve centroides -> estações, baixa cada estação uma vez e distribui.
+
+    Produz as mesmas tuplas de iter_weather_data, município a município. As séries
+    das estações ficam em memória (são bem menos que os municípios).
+    """
+    import meteostat_stations
+
+    municipalities = get_municipalities_by_state(state_input)
+    municipalities = municipalities[~municipalities['code_muni'].isin(list(pular))]
+    uf = localidades.get_state_code(state_input)[0]
+
+    # Resolução espacial: quais estações contribuem para cada município
+    stations = meteostat_stations.load_stations()
+    mapping = meteostat_stations.map_to_stations(
+        municipalities['latitude'].to_numpy(), municipalities['longitude'].to_numpy(), stations)
+    unique_stations = sorted({station_id for pesos in mapping for station_id, _ in pesos})
+    logger.info("%d municípios dependem de %d estações.", len(municipalities), len(unique_stations))
+
+    # Cada estação é baixada (ou lida do cache) uma única vez
+    station_frames = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {
+            executor.submit(_fetch_estacao_instrumentado, uf, station_id, start_date, end_date): station_id
+            for station_id in unique_stations
+        }
+        for futuro in as_completed(futuros):
+            station_id = futuros[futuro]
+            try:
+                station_frames[station_id] = futuro.result()
+            except Exception as e:
+                logger.error("Erro ao coletar a estação %s: %s", station_id, e)
+
+    # Distribui as séries das estações para os municípios
+    for (city_name, code_muni, state), pesos in zip(
+            zip(municipalities['name_muni'], municipalities['code_muni'], municipalities['name_state']), mapping):
+        with metricas.contexto(fonte='meteostat', uf=uf), metricas.span('transform', municipio=code_muni):
+            data = meteostat_stations.interpolate(station_frames, pesos, start_date, end_date)
+        if data.empty:
+            logger.warning("Nenhum dado disponível para %s (%s).", city_name, code_muni)
+            yield city_name, code_muni, state, None, "nenhuma estação com dados"
+            continue
+        yield city_name, code_muni, state, data, None
+
+def collect_weather_data_by_station(state_input, start_date, end_date, max_workers=8):
+    """Versão por estação de collect_weather_data (mesmo formato de saída)."""
+    return collect_weather_data(state_input, start_date, end_date, max_workers, by_station=True)
+
+def output_file_name(sigla, ano_inicio, ano_fim):
+    """Nome do CSV de saída (o período até hoje mantém o nome lido por painel.carregar_clima)."""
+    fim = 'now' if ano_fim >= datetime.now().year else str(ano_fim)
+    return f"{sigla}_weather_data_{ano_inicio}_to_{fim}.csv"
+
+def collect_and_save(estados, ano_inicio, ano_fim, max_workers=8, by_station=False, parquet=False, diretorio=None,
+                     diario_execucao=None):
+    """Coleta e exporta cada estado; retorna {sigla: arquivo} dos que deram certo.
+
+    Com `parquet`, grava em streaming no dataset de clima_dataset (em `diretorio`),
+    registrando cada município no `diario_execucao`, e o "arquivo" é a partição do estado;
+    sem ele, um CSV por estado.
+    """
+    start = datetime(ano_inicio, 1, 1)
+    end = min(datetime(ano_fim, 12, 31), datetime.now())
+    arquivos = {}
+    for sigla in estados:
+        if parquet:
+            import clima_dataset
+
+            try:
+                resultado = stream_weather_data(sigla, start, end, diretorio, max_workers, by_station, diario_execucao)
+            except Exception as e:
+                print(f"Erro ({sigla}): {e}")
+                continue
+            if resultado['arquivos']:
+                arquivos[sigla] = clima_dataset.caminho_estado(sigla, diretorio or clima_dataset.DIRETORIO_PADRAO)
+                print(f"{len(resultado['arquivos'])} municípios ({resultado['linhas']} dias) gravados em "
+                      f"{arquivos[sigla]}; {len(resultado['falhas'])} falhas.")
+            continue
+
+        try:
+            weather_data = collect_weather_data(sigla, start, end, max_workers=max_workers, by_station=by_station)
+        except ValueError as e:
+            print(f"Erro ({sigla}): {e}")
+            continue
+        except Exception as e:
+            print(f"Erro inesperado ({sigla}): {e}")
+            continue
         
         # Exportar para CSV com codificação UTF-8-SIG
-        state_name = state_input.upper() if len(state_input) <= 2 else state_input.title()
-        output_file = f"{state_name.replace(' ', '_')}_weather_data_2021_to_now.csv"
-        weather_data.to_csv(output_file, index=False, encoding='utf-8-sig')
+        output_file = output_file_name(sigla, ano_inicio, ano_fim)
+        with metricas.span('write', fonte='meteostat', uf=sigla):
+            weather_data.to_csv(output_file, index=False, encoding='utf-8-sig')
         print(f"Dados exportados para {output_file}")
+        arquivos[sigla] = output_file
         
         # Exibir resumo
-        print(f"\nResumo dos dados coletados:")
-        print(weather_data[['date', 'city', 'tavg', 'prcp']].head())
-        
+        if not weather_data.empty:
+            print(f"\nResumo dos dados coletados ({sigla}):")
+            print(weather_data[['date', 'city', 'tavg', 'prcp']].head())
+    return arquivos
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clima diário (Meteostat) dos municípios de cada UF.")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano-inicio', type=int, default=2021)
+    parser.add_argument('--ano-fim', type=int, default=datetime.now().year)
+    parser.add_argument('--por-estacao', action='store_true',
+                        help="baixa cada estação uma vez e interpola para os municípios")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--parquet', action='store_true',
+                        help="grava cada município no dataset Parquet assim que chega, em vez de um CSV no fim")
+    parser.add_argument('--saida', help="diretório do dataset Parquet (padrão: clima_parquet)")
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help="refaz só os municípios que faltam ou falharam na última execução (exige --parquet)")
+    args = parser.parse_args(argv)
+    if args.retomar and not args.parquet:
+        parser.error("--retomar exige --parquet (cada município gravado é um ponto de retomada)")
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
     except ValueError as e:
-        print(f"Erro: {e}")
-    except Exception as e:
-        print(f"Erro inesperado: {e}")
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    metricas.iniciar('meteostat')
+    diario_execucao = diario.Diario('meteostat', retomar=args.retomar)
+    try:
+        collect_and_save(estados, args.ano_inicio, args.ano_fim, args.workers, args.por_estacao,
+                         parquet=args.parquet, diretorio=args.saida, diario_execucao=diario_execucao)
+    finally:
+        diario_execucao.fechar()
+        metricas.encerrar()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
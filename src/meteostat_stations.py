@@ -0,0 +1,134 @@
+import os
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.neighbors import BallTree
+from meteostat import Stations, Daily
+
+# Etapa de resolução por estação para o Meteostat: vários centroides de municípios
+# caem nas mesmas estações, então cada estação é baixada uma única vez, guardada em
+# cache no disco (reaproveitado entre execuções) e depois distribuída aos municípios
+# por média ponderada pelo inverso da distância.
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join("cache", "meteostat")
+RAIO_TERRA_KM = 6371.0
+COLUNAS_DIARIAS = ['tavg', 'tmin', 'tmax', 'prcp', 'snow', 'wdir', 'wspd', 'wpgt', 'pres', 'tsun']
+
+def load_stations(region='BR', cache_dir=CACHE_DIR):
+    """Lista de estações da região (id, latitude, longitude), com cache local."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"stations_{region}.parquet")
+    if os.path.exists(cache_file):
+        return pd.read_parquet(cache_file)
+
+    stations = Stations().region(region).fetch()
+    stations = stations[stations['daily_end'].notna()][['latitude', 'longitude', 'daily_start', 'daily_end']]
+    stations.to_parquet(cache_file)
+    return stations
+
+def map_to_stations(latitudes, longitudes, stations, k=3, max_distance_km=100.0):
+    """Associa cada ponto às k estações mais próximas (BallTree haversine).
+
+    Retorna uma lista, por ponto, de pares (id_estacao, peso) com pesos pelo inverso da
+    distância somando 1. Pontos sem estação dentro do raio recebem só a mais próxima.
+    """
+    tree = BallTree(np.radians(stations[['latitude', 'longitude']].to_numpy()), metric='haversine')
+    pontos = np.radians(np.column_stack([latitudes, longitudes]))
+    distancias, indices = tree.query(pontos, k=min(k, len(stations)))
+    distancias_km = distancias * RAIO_TERRA_KM
+
+    ids = stations.index.to_numpy()
+    mapeamento = []
+    for dist, idx in zip(distancias_km, indices):
+        dentro = dist <= max_distance_km
+        if not dentro.any():
+            dentro[0] = True
+        pesos = 1.0 / np.maximum(dist[dentro], 1.0)
+        pesos = pesos / pesos.sum()
+        mapeamento.append(list(zip(ids[idx[dentro]], pesos)))
+    return mapeamento
+
+def _cache_path(station_id, cache_dir):
+    return os.path.join(cache_dir, f"daily_{station_id}.parquet")
+
+def _read_cache(station_id, cache_dir):
+    """Retorna (dados, inicio, fim) do cache da estação, ou (None, None, None)."""
+    caminho = _cache_path(station_id, cache_dir)
+    if not os.path.exists(caminho):
+        return None, None, None
+    tabela = pq.read_table(caminho)
+    meta = tabela.schema.metadata or {}
+    inicio = datetime.fromisoformat(meta[b'inicio'].decode())
+    fim = datetime.fromisoformat(meta[b'fim'].decode())
+    return tabela.to_pandas(), inicio, fim
+
+def _write_cache(station_id, data, inicio, fim, cache_dir):
+    tabela = pa.Table.from_pandas(data)
+    meta = dict(tabela.schema.metadata or {})
+    meta.update({b'inicio': inicio.isoformat().encode(), b'fim': fim.isoformat().encode()})
+    pq.write_table(tabela.replace_schema_metadata(meta), _cache_path(station_id, cache_dir))
+
+def fetch_station_daily(station_id, start_date, end_date, cache_dir=CACHE_DIR):
+    """Série diária de uma estação, baixando só os intervalos que ainda não estão no cache."""
+    os.makedirs(cache_dir, exist_ok=True)
+    dados, inicio, fim = _read_cache(station_id, cache_dir)
+
+    faltantes = []
+    if dados is None:
+        faltantes.append((start_date, end_date))
+        inicio, fim = start_date, start_date - timedelta(days=1)
+    else:
+        if start_date < inicio:
+            faltantes.append((start_date, inicio - timedelta(days=1)))
+        if end_date > fim:
+            faltantes.append((fim + timedelta(days=1), end_date))
+
+    if faltantes:
+        partes = [] if dados is None else [dados]
+        for ini, fi in faltantes:
+            novo = Daily(station_id, ini, fi).fetch()
+            logger.debug("Estação %s: %d dias baixados (%s a %s).", station_id, len(novo), ini.date(), fi.date())
+            if not novo.empty:
+                partes.append(novo)
+        dados = pd.concat(partes).sort_index() if partes else pd.DataFrame(columns=COLUNAS_DIARIAS)
+        dados = dados[~dados.index.duplicated(keep='last')]
+        # Só marca como coberto até o último dia realmente publicado, para que os dias
+        # ainda não disponíveis sejam buscados de novo na próxima execução (sem nenhum
+        # dado, a cobertura não avança e a janela inteira volta a ser pedida)
+        if dados.empty:
+            fim_coberto = fim
+        else:
+            fim_coberto = max(fim, min(end_date, dados.index.max().to_pydatetime()))
+        _write_cache(station_id, dados, min(inicio, start_date), fim_coberto, cache_dir)
+
+    return dados.loc[(dados.index >= start_date) & (dados.index <= end_date)]
+
+def interpolate(station_frames, pesos_estacoes, start_date, end_date):
+    """Média ponderada das séries das estações, ignorando dias sem dado em cada estação."""
+    dias = pd.date_range(start_date.date() if isinstance(start_date, datetime) else start_date,
+                         end_date.date() if isinstance(end_date, datetime) else end_date, freq='D', name='time')
+    valores = []
+    pesos = []
+    for station_id, peso in pesos_estacoes:
+        frame = station_frames.get(station_id)
+        if frame is None or frame.empty:
+            continue
+        valores.append(frame.reindex(dias)[COLUNAS_DIARIAS].to_numpy(dtype='float64'))
+        pesos.append(peso)
+    if not valores:
+        return pd.DataFrame(columns=COLUNAS_DIARIAS)
+
+    valores = np.stack(valores)                        # (estações, dias, colunas)
+    pesos = np.asarray(pesos)[:, None, None] * ~np.isnan(valores)
+    soma_pesos = pesos.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.nansum(valores * pesos, axis=0) / soma_pesos
+    media[soma_pesos == 0] = np.nan
+
+    resultado = pd.DataFrame(media, index=dias, columns=COLUNAS_DIARIAS)
+    return resultado.dropna(how='all')
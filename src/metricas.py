@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+import contextlib
+import contextvars
+from datetime import datetime
+
+# Instrumentação comum aos coletores: intervalos (spans) de tempo por etapa e
+# contadores por fonte e por estado/ano.
+#
+#   with metricas.contexto(fonte='tabnet', uf='PE', ano=2021):
+#       with metricas.span('parse'):
+#           ...
+#       metricas.contar('linhas', n)
+#
+# Os rótulos do contexto valem para tudo o que roda dentro dele, inclusive em
+# http_cache. Threads de um ThreadPoolExecutor não herdam o contexto; a função
+# executada em cada thread precisa abrir o seu.
+#
+# Saídas:
+#   - log JSON, um evento por linha (spans e erros), em <diretorio>/<execucao>-<data>.jsonl
+#   - arquivo texto no formato do Prometheus (textfile collector), em <diretorio>/<execucao>.prom
+#   - tabela com os municípios e as requisições mais lentos, impressa no fim da execução
+# Sem iniciar(), os números são acumulados em memória e nada é gravado.
+
+DIRETORIO_PADRAO = os.path.join("cache", "metricas")
+ETAPAS = ('fetch', 'parse', 'transform', 'write')
+CONTADORES = ('bytes_recebidos', 'linhas', 'cache_acertos', 'requisicoes', 'retentativas', 'erros')
+# Só estes rótulos entram no Prometheus (município e URL ficam no log e no resumo)
+ROTULOS_PROMETHEUS = ('fonte', 'etapa', 'uf', 'ano')
+N_LENTOS = 10
+
+logger = logging.getLogger(__name__)
+
+_rotulos = contextvars.ContextVar('metricas_rotulos', default={})
+_lock = threading.Lock()
+_estado = None
+
+def _novo_estado():
+    return {
+        'contadores': {},  # (nome, rotulos) -> valor
+        'duracoes': {},    # rotulos -> [soma, contagem]
+        'lentos': {'municipio': [], 'url': []},  # heaps (duracao, seq, rotulos)
+        'seq': 0,
+        'inicio': time.time(),
+        'execucao': None,
+        'diretorio': None,
+        'handler': None,
+    }
+
+def _atual():
+    global _estado
+    if _estado is None:
+        _estado = _novo_estado()
+    return _estado
+
+def _chave(rotulos, nomes=ROTULOS_PROMETHEUS):
+    return tuple((nome, str(rotulos[nome])) for nome in nomes if rotulos.get(nome) is not None)
+
+def rotulos_atuais():
+    return dict(_rotulos.get())
+
+@contextlib.contextmanager
+def contexto(**rotulos):
+    """Acrescenta rótulos (fonte, uf, ano, municipio, url...) a tudo o que roda dentro do bloco."""
+    token = _rotulos.set({**_rotulos.get(), **{k: v for k, v in rotulos.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _rotulos.reset(token)
+
+def contar(nome, valor=1, **rotulos):
+    """Soma `valor` ao contador `nome` com os rótulos do contexto (mais os informados)."""
+    chave = (nome, _chave({**_rotulos.get(), **rotulos}))
+    with _lock:
+        contadores = _atual()['contadores']
+        contadores[chave] = contadores.get(chave, 0) + valor
+
+def evento(tipo, **campos):
+    """Grava um evento no log JSON (se houver um aberto)."""
+    logger.info(json.dumps({'ts': round(time.time(), 3), 'evento': tipo, **rotulos_atuais(), **campos},
+                           ensure_ascii=False, default=str))
+
+@contextlib.contextmanager
+def span(etapa, **rotulos):
+    """Mede o tempo de uma etapa (fetch, parse, transform, write).
+
+    Uma exceção dentro do bloco conta como erro e é propagada.
+    """
+    with contexto(etapa=etapa, **rotulos):
+        completos = rotulos_atuais()
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            yield
+        except BaseException as e:
+            erro = e
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            _registrar(completos, duracao)
+            if erro is not None:
+                contar('erros')
+                evento('span', duracao_s=round(duracao, 6), erro=f"{type(erro).__name__}: {erro}")
+            else:
+                evento('span', duracao_s=round(duracao, 6))
+
+def _registrar(rotulos, duracao):
+    chave = _chave(rotulos)
+    with _lock:
+        estado = _atual()
+        soma = estado['duracoes'].setdefault(chave, [0.0, 0])
+        soma[0] += duracao
+        soma[1] += 1
+        estado['seq'] += 1
+        for campo, heap in estado['lentos'].items():
+            if rotulos.get(campo) is None:
+                continue
+            item = (duracao, estado['seq'], rotulos)
+            if len(heap) < N_LENTOS:
+                heapq.heappush(heap, item)
+            elif duracao > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+def iniciar(execucao, diretorio=DIRETORIO_PADRAO):
+    """Zera as métricas e abre o log JSON da execução."""
+    global _estado
+    encerrar_log()
+    _estado = _novo_estado()
+    _estado['execucao'] = execucao
+    _estado['diretorio'] = diretorio
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(diretorio, f"{execucao}-{datetime.now():%Y%m%d_%H%M%S}.jsonl")
+    handler = logging.FileHandler(caminho, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # O log JSON não deve aparecer no console junto com as mensagens dos coletores
+    logger.propagate = False
+    _estado['handler'] = handler
+    return caminho
+
+def encerrar_log():
+    handler = _estado and _estado['handler']
+    if handler:
+        logger.removeHandler(handler)
+        handler.close()
+        _estado['handler'] = None
+
+def _memoria_pico():
+    """Pico de memória residente do processo, em bytes (None fora de sistemas POSIX)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    return pico if os.uname().sysname == 'Darwin' else pico * 1024
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _linha(nome, chave, valor):
+    rotulos = ','.join(f'{k}="{_escapar(v)}"' for k, v in chave)
+    return f"{nome}{{{rotulos}}} {valor:g}" if rotulos else f"{nome} {valor:g}"
+
+def prometheus():
+    """Texto no formato de exposição do Prometheus com as métricas acumuladas."""
+    with _lock:
+        estado = _atual()
+        duracoes = sorted(estado['duracoes'].items())
+        contadores = sorted(estado['contadores'].items())
+        inicio = estado['inicio']
+
+    linhas = ["# HELP dop_etapa_segundos Tempo gasto por etapa da coleta.",
+              "# TYPE dop_etapa_segundos summary"]
+    for chave, (soma, contagem) in duracoes:
+        linhas.append(_linha('dop_etapa_segundos_sum', chave, soma))
+        linhas.append(_linha('dop_etapa_segundos_count', chave, contagem))
+    for nome in sorted({nome for nome, _ in contadores}):
+        linhas.append(f"# TYPE dop_{nome}_total counter")
+        linhas.extend(_linha(f'dop_{nome}_total', chave, valor) for (n, chave), valor in contadores if n == nome)
+    linhas += ["# TYPE dop_execucao_segundos gauge", _linha('dop_execucao_segundos', (), time.time() - inicio)]
+    pico = _memoria_pico()
+    if pico is not None:
+        linhas += ["# TYPE dop_memoria_pico_bytes gauge", _linha('dop_memoria_pico_bytes', (), pico)]
+    return '\n'.join(linhas) + '\n'
+
+def escrever_prometheus(caminho):
+    """Grava o texto do Prometheus de forma atômica (o coletor nunca lê arquivo pela metade)."""
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(prometheus())
+    os.replace(tmp, caminho)
+    return caminho
+
+def totais(nome):
+    """{(fonte, uf, ano): valor} de um contador, somado sobre a etapa."""
+    resultado = {}
+    with _lock:
+        for (n, chave), valor in _atual()['contadores'].items():
+            if n != nome:
+                continue
+            rotulos = dict(chave)
+            grupo = (rotulos.get('fonte'), rotulos.get('uf'), rotulos.get('ano'))
+            resultado[grupo] = resultado.get(grupo, 0) + valor
+    return resultado
+
+def resumo():
+    """Tabela de tempo por etapa e dos municípios/requisições mais lentos."""
+    with _lock:
+        estado = _atual()
+        por_etapa = {}
+        for chave, (soma, contagem) in estado['duracoes'].items():
+            rotulos = dict(chave)
+            grupo = (rotulos.get('fonte', '-'), rotulos.get('etapa', '-'))
+            total = por_etapa.setdefault(grupo, [0.0, 0])
+            total[0] += soma
+            total[1] += contagem
+        lentos = {campo: sorted(heap, reverse=True) for campo, heap in estado['lentos'].items()}
+
+    linhas = [f"{'fonte':<12}{'etapa':<11}{'n':>7}{'total (s)':>12}{'médio (ms)':>12}"]
+    for (fonte, etapa), (soma, contagem) in sorted(por_etapa.items(), key=lambda item: -item[1][0]):
+        linhas.append(f"{fonte:<12}{etapa:<11}{contagem:>7}{soma:>12.2f}{1000 * soma / contagem:>12.1f}")
+
+    bytes_recebidos = sum(totais('bytes_recebidos').values())
+    acertos = sum(totais('cache_acertos').values())
+    requisicoes = sum(totais('requisicoes').values())
+    erros = sum(totais('erros').values())
+    linhas.append(f"\n{requisicoes} requisições ({acertos} do cache), {bytes_recebidos / 2**20:.1f} MiB recebidos, "
+                  f"{sum(totais('retentativas').values())} retentativas, {erros} erros.")
+
+    for campo, titulo in (('municipio', 'Municípios mais lentos'), ('url', 'Requisições mais lentas')):
+        if not lentos[campo]:
+            continue
+        linhas.append(f"\n{titulo}:")
+        for duracao, _, rotulos in lentos[campo]:
+            onde = ' '.join(str(rotulos[k]) for k in ('fonte', 'uf', 'ano', 'etapa') if rotulos.get(k) is not None)
+            linhas.append(f"{duracao:>9.3f} s  {onde}  {rotulos[campo]}")
+    return '\n'.join(linhas)
+
+def encerrar():
+    """Fecha a execução: grava o arquivo do Prometheus e imprime o resumo.
+
+    Retorna o caminho do arquivo .prom (None se iniciar() não foi chamado).
+    """
+    estado = _atual()
+    caminho = None
+    if estado['execucao']:
+        caminho = escrever_prometheus(os.path.join(estado['diretorio'], f"{estado['execucao']}.prom"))
+    encerrar_log()
+    print("\nMétricas da execução:")
+    print(resumo())
+    if caminho:
+        print(f"\nMétricas gravadas em {caminho}")
+    return caminho
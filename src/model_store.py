@@ -0,0 +1,73 @@
+import os
+import json
+import time
+import hashlib
+import joblib
+import numpy as np
+
+# Modelos treinados em disco, um arquivo por (tipo de modelo, município):
+#   modelos/<tipo>/<code_muni>-<impressao[:12]>.joblib   (joblib comprimido)
+#   modelos/<tipo>/indice.json                           ({rotulo: metadados})
+# A impressão digital é o sha256 das séries do município usadas no ajuste (casos e
+# preditores), do início do eixo até a última semana publicada. Na atualização
+# semanal, se algum valor antigo mudou (o SINAN revisa semanas passadas, o clima e a
+# população também são corrigidos), o modelo é reajustado do zero; se só chegaram
+# semanas novas, ele é atualizado a partir do estado salvo.
+
+DIRETORIO_PADRAO = "modelos"
+COMPRESSAO = 3
+
+def impressao(serie):
+    """sha256 dos valores float32 de uma série ou matriz (NaN incluído, de forma estável)."""
+    return hashlib.sha256(np.ascontiguousarray(serie, dtype='float32').tobytes()).hexdigest()
+
+def _pasta(tipo, diretorio):
+    return os.path.join(diretorio, tipo)
+
+def _caminho_indice(tipo, diretorio):
+    return os.path.join(_pasta(tipo, diretorio), "indice.json")
+
+def carregar_indice(tipo, diretorio=DIRETORIO_PADRAO):
+    """{rotulo (str): metadados} dos modelos salvos de um tipo."""
+    caminho = _caminho_indice(tipo, diretorio)
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def salvar_indice(tipo, indice, diretorio=DIRETORIO_PADRAO):
+    caminho = _caminho_indice(tipo, diretorio)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, caminho)
+
+def salvar_modelo(tipo, rotulo, modelo, metadados, indice, diretorio=DIRETORIO_PADRAO):
+    """Grava o modelo e atualiza `indice` em memória (persistir com salvar_indice).
+
+    `metadados` precisa ter a 'impressao'; o arquivo anterior do rótulo é removido.
+    """
+    rotulo = str(rotulo)
+    arquivo = f"{rotulo}-{metadados['impressao'][:12]}.joblib"
+    caminho = os.path.join(_pasta(tipo, diretorio), arquivo)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    joblib.dump(modelo, caminho, compress=COMPRESSAO)
+
+    anterior = indice.get(rotulo, {}).get('arquivo')
+    if anterior and anterior != arquivo:
+        try:
+            os.remove(os.path.join(_pasta(tipo, diretorio), anterior))
+        except FileNotFoundError:
+            pass
+    indice[rotulo] = dict(metadados, arquivo=arquivo, atualizado_em=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    return caminho
+
+def carregar_modelo(tipo, rotulo, indice=None, diretorio=DIRETORIO_PADRAO):
+    """Modelo salvo de um município, ou None."""
+    indice = carregar_indice(tipo, diretorio) if indice is None else indice
+    metadados = indice.get(str(rotulo))
+    if metadados is None:
+        return None
+    caminho = os.path.join(_pasta(tipo, diretorio), metadados['arquivo'])
+    return joblib.load(caminho) if os.path.exists(caminho) else None
@@ -0,0 +1,87 @@
+import os
+import numpy as np
+import pandas as pd
+from normalizacao import normalize_series
+
+# Tabela local e compacta dos municípios brasileiros (código, nome normalizado, UF,
+# centroide, bbox e área), gerada uma única vez a partir do geobr e gravada em .npy
+# para ser lida com memory-map, sem importar geopandas na coleta.
+#
+# Gerar (uma vez, precisa do geobr):
+#   python src/municipios_table.py
+
+TABLE_FILE = "municipios_2020.npy"
+
+DTYPE = np.dtype([
+    ('code_muni', 'i4'),
+    ('name_muni', 'U40'),
+    ('abbrev_state', 'U2'),
+    ('code_state', 'i1'),
+    ('latitude', 'f8'),
+    ('longitude', 'f8'),
+    ('xmin', 'f4'),
+    ('ymin', 'f4'),
+    ('xmax', 'f4'),
+    ('ymax', 'f4'),
+    ('area_km2', 'f4'),
+])
+
+_tables = {}
+_state_codes = {}
+
+def build_table(output_file=TABLE_FILE, year=2020):
+    """Gera a tabela a partir do geobr (etapa única; importa geobr/geopandas)."""
+    import geobr
+
+    municipalities = geobr.read_municipality(year=year).sort_values('code_muni')
+    geometry = municipalities.geometry
+    centroids = geometry.centroid
+    bounds = geometry.bounds
+    # Área em projeção equivalente (Albers América do Sul)
+    area = geometry.to_crs('ESRI:102033').area / 1e6
+
+    table = np.empty(len(municipalities), dtype=DTYPE)
+    table['code_muni'] = municipalities['code_muni'].astype('int32').to_numpy()
+    table['name_muni'] = normalize_series(municipalities['name_muni']).to_numpy(dtype='U40')
+    table['abbrev_state'] = municipalities['abbrev_state'].to_numpy()
+    table['code_state'] = municipalities['code_state'].astype('int8').to_numpy()
+    table['latitude'] = centroids.y.to_numpy()
+    table['longitude'] = centroids.x.to_numpy()
+    table['xmin'] = bounds['minx'].to_numpy()
+    table['ymin'] = bounds['miny'].to_numpy()
+    table['xmax'] = bounds['maxx'].to_numpy()
+    table['ymax'] = bounds['maxy'].to_numpy()
+    table['area_km2'] = area.to_numpy()
+
+    np.save(output_file, table)
+    _tables.pop(output_file, None)
+    _state_codes.pop(output_file, None)
+    print(f"Tabela de municípios gravada em {output_file} ({len(table)} municípios).")
+    return output_file
+
+def load_table(table_file=TABLE_FILE):
+    """Abre a tabela com memory-map (ordenada por code_muni)."""
+    if table_file not in _tables:
+        if not os.path.exists(table_file):
+            raise FileNotFoundError(
+                f"Tabela {table_file} não encontrada. Gere com: python src/municipios_table.py"
+            )
+        _tables[table_file] = np.load(table_file, mmap_mode='r')
+    return _tables[table_file]
+
+def municipalities_for_state(abbrev_state, table_file=TABLE_FILE):
+    """Municípios de uma UF como DataFrame (fatia contígua, pois a tabela é ordenada por código)."""
+    table = load_table(table_file)
+    if table_file not in _state_codes:
+        abbrevs, first = np.unique(table['abbrev_state'], return_index=True)
+        _state_codes[table_file] = dict(zip(abbrevs.tolist(), table['code_state'][first].tolist()))
+    code_state = _state_codes[table_file].get(abbrev_state)
+    if code_state is None:
+        return pd.DataFrame(columns=list(DTYPE.names))
+
+    # Códigos IBGE começam pelo código da UF: busca binária no intervalo [UF*100000, (UF+1)*100000)
+    start, end = np.searchsorted(table['code_muni'], [code_state * 100000, (code_state + 1) * 100000])
+    return pd.DataFrame(np.asarray(table[start:end]))
+
+if __name__ == "__main__":
+    build_table()
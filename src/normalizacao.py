@@ -0,0 +1,36 @@
+import re
+import unicodedata
+
+# Normalização de nomes compartilhada pelos coletores, em versão escalar e vetorizada
+# (Series inteiras), e a chave usada para casar nomes de municípios entre fontes.
+
+_PONTUACAO_CHAVE = re.compile(r"[-_./]")
+_APOSTROFOS = re.compile(r"['`´‘’]")
+_ESPACOS = re.compile(r"\s+")
+
+def normalize_text(text, underscore=False):
+    """Normaliza texto para remover acentos (e, com `underscore`, trocar espaços por '_')."""
+    if isinstance(text, str):
+        text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+        return text.replace(' ', '_') if underscore else text
+    return text
+
+def normalize_series(series, underscore=False):
+    """Versão vetorizada de normalize_text para uma Series (do pandas) inteira."""
+    series = series.astype('string').str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+    return series.str.replace(' ', '_', regex=False) if underscore else series
+
+def match_key(text):
+    """Chave de comparação de nomes: sem acentos, apóstrofos e hífens, maiúscula e espaços simples.
+
+    Ex.: "Alta Floresta D'Oeste" e "ALTA_FLORESTA_DOESTE" viram "ALTA FLORESTA DOESTE".
+    """
+    text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+    text = _PONTUACAO_CHAVE.sub(' ', _APOSTROFOS.sub('', text))
+    return _ESPACOS.sub(' ', text).strip().upper()
+
+def match_key_series(series):
+    """Versão vetorizada de match_key."""
+    series = normalize_series(series)
+    series = series.str.replace(_APOSTROFOS, '', regex=True).str.replace(_PONTUACAO_CHAVE, ' ', regex=True)
+    return series.str.replace(_ESPACOS, ' ', regex=True).str.strip().str.upper()
@@ -0,0 +1,292 @@
+import os
+import argparse
+from datetime import date
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+import requests
+from epiweeks import Week
+import localidades
+import epicalendario
+from epicalendario import eixo_semanas, COLUNAS_CLIMA
+import dengue_dataset
+import clima_dataset
+import ibge_pop_data
+import ipea_idhm_data
+
+# Painel denso município × semana epidemiológica, chaveado pelo código IBGE de 7
+# dígitos, que junta as fontes coletadas pelos outros scripts:
+#   casos (dengue_parquet), clima semanal (Meteostat), população interpolada
+#   semana a semana (incidência por 100 mil) e IDHM 2010 (estático).
+# Cada UF é montada em matrizes NumPy (municípios × semanas) e gravada em
+#   painel_parquet/uf=PE/part-0.parquet
+# antes de passar à próxima, então a memória fica limitada ao tamanho de uma UF.
+
+DIRETORIO_PADRAO = "painel_parquet"
+ANOS_POPULACAO = ('2021', '2022', '2023', '2024')
+
+ESQUEMA = pa.schema([
+    ('code_muni', pa.int32()),
+    ('ano_epi', pa.int16()),
+    ('semana_epi', pa.int8()),
+    ('inicio_semana', pa.date32()),
+    ('casos', pa.int32()),
+    ('tavg', pa.float32()),
+    ('tmin', pa.float32()),
+    ('tmax', pa.float32()),
+    ('prcp', pa.float32()),
+    ('dias_tavg', pa.int8()),
+    ('dias_prcp', pa.int8()),
+    ('populacao', pa.float32()),
+    ('incidencia_100k', pa.float32()),
+    ('idhm_2010', pa.float32()),
+])
+
+def _posicoes(valores, referencia):
+    """Posição de cada valor no array ordenado `referencia` e a máscara dos encontrados."""
+    posicoes = np.searchsorted(referencia, valores)
+    posicoes = np.minimum(posicoes, len(referencia) - 1)
+    return posicoes, referencia[posicoes] == valores
+
+def _posicoes_semana(anos_dados, semanas_dados, anos, semanas):
+    """Índice no eixo de semanas de cada par (ano, semana) e a máscara dos encontrados."""
+    chaves_eixo = anos.astype('int32') * 100 + semanas
+    return _posicoes(np.asarray(anos_dados, dtype='int32') * 100 + np.asarray(semanas_dados, dtype='int32'), chaves_eixo)
+
+def matriz_casos(casos, codigos, anos, semanas):
+    """Casos (municípios × semanas, int32) e as semanas cobertas pelos dados do TabNet.
+
+    Dentro de uma semana publicada, município sem linha tem zero casos; semanas
+    fora do que foi coletado ficam marcadas como não cobertas (viram nulo).
+    """
+    matriz = np.zeros((len(codigos), len(anos)), dtype='int32')
+    cobertas = np.zeros(len(anos), dtype=bool)
+    if casos is None or casos.empty:
+        return matriz, cobertas
+
+    casos = casos.dropna(subset=['code_muni'])
+    t, na_semana = _posicoes_semana(casos['Ano'], casos['NumSemana'], anos, semanas)
+    i, no_estado = _posicoes(casos['code_muni'].to_numpy('int32'), codigos)
+    validos = na_semana & no_estado
+
+    plano = np.bincount(i[validos] * len(anos) + t[validos], weights=casos['Casos'].to_numpy('float64')[validos],
+                        minlength=matriz.size)
+    matriz[:] = plano.reshape(matriz.shape)
+    cobertas[t[na_semana]] = True
+    return matriz, cobertas
+
+def matrizes_clima(clima, codigos, anos, semanas):
+    """Clima semanal (epicalendario.agregar_semanal) nas matrizes municípios × semanas.
+
+    Além das medidas, devolve dias_tavg e dias_prcp: quantos dias observados entraram
+    em cada semana (0 quando não há dado, e a medida fica nula).
+    """
+    forma = (len(codigos), len(anos))
+    saida = {coluna: np.full(forma, np.nan, dtype='float32') for coluna in COLUNAS_CLIMA}
+    saida.update({f'dias_{coluna}': np.zeros(forma, dtype='int8') for coluna in ('tavg', 'prcp')})
+    if clima is None or clima.empty:
+        return saida
+
+    semanal = epicalendario.agregar_semanal(clima)
+    t, na_semana = _posicoes_semana(semanal['ano_epi'], semanal['semana_epi'], anos, semanas)
+    i, no_estado = _posicoes(semanal['code_muni'].to_numpy('int32'), codigos)
+    validos = na_semana & no_estado
+    for coluna, matriz in saida.items():
+        matriz[i[validos], t[validos]] = semanal[coluna].to_numpy()[validos]
+    return saida
+
+def matriz_populacao(populacao, codigos, inicios):
+    """População interpolada linearmente semana a semana (municípios × semanas, float32).
+
+    Cada valor anual é tomado como a população de 1º de julho; antes do primeiro e
+    depois do último ano disponível, o valor fica constante.
+    """
+    if populacao is None or populacao.empty:
+        return np.full((len(codigos), len(inicios)), np.nan, dtype='float32')
+
+    tabela = (populacao.pivot_table(index='code_muni', columns='ano', values='populacao', aggfunc='last')
+              .reindex(codigos))
+    tabela = tabela.where(tabela > 0).interpolate(axis=1, limit_direction='both')
+    anos = tabela.columns.to_numpy()
+
+    referencias = np.array([f"{ano}-07-01" for ano in anos], dtype='datetime64[D]').astype('float64')
+    meio_semana = (inicios + 3).astype('float64')
+    posicao = np.interp(meio_semana, referencias, np.arange(len(anos), dtype='float64'))
+    anterior = np.floor(posicao).astype('int64')
+    seguinte = np.minimum(anterior + 1, len(anos) - 1)
+    peso = (posicao - anterior).astype('float32')
+
+    valores = tabela.to_numpy('float32')
+    return valores[:, anterior] * (1 - peso) + valores[:, seguinte] * peso
+
+def carregar_casos(sigla, diretorio=dengue_dataset.DIRETORIO_PADRAO):
+    """Casos da UF gravados por sinan_scrapper --parquet (None se não houver)."""
+    try:
+        return dengue_dataset.carregar(estado=sigla, diretorio=diretorio,
+                                       colunas=['code_muni', 'Ano', 'NumSemana', 'Casos'])
+    except (FileNotFoundError, pa.ArrowInvalid) as e:
+        print(f"Aviso: casos de {sigla} indisponíveis ({e}).")
+        return None
+
+def carregar_clima(sigla, diretorio='.', diretorio_dataset=clima_dataset.DIRETORIO_PADRAO):
+    """Clima diário da UF exportado por meteostat_brazil_data (None se não houver).
+
+    Usa o dataset Parquet (--parquet) se houver; senão, o CSV do estado.
+    """
+    if clima_dataset.arquivos(sigla, diretorio_dataset):
+        return clima_dataset.carregar(sigla, diretorio_dataset, colunas=['date', 'code_muni'] + COLUNAS_CLIMA)
+    nome = localidades.ESTADOS[sigla][0]
+    for prefixo in (sigla, nome.title().replace(' ', '_')):
+        arquivo = os.path.join(diretorio, f"{prefixo}_weather_data_2021_to_now.csv")
+        if os.path.exists(arquivo):
+            return pd.read_csv(arquivo, usecols=['date', 'code_muni'] + COLUNAS_CLIMA)
+    print(f"Aviso: clima de {sigla} não encontrado em {diretorio}.")
+    return None
+
+def carregar_populacao(sigla, anos=ANOS_POPULACAO, populacao_api=None):
+    """População anual da UF (code_muni, ano, populacao) pelas mesmas fontes de ibge_pop_data.
+
+    `populacao_api` é o recorte da UF já baixado da tabela nacional; sem ele, a API é
+    consultada só para a UF.
+    """
+    state_code = localidades.ESTADOS[sigla][1]
+    anos_api = [ano for ano in ibge_pop_data.API_YEARS if ano in anos]
+    if populacao_api is None and anos_api:
+        try:
+            populacao_api = ibge_pop_data.fetch_population_api(anos_api, state_code)
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            print(f"Aviso: população de {sigla} via API indisponível ({e}).")
+
+    frames = []
+    for ano in anos:
+        df = ibge_pop_data.collect_year(sigla, ano, populacao_api)
+        if df is None or df.empty:
+            continue
+        frames.append(pd.DataFrame({
+            'code_muni': pd.to_numeric(df['TERCODIGO'], errors='coerce'),
+            'ano': int(ano),
+            'populacao': df['Populacao'].astype('float64').to_numpy(),
+        }).dropna(subset=['code_muni']))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def carregar_idhm(sigla):
+    """IDHM 2010 da UF como Series indexada pelo código IBGE (None se indisponível)."""
+    try:
+        colunas = ipea_idhm_data.fetch_idhm_state(localidades.ESTADOS[sigla][1])
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"Aviso: IDHM de {sigla} indisponível ({e}).")
+        return None
+    return pd.Series(np.asarray(colunas['IDHM'], dtype='float32'),
+                     index=pd.to_numeric(pd.Series(colunas['TERCODIGO']), errors='coerce'))
+
+def construir_painel_estado(sigla, ano_inicio, ano_fim, casos=None, clima=None, populacao=None, idhm=None,
+                            populacao_api=None):
+    """Monta o painel denso de uma UF como tabela Arrow (uma linha por município e semana).
+
+    As fontes podem ser passadas já carregadas; as que faltarem são lidas com as
+    funções carregar_* acima (a população a partir de `populacao_api`, se dado).
+    Fonte indisponível vira coluna nula, sem interromper.
+    """
+    sigla = sigla.upper()
+    codigos = np.array(sorted(localidades.registro()['por_uf'][sigla]), dtype='int32')
+    anos, semanas, inicios = eixo_semanas(ano_inicio, ano_fim)
+    n_municipios, n_semanas = len(codigos), len(anos)
+
+    casos = carregar_casos(sigla) if casos is None else casos
+    clima = carregar_clima(sigla) if clima is None else clima
+    populacao = carregar_populacao(sigla, populacao_api=populacao_api) if populacao is None else populacao
+    idhm = carregar_idhm(sigla) if idhm is None else idhm
+
+    matriz, cobertas = matriz_casos(casos, codigos, anos, semanas)
+    tempo = matrizes_clima(clima, codigos, anos, semanas)
+    habitantes = matriz_populacao(populacao, codigos, inicios)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        incidencia = (matriz * np.float32(100000) / habitantes).astype('float32')
+    incidencia[:, ~cobertas] = np.nan
+
+    idhm_municipios = np.full(n_municipios, np.nan, dtype='float32')
+    if idhm is not None:
+        idhm_municipios = idhm[~idhm.index.duplicated()].reindex(codigos).to_numpy('float32')
+
+    sem_cobertura = np.broadcast_to(~cobertas, (n_municipios, n_semanas)).ravel()
+    return pa.table({
+        'code_muni': np.repeat(codigos, n_semanas),
+        'ano_epi': np.tile(anos, n_municipios),
+        'semana_epi': np.tile(semanas, n_municipios),
+        'inicio_semana': np.tile(inicios, n_municipios),
+        'casos': pa.array(matriz.ravel(), pa.int32(), mask=sem_cobertura),
+        **{coluna: pa.array(tempo[coluna].ravel(), pa.float32(), from_pandas=True) for coluna in COLUNAS_CLIMA},
+        'dias_tavg': tempo['dias_tavg'].ravel(),
+        'dias_prcp': tempo['dias_prcp'].ravel(),
+        'populacao': pa.array(habitantes.ravel(), pa.float32(), from_pandas=True),
+        'incidencia_100k': pa.array(incidencia.ravel(), pa.float32(), from_pandas=True),
+        'idhm_2010': pa.array(np.repeat(idhm_municipios, n_semanas), pa.float32(), from_pandas=True),
+    }, schema=ESQUEMA)
+
+def caminho_estado(sigla, diretorio=DIRETORIO_PADRAO):
+    return os.path.join(diretorio, f"uf={sigla.upper()}", "part-0.parquet")
+
+def construir_painel(estados, ano_inicio=2021, ano_fim=None, diretorio=DIRETORIO_PADRAO):
+    """Monta e grava o painel UF por UF (só uma UF em memória por vez). Retorna os caminhos."""
+    ano_fim = Week.fromdate(date.today()).year if ano_fim is None else ano_fim
+    estados = [sigla.upper() for sigla in estados]
+    # Com várias UFs, a população da API vem de uma única requisição nacional
+    populacao_api = ibge_pop_data.population_api_by_state(estados, ANOS_POPULACAO)
+    caminhos = []
+    for sigla in estados:
+        tabela = construir_painel_estado(sigla, ano_inicio, ano_fim, populacao_api=populacao_api.get(sigla))
+        caminho = caminho_estado(sigla, diretorio)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        pq.write_table(tabela, caminho, compression='zstd')
+        print(f"Painel de {sigla.upper()}: {tabela.num_rows} linhas em {caminho}")
+        caminhos.append(caminho)
+        del tabela
+    return caminhos
+
+def carregar_painel(estado=None, diretorio=DIRETORIO_PADRAO, colunas=None):
+    """Lê o painel como DataFrame (todas as UFs ou só uma)."""
+    if estado is not None:
+        return pq.read_table(caminho_estado(estado, diretorio), columns=colunas).to_pandas()
+    dataset = ds.dataset(diretorio, format='parquet', partitioning='hive')
+    return dataset.to_table(columns=colunas).to_pandas()
+
+def matrizes(df_painel, variaveis):
+    """Converte o painel (denso) em matrizes município × semana float32.
+
+    Retorna (codigos, chaves, {variavel: matriz}), com os códigos IBGE na ordem das
+    linhas e as semanas das colunas como ano_epi * 100 + semana_epi.
+    """
+    df_painel = df_painel.sort_values(['code_muni', 'ano_epi', 'semana_epi'], kind='stable')
+    codigos = df_painel['code_muni'].drop_duplicates().to_numpy('int32')
+    n_semanas = len(df_painel) // max(len(codigos), 1)
+    if n_semanas * len(codigos) != len(df_painel):
+        raise ValueError("O painel não é denso (municípios com números diferentes de semanas).")
+
+    chaves = (df_painel['ano_epi'].to_numpy('int32')[:n_semanas] * 100
+              + df_painel['semana_epi'].to_numpy('int32')[:n_semanas])
+    return codigos, chaves, {
+        variavel: df_painel[variavel].to_numpy('float32', na_value=np.nan).reshape(len(codigos), n_semanas)
+        for variavel in variaveis
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Painel município × semana (casos, clima, população e IDHM).")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano-inicio', type=int, default=2021)
+    parser.add_argument('--ano-fim', type=int, default=Week.fromdate(date.today()).year)
+    parser.add_argument('--saida', default=DIRETORIO_PADRAO, help=f"diretório do painel (padrão: {DIRETORIO_PADRAO})")
+    args = parser.parse_args(argv)
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.ano_fim < args.ano_inicio:
+        parser.error("--ano-fim não pode ser anterior a --ano-inicio")
+    # TODOS monta o painel nacional, uma UF por vez
+    construir_painel(estados, args.ano_inicio, args.ano_fim, args.saida)
+
+if __name__ == "__main__":
+    main()
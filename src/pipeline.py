@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import argparse
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import diario
+import localidades
+import metricas
+
+# Executor das coletas como um grafo de dependências (DAG), para vários estados
+# numa única execução:
+#
+#   registro (IBGE, uma vez) ──> clima, populacao, idhm   (por UF)
+#   sinan (TabNet, por UF)        independente de tudo
+#
+# Etapas prontas rodam em paralelo; cada fonte tem seu próprio limite de etapas
+# simultâneas (ex.: no máximo 2 estados baixando do TabNet ao mesmo tempo), para
+# não sobrecarregar um servidor enquanto outro fica ocioso. Se uma etapa falha, as
+# que dependem dela são marcadas como ignoradas e o resto continua.
+#
+# No fim, um manifesto JSON lista, por estado, o status, os tempos e os arquivos
+# gerados por cada etapa.
+#
+# Cada etapa concluída (e cada unidade dentro dela: ano do TabNet, município do
+# Meteostat, ano do IBGE) fica no diário cache/diario/pipeline.jsonl. Uma etapa com
+# alguma unidade sem sucesso fica como 'falhou' (com os arquivos que gerou); com
+# --retomar, ela roda de novo e os coletores refazem só as unidades que faltaram.
+#
+# Uso:
+#   python src/pipeline.py PE SP --ano-inicio 2021 --ano-fim 2025
+#   python src/pipeline.py TODOS --etapas sinan,clima --limite tabnet=4 --limite meteostat=2
+#   python src/pipeline.py TODOS --retomar
+
+DIRETORIO_MANIFESTOS = os.path.join("cache", "pipeline")
+ETAPAS_UF = ('sinan', 'clima', 'populacao', 'idhm')
+FONTES = {'registro': 'ibge', 'sinan': 'tabnet', 'clima': 'meteostat', 'populacao': 'ibge', 'idhm': 'ipea'}
+DEPENDENCIAS = {'registro': (), 'sinan': (), 'clima': ('registro',), 'populacao': ('registro',), 'idhm': ('registro',)}
+LIMITES_PADRAO = {'tabnet': 2, 'meteostat': 1, 'ibge': 2, 'ipea': 2}
+LIMITE_PADRAO = 1
+
+class EtapaIncompleta(Exception):
+    """Etapa que gerou arquivos mas deixou unidades sem sucesso."""
+
+    def __init__(self, mensagem, artefatos):
+        super().__init__(mensagem)
+        self.artefatos = list(artefatos)
+
+def _conferir(artefatos, faltam, total, unidade):
+    """Levanta EtapaIncompleta se alguma das `total` unidades da etapa ficou em `faltam`."""
+    if faltam:
+        amostra = ', '.join(str(item) for item in list(faltam)[:10])
+        raise EtapaIncompleta(f"{len(faltam)} de {total} {unidade} sem sucesso: {amostra}", artefatos)
+    return artefatos
+
+def _etapa_registro(uf, parametros):
+    registro = localidades.registro()
+    return [localidades.CACHE_FILE] if registro['por_codigo'] else []
+
+def _etapa_sinan(uf, parametros):
+    import sinan_scrapper
+
+    salvos = sinan_scrapper.coletar_e_salvar([uf], parametros['ano_inicio'], parametros['ano_fim'],
+                                             parquet=parametros['parquet'],
+                                             max_workers=parametros['workers_por_etapa'],
+                                             base_url=parametros['url_tabnet'] or sinan_scrapper.TABNET_URL,
+                                             diario_execucao=parametros.get('diario'))
+    salvo = salvos.get(uf)
+    artefatos = ([salvo] if isinstance(salvo, str) else list(salvo)) if salvo else []
+    if not parametros['parquet'] or not artefatos:
+        return artefatos
+    # Cada ano é uma partição: a etapa só está completa com todas elas
+    import dengue_dataset
+
+    anos = range(parametros['ano_inicio'], parametros['ano_fim'] + 1)
+    diario_execucao = parametros.get('diario')
+    if diario_execucao is not None:
+        faltam = [ano for ano in anos if not diario_execucao.concluida('tabnet', uf, ano)]
+    else:
+        faltam = [ano for ano in anos if not os.path.exists(dengue_dataset.caminho_particao(uf, ano))]
+    return _conferir(artefatos, faltam, len(anos), "anos")
+
+def _etapa_clima(uf, parametros):
+    import meteostat_brazil_data
+
+    salvos = meteostat_brazil_data.collect_and_save([uf], parametros['ano_inicio'], parametros['ano_fim'],
+                                                    max_workers=parametros['workers_por_etapa'],
+                                                    by_station=parametros['por_estacao'],
+                                                    parquet=parametros['parquet'],
+                                                    diario_execucao=parametros.get('diario'))
+    artefatos = list(salvos.values())
+    diario_execucao = parametros.get('diario')
+    if not parametros['parquet'] or not artefatos or diario_execucao is None:
+        return artefatos
+    # Municípios que falharam (ou vieram sem dados) nesta execução ou numa anterior
+    faltam = [codigo for _, _, codigo in diario_execucao.falhas('meteostat', uf)]
+    return _conferir(artefatos, faltam, len(localidades.registro()['por_uf'][uf]), "municípios")
+
+def _etapa_populacao(uf, parametros):
+    import ibge_pop_data
+
+    anos = [str(ano) for ano in range(parametros['ano_inicio'], parametros['ano_fim'] + 1)]
+    # Com vários estados, o recorte sai da tabela nacional (baixada uma vez no processo)
+    populacao_api = ibge_pop_data.population_api_by_state(parametros['estados'], anos).get(uf)
+    artefatos = ibge_pop_data.collect_and_save(uf, anos, parametros.get('diario'), populacao_api)
+    if not artefatos:
+        return artefatos
+    diario_execucao = parametros.get('diario')
+    if diario_execucao is not None:
+        faltam = [ano for ano in anos if not diario_execucao.concluida('ibge', uf, ano)]
+    else:
+        faltam = [ano for ano in anos if not any(caminho.endswith(f"_{ano}.csv") for caminho in artefatos)]
+    return _conferir(artefatos, faltam, len(anos), "anos")
+
+def _etapa_idhm(uf, parametros):
+    import ipea_idhm_data
+
+    if ipea_idhm_data.collect_idhm_data(uf) is None:
+        return []
+    return [ipea_idhm_data.output_file_name(localidades.ESTADOS[uf][0])]
+
+EXECUTORES = {
+    'registro': _etapa_registro,
+    'sinan': _etapa_sinan,
+    'clima': _etapa_clima,
+    'populacao': _etapa_populacao,
+    'idhm': _etapa_idhm,
+}
+
+def montar_tarefas(estados, etapas=ETAPAS_UF):
+    """Nós do DAG: {(etapa, uf): {'etapa', 'uf', 'fonte', 'depende'}}; o registro é um nó único (uf=None)."""
+    tarefas = {}
+    for uf in estados:
+        for etapa in etapas:
+            depende = [(dependencia, None) for dependencia in DEPENDENCIAS[etapa]]
+            tarefas[(etapa, uf)] = {'etapa': etapa, 'uf': uf, 'fonte': FONTES[etapa], 'depende': depende}
+            for dependencia, _ in depende:
+                tarefas.setdefault((dependencia, None), {'etapa': dependencia, 'uf': None,
+                                                         'fonte': FONTES[dependencia], 'depende': []})
+    return tarefas
+
+def _tamanho(caminho):
+    if os.path.isdir(caminho):
+        return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(caminho) for nome in nomes)
+    return os.path.getsize(caminho) if os.path.exists(caminho) else None
+
+def _rodar(tarefa, parametros, executores):
+    """Executa uma etapa e devolve o registro dela para o manifesto (nunca levanta).
+
+    Com um diário em parametros['diario'], uma etapa já concluída na execução
+    anterior não roda de novo (status 'ok', com 'retomada': True) e o resultado de
+    cada etapa executada é registrado nele. Uma etapa incompleta (EtapaIncompleta)
+    fica como 'falhou', mas com os arquivos que chegou a gerar.
+    """
+    inicio = time.time()
+    relogio = time.perf_counter()
+    resultado = {'fonte': tarefa['fonte'], 'inicio': datetime.fromtimestamp(inicio).isoformat(timespec='seconds')}
+    diario_execucao = parametros.get('diario')
+    unidade = ('etapa', tarefa['etapa'], tarefa['uf'])
+    if diario_execucao is not None and diario_execucao.concluida(*unidade):
+        artefatos = diario_execucao.artefatos(*unidade)
+        resultado.update(status='ok', retomada=True, duracao_s=0.0,
+                         artefatos=[{'caminho': caminho, 'bytes': _tamanho(caminho)} for caminho in artefatos])
+        return resultado
+    try:
+        with metricas.contexto(fonte=tarefa['fonte'], uf=tarefa['uf']):
+            artefatos = executores[tarefa['etapa']](tarefa['uf'], parametros)
+        resultado['status'] = 'ok' if artefatos else 'falhou'
+        if not artefatos:
+            resultado['erro'] = "nenhum arquivo gerado"
+        resultado['artefatos'] = [{'caminho': caminho, 'bytes': _tamanho(caminho)} for caminho in artefatos]
+    except EtapaIncompleta as e:
+        resultado.update(status='falhou', erro=str(e),
+                         artefatos=[{'caminho': caminho, 'bytes': _tamanho(caminho)} for caminho in e.artefatos])
+    except Exception as e:
+        resultado.update(status='falhou', erro=f"{type(e).__name__}: {e}", artefatos=[])
+        resultado['traceback'] = traceback.format_exc(limit=5)
+    resultado['duracao_s'] = round(time.perf_counter() - relogio, 3)
+    if diario_execucao is not None:
+        diario_execucao.registrar(unidade, resultado['status'],
+                                  artefatos=[artefato['caminho'] for artefato in resultado['artefatos']],
+                                  erro=resultado.get('erro'))
+    metricas.evento('etapa', etapa=tarefa['etapa'], uf=tarefa['uf'], status=resultado['status'],
+                    duracao_s=resultado['duracao_s'])
+    return resultado
+
+def executar_dag(tarefas, parametros, limites=None, executores=EXECUTORES, max_workers=None):
+    """Executa os nós respeitando as dependências e o limite de concorrência de cada fonte.
+
+    Uma etapa só é submetida quando todas as dependências terminaram com sucesso e a
+    sua fonte está abaixo do limite, sem prender threads esperando em semáforos.
+    Retorna {(etapa, uf): resultado}.
+    """
+    limites = {**LIMITES_PADRAO, **(limites or {})}
+    fontes = {tarefa['fonte'] for tarefa in tarefas.values()}
+    max_workers = max_workers or sum(limites.get(fonte, LIMITE_PADRAO) for fonte in fontes) or 1
+    pendentes = dict(tarefas)
+    resultados = {}
+    em_execucao = {}
+    rodando = {fonte: 0 for fonte in fontes}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pendentes or em_execucao:
+            for chave, tarefa in list(pendentes.items()):
+                falhas = [d for d in tarefa['depende']
+                          if d not in tarefas or resultados.get(d, {}).get('status') in ('falhou', 'ignorada')]
+                if falhas:
+                    resultados[chave] = {'fonte': tarefa['fonte'], 'status': 'ignorada', 'artefatos': [],
+                                         'erro': f"dependência sem sucesso: {', '.join(e for e, _ in falhas)}"}
+                    del pendentes[chave]
+
+            for chave, tarefa in list(pendentes.items()):
+                prontas = all(resultados.get(d, {}).get('status') == 'ok' for d in tarefa['depende'])
+                if prontas and rodando[tarefa['fonte']] < limites.get(tarefa['fonte'], LIMITE_PADRAO):
+                    rodando[tarefa['fonte']] += 1
+                    em_execucao[executor.submit(_rodar, tarefa, parametros, executores)] = chave
+                    del pendentes[chave]
+
+            if not em_execucao:
+                # Nada rodando e nada pronto: só sobraram nós com dependências que nunca terminam
+                for chave, tarefa in pendentes.items():
+                    resultados[chave] = {'fonte': tarefa['fonte'], 'status': 'ignorada', 'artefatos': [],
+                                         'erro': "dependências não satisfeitas"}
+                break
+
+            concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                chave = em_execucao.pop(futuro)
+                rodando[tarefas[chave]['fonte']] -= 1
+                resultados[chave] = futuro.result()
+                print(f"[pipeline] {chave[0]} {chave[1] or ''}: {resultados[chave]['status']} "
+                      f"({resultados[chave]['duracao_s']:.1f} s)")
+    return resultados
+
+def manifesto(resultados, parametros, inicio, fim):
+    """Manifesto da execução: parâmetros, tempos e, por estado, o resultado de cada etapa."""
+    estados = {}
+    globais = {}
+    for (etapa, uf), resultado in sorted(resultados.items(), key=lambda item: (item[0][1] or '', item[0][0])):
+        (globais if uf is None else estados.setdefault(uf, {}))[etapa] = resultado
+    status = [resultado['status'] for resultado in resultados.values()]
+    return {
+        'inicio': datetime.fromtimestamp(inicio).isoformat(timespec='seconds'),
+        'fim': datetime.fromtimestamp(fim).isoformat(timespec='seconds'),
+        'duracao_s': round(fim - inicio, 3),
+        'parametros': parametros,
+        'resumo': {s: status.count(s) for s in ('ok', 'falhou', 'ignorada')},
+        'globais': globais,
+        'estados': estados,
+    }
+
+def gravar_manifesto(dados, caminho):
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    tmp = f"{caminho}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, caminho)
+    return caminho
+
+def executar(estados, ano_inicio, ano_fim, etapas=ETAPAS_UF, limites=None, parquet=True, por_estacao=False,
+             workers_por_etapa=4, url_tabnet=None, caminho_manifesto=None, diario_execucao=None):
+    """Roda as etapas para os estados e grava o manifesto; retorna (manifesto, caminho).
+
+    O `diario_execucao` (opcional) é compartilhado pelas etapas e pelos coletores.
+    """
+    parametros = {'estados': list(estados), 'etapas': list(etapas), 'ano_inicio': ano_inicio, 'ano_fim': ano_fim,
+                  'limites': {**LIMITES_PADRAO, **(limites or {})}, 'parquet': parquet,
+                  'por_estacao': por_estacao, 'workers_por_etapa': workers_por_etapa, 'url_tabnet': url_tabnet,
+                  'diario': diario_execucao.caminho if diario_execucao is not None else None}
+    inicio = time.time()
+    resultados = executar_dag(montar_tarefas(estados, etapas), {**parametros, 'diario': diario_execucao}, limites)
+    dados = manifesto(resultados, parametros, inicio, time.time())
+    caminho_manifesto = caminho_manifesto or os.path.join(
+        DIRETORIO_MANIFESTOS, f"manifesto_{datetime.fromtimestamp(inicio):%Y%m%d_%H%M%S}.json")
+    return dados, gravar_manifesto(dados, caminho_manifesto)
+
+def _limite(texto):
+    fonte, _, valor = texto.partition('=')
+    if fonte not in LIMITES_PADRAO or not valor.isdigit() or int(valor) < 1:
+        raise argparse.ArgumentTypeError(f"use FONTE=N, com FONTE em {', '.join(LIMITES_PADRAO)} e N >= 1")
+    return fonte, int(valor)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coleta de todas as fontes para vários estados, em paralelo.")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano-inicio', type=int, default=2021)
+    parser.add_argument('--ano-fim', type=int, default=datetime.now().year)
+    parser.add_argument('--etapas', default=','.join(ETAPAS_UF), help=f"subconjunto de {','.join(ETAPAS_UF)}")
+    parser.add_argument('--limite', type=_limite, action='append', default=[], metavar='FONTE=N',
+                        help="etapas simultâneas por fonte (repetível; padrão: "
+                             + ', '.join(f"{f}={n}" for f, n in LIMITES_PADRAO.items()) + ")")
+    parser.add_argument('--csv', action='store_true', help="casos e clima em CSV em vez dos datasets Parquet")
+    parser.add_argument('--por-estacao', action='store_true', help="clima por estação do Meteostat")
+    parser.add_argument('--workers-por-etapa', type=int, default=4, help="threads de cada etapa (requisições internas)")
+    parser.add_argument('--url-tabnet', help="endereço do tabcgi.exe (ex.: servidor de tabnet_local)")
+    parser.add_argument('--manifesto', help="caminho do manifesto JSON")
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help="pula etapas e unidades já concluídas na última execução (ver cache/diario)")
+    args = parser.parse_args(argv)
+    if args.retomar and args.csv:
+        parser.error("--retomar exige a saída Parquet (sem --csv)")
+
+    etapas = [etapa.strip() for etapa in args.etapas.split(',') if etapa.strip()]
+    invalidas = [etapa for etapa in etapas if etapa not in ETAPAS_UF]
+    if invalidas:
+        parser.error(f"etapas desconhecidas: {', '.join(invalidas)}")
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+
+    metricas.iniciar('pipeline')
+    diario_execucao = diario.Diario('pipeline', retomar=args.retomar)
+    try:
+        dados, caminho = executar(estados, args.ano_inicio, args.ano_fim, etapas, dict(args.limite),
+                                  parquet=not args.csv, por_estacao=args.por_estacao,
+                                  workers_por_etapa=args.workers_por_etapa, url_tabnet=args.url_tabnet,
+                                  caminho_manifesto=args.manifesto, diario_execucao=diario_execucao)
+    finally:
+        diario_execucao.fechar()
+        metricas.encerrar()
+
+    print(f"\nEtapas: {dados['resumo']['ok']} ok, {dados['resumo']['falhou']} falharam, "
+          f"{dados['resumo']['ignorada']} ignoradas em {dados['duracao_s']:.1f} s.")
+    print(f"Manifesto gravado em {caminho}")
+
+if __name__ == "__main__":
+    main()
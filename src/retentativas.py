@@ -0,0 +1,41 @@
+import time
+import random
+import logging
+import metricas
+
+# Retentativas com espera exponencial e jitter ("full jitter": espera sorteada entre
+# zero e base * 2^tentativa, limitada a um máximo), para as fontes instáveis
+# (TabNet, IBGE, Ipeadata, Meteostat). O sorteio evita que vários workers que
+# falharam juntos voltem todos no mesmo instante.
+
+TENTATIVAS = 4
+ESPERA_BASE = 1.0
+ESPERA_MAXIMA = 60.0
+
+logger = logging.getLogger(__name__)
+
+def espera(tentativa, base=ESPERA_BASE, maxima=ESPERA_MAXIMA, rng=random):
+    """Segundos a esperar depois da falha número `tentativa` (0 = primeira)."""
+    return rng.uniform(0, min(maxima, base * 2 ** tentativa))
+
+def aguardar(tentativa, motivo, minimo=0.0, base=ESPERA_BASE, maxima=ESPERA_MAXIMA):
+    """Conta a retentativa nas métricas, registra o motivo e dorme (pelo menos `minimo` segundos)."""
+    atraso = max(minimo, espera(tentativa, base, maxima))
+    metricas.contar('retentativas')
+    logger.warning("Tentativa %d falhou (%s); nova tentativa em %.1f s.", tentativa + 1, motivo, atraso)
+    time.sleep(atraso)
+    return atraso
+
+def repetir(funcao, *args, tentativas=TENTATIVAS, repetir_em=(Exception,), base=ESPERA_BASE,
+            maxima=ESPERA_MAXIMA, **kwargs):
+    """Chama `funcao(*args, **kwargs)` até `tentativas` vezes, repetindo nas exceções de `repetir_em`.
+
+    A última exceção é propagada.
+    """
+    for tentativa in range(tentativas):
+        try:
+            return funcao(*args, **kwargs)
+        except repetir_em as e:
+            if tentativa == tentativas - 1:
+                raise
+            aguardar(tentativa, f"{type(e).__name__}: {e}", base=base, maxima=maxima)
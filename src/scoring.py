@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import painel
+import features
+import model_store
+import treinamento
+import epicalendario
+
+# Previsão em lote para todos os municípios de uma UF nas próximas N semanas
+# epidemiológicas, com alerta contra um limiar epidêmico.
+#
+# Os modelos lineares salvos (Poisson e SGD, ver treinamento.TIPOS_MODELO) são
+# empilhados em matrizes de parâmetros (municípios × features), e cada horizonte
+# é uma única passada vetorizada para a UF inteira. A previsão é recursiva: os
+# casos previstos para h alimentam as defasagens de h+1; o clima das semanas
+# futuras repete a última semana observada. Preditor ausente entra com a média
+# do treino (valor padronizado zero).
+#
+# Uso:
+#   python src/scoring.py PE --horizonte 4 --saida previsoes_PE.csv
+#   python src/scoring.py --servir --porta 8766
+#   GET http://127.0.0.1:8766/previsao?uf=PE&horizonte=4
+#
+# Meta de latência: p95 abaixo de 100 ms por UF inteira (horizonte 4) com o
+# servidor aquecido, isto é, modelos e painel da UF já carregados em memória
+# (referência: ~18 ms para 645 municípios, o tamanho de SP). A primeira chamada
+# de cada UF inclui a leitura do painel e dos modelos.
+# Meça com: python src/scoring.py SP --medir 50
+
+HORIZONTE_PADRAO = 4
+# Semanas de histórico necessárias para as features (maior janela + folga)
+HISTORICO = max(max(features.LAGS_CASOS), max(features.JANELAS_PRCP), features.JANELA_ANOMALIA) + 2
+
+class ParametrosLineares:
+    """Parâmetros de todos os modelos de uma UF empilhados para inferência vetorizada."""
+
+    def __init__(self, codigos, modelos):
+        n_features = len(features.nomes_features())
+        self.codigos = codigos
+        self.media = np.zeros((len(codigos), n_features), dtype='float64')
+        self.escala = np.ones((len(codigos), n_features), dtype='float64')
+        self.coef = np.zeros((len(codigos), n_features), dtype='float64')
+        self.intercepto = np.zeros(len(codigos), dtype='float64')
+        self.ligacao_log = np.zeros(len(codigos), dtype=bool)
+        self.disponivel = np.zeros(len(codigos), dtype=bool)
+        # Modelos sem forma linear conhecida: previstos um a um
+        self.outros = {}
+
+        for linha, codigo in enumerate(codigos):
+            modelo = modelos.get(int(codigo))
+            if modelo is None:
+                continue
+            parametros = _parametros(modelo)
+            if parametros is None:
+                self.outros[linha] = modelo
+                continue
+            escala, regressor, ligacao_log = parametros
+            self.media[linha] = escala.mean_
+            self.escala[linha] = escala.scale_
+            self.coef[linha] = regressor.coef_
+            self.intercepto[linha] = np.ravel(regressor.intercept_)[0]
+            self.ligacao_log[linha] = ligacao_log
+            self.disponivel[linha] = True
+
+    def prever(self, X):
+        """Previsão (municípios,) para a matriz de preditores X (municípios × features)."""
+        z = (X - self.media) / self.escala
+        z = np.where(np.isfinite(z), z, 0.0)
+        linear = np.einsum('ij,ij->i', z, self.coef) + self.intercepto
+        with np.errstate(over='ignore'):
+            previsao = np.where(self.ligacao_log, np.exp(linear), np.clip(np.expm1(linear), 0, None))
+        previsao[~self.disponivel] = np.nan
+        for linha, modelo in self.outros.items():
+            x = np.where(np.isfinite(X[linha]), X[linha], 0.0)
+            previsao[linha] = modelo.predict(x[None])[0]
+        return previsao
+
+def _parametros(modelo):
+    """(StandardScaler, regressor linear, ligação log?) de um modelo salvo, ou None."""
+    if isinstance(modelo, treinamento.RegressorIncremental):
+        return modelo.escala, modelo.regressor, False
+    passos = getattr(modelo, 'steps', None)
+    if passos and len(passos) == 2 and hasattr(passos[0][1], 'mean_') and hasattr(passos[1][1], 'coef_'):
+        return passos[0][1], passos[1][1], True
+    return None
+
+def carregar_modelos(codigos, tipo='poisson', diretorio=model_store.DIRETORIO_PADRAO):
+    """{code_muni: modelo} dos municípios pedidos que têm modelo salvo."""
+    indice = model_store.carregar_indice(tipo, diretorio)
+    modelos = {}
+    for codigo in codigos:
+        modelo = model_store.carregar_modelo(tipo, int(codigo), indice, diretorio)
+        if modelo is not None:
+            modelos[int(codigo)] = modelo
+    return modelos
+
+def limiar_endemico(casos, desvios=2.0):
+    """Limiar por município: média + `desvios` desvios-padrão dos casos semanais históricos."""
+    with warnings.catch_warnings():
+        # Município sem nenhuma semana publicada: limiar NaN, sem alerta
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(casos, axis=1) + desvios * np.nanstd(casos, axis=1)
+
+def prever(dados, chaves, parametros, horizonte=HORIZONTE_PADRAO, limiar=None):
+    """Previsão recursiva de `horizonte` semanas para todos os municípios de uma vez.
+
+    `dados` são as matrizes município × semana do painel (treinamento.VARIAVEIS).
+    A origem é a última semana com casos publicados. Retorna um dicionário com
+    codigos, semanas (ano_epi * 100 + semana_epi das semanas previstas),
+    previsao (municípios × horizonte, float32), limiar e alerta (previsão > limiar).
+    """
+    publicadas = np.flatnonzero(np.isfinite(dados['casos']).any(axis=0))
+    if len(publicadas) == 0:
+        raise ValueError("O painel não tem nenhuma semana com casos publicados.")
+    origem = publicadas[-1]
+    inicio = max(0, origem + 1 - HISTORICO)
+
+    janela = {variavel: np.empty((matriz.shape[0], origem + 1 - inicio + horizonte), dtype='float32')
+              for variavel, matriz in dados.items()}
+    for variavel, matriz in dados.items():
+        janela[variavel][:, :origem + 1 - inicio] = matriz[:, inicio:origem + 1]
+        # Semanas futuras: clima persistente (última semana observada); casos a prever
+        janela[variavel][:, origem + 1 - inicio:] = (
+            np.nan if variavel == 'casos' else matriz[:, origem:origem + 1])
+
+    previsao = np.empty((len(parametros.codigos), horizonte), dtype='float32')
+    for h in range(horizonte):
+        coluna = origem + 1 - inicio + h
+        bloco = {variavel: matriz[:, :coluna + 1] for variavel, matriz in janela.items()}
+        X = features.gerar(bloco)[:, -1].astype('float64')
+        previsao[:, h] = parametros.prever(X)
+        janela['casos'][:, coluna] = previsao[:, h]
+
+    limiar = limiar_endemico(dados['casos']) if limiar is None else np.broadcast_to(limiar, previsao.shape[:1])
+    return {
+        'codigos': parametros.codigos,
+        'semanas': _semanas_seguintes(int(chaves[origem]), horizonte),
+        'previsao': previsao,
+        'limiar': np.asarray(limiar, dtype='float32'),
+        'alerta': previsao > np.asarray(limiar)[:, None],
+    }
+
+def _semanas_seguintes(chave, horizonte):
+    """Chaves (ano * 100 + semana) das `horizonte` semanas após `chave`."""
+    ano, semana = divmod(chave, 100)
+    anos, semanas, _ = epicalendario.eixo_semanas(ano, ano + 1 + horizonte // 52)
+    posicao = np.flatnonzero((anos == ano) & (semanas == semana))[0]
+    fatia = slice(posicao + 1, posicao + 1 + horizonte)
+    return (anos[fatia].astype('int32') * 100 + semanas[fatia]).tolist()
+
+def para_dataframe(resultado):
+    """Formato longo: uma linha por (município, semana prevista)."""
+    n_municipios, horizonte = resultado['previsao'].shape
+    semanas = np.asarray(resultado['semanas'], dtype='int32')
+    return pd.DataFrame({
+        'code_muni': np.repeat(resultado['codigos'], horizonte),
+        'horizonte': np.tile(np.arange(1, horizonte + 1, dtype='int8'), n_municipios),
+        'ano_epi': np.tile(semanas // 100, n_municipios).astype('int16'),
+        'semana_epi': np.tile(semanas % 100, n_municipios).astype('int8'),
+        'casos_previstos': resultado['previsao'].ravel(),
+        'limiar': np.repeat(resultado['limiar'], horizonte),
+        'alerta': resultado['alerta'].ravel(),
+    })
+
+class Previsor:
+    """Mantém painel e modelos de cada UF em memória para previsões repetidas (servidor)."""
+
+    def __init__(self, tipo='poisson', diretorio_painel=painel.DIRETORIO_PADRAO,
+                 diretorio_modelos=model_store.DIRETORIO_PADRAO):
+        self.tipo = tipo
+        self.diretorio_painel = diretorio_painel
+        self.diretorio_modelos = diretorio_modelos
+        self._estados = {}
+
+    def _versao(self, uf):
+        # Recarrega a UF quando o painel ou o índice de modelos mudam em disco
+        arquivos = [painel.caminho_estado(uf, self.diretorio_painel),
+                    os.path.join(self.diretorio_modelos, self.tipo, "indice.json")]
+        return tuple(os.path.getmtime(a) if os.path.exists(a) else None for a in arquivos)
+
+    def estado(self, uf):
+        uf = uf.upper()
+        versao = self._versao(uf)
+        if uf not in self._estados or self._estados[uf][0] != versao:
+            df_painel = painel.carregar_painel(uf, self.diretorio_painel,
+                                               colunas=['code_muni', 'ano_epi', 'semana_epi'] + list(treinamento.VARIAVEIS))
+            codigos, chaves, dados = painel.matrizes(df_painel, treinamento.VARIAVEIS)
+            modelos = carregar_modelos(codigos, self.tipo, self.diretorio_modelos)
+            self._estados[uf] = (versao, dados, chaves, ParametrosLineares(codigos, modelos))
+        return self._estados[uf][1:]
+
+    def prever(self, uf, horizonte=HORIZONTE_PADRAO, limiar=None):
+        dados, chaves, parametros = self.estado(uf)
+        return prever(dados, chaves, parametros, horizonte, limiar)
+
+def _resposta_json(resultado, uf):
+    return {
+        'uf': uf.upper(),
+        'semanas': resultado['semanas'],
+        'municipios': [
+            {'code_muni': int(codigo),
+             'casos_previstos': [None if np.isnan(v) else round(float(v), 2) for v in linha],
+             'limiar': None if np.isnan(limiar) else round(float(limiar), 2),
+             'alerta': [bool(a) for a in alerta]}
+            for codigo, linha, limiar, alerta in zip(resultado['codigos'], resultado['previsao'],
+                                                     resultado['limiar'], resultado['alerta'])
+        ],
+    }
+
+def criar_servidor(previsor, porta=8766):
+    """Servidor HTTP local: GET /previsao?uf=PE&horizonte=4[&limiar=10]."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/previsao':
+                self.send_error(404)
+                return
+            parametros = parse_qs(url.query)
+            try:
+                uf = parametros['uf'][0]
+                horizonte = int(parametros.get('horizonte', [HORIZONTE_PADRAO])[0])
+                limiar = float(parametros['limiar'][0]) if 'limiar' in parametros else None
+                inicio = time.perf_counter()
+                resultado = previsor.prever(uf, horizonte, limiar)
+                corpo = _resposta_json(resultado, uf)
+                corpo['milissegundos'] = round((time.perf_counter() - inicio) * 1000, 1)
+                status = 200
+            except (KeyError, ValueError) as e:
+                corpo, status = {'erro': str(e)}, 400
+            except FileNotFoundError as e:
+                corpo, status = {'erro': f"painel não encontrado: {e}"}, 404
+            except Exception as e:
+                # Qualquer outra falha (modelo corrompido, painel inconsistente) ainda responde em JSON
+                corpo, status = {'erro': f"{type(e).__name__}: {e}"}, 500
+            dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer(('127.0.0.1', porta), Handler)
+
+def medir_latencia(previsor, uf, horizonte, repeticoes):
+    """Mede a latência da previsão de uma UF com o previsor aquecido; retorna (p50, p95) em ms."""
+    previsor.prever(uf, horizonte)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        previsor.prever(uf, horizonte)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.percentile(tempos, 50)), float(np.percentile(tempos, 95))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Previsão de casos de dengue por município nas próximas semanas.")
+    parser.add_argument('uf', nargs='?', help="Sigla da UF (ex.: PE)")
+    parser.add_argument('--horizonte', type=int, default=HORIZONTE_PADRAO, help="Semanas à frente")
+    parser.add_argument('--tipo', default='poisson', choices=sorted(treinamento.TIPOS_MODELO), help="Tipo de modelo salvo")
+    parser.add_argument('--limiar', type=float, help="Limiar fixo de casos semanais (padrão: média + 2 desvios)")
+    parser.add_argument('--saida', help="CSV de saída (padrão: imprime um resumo)")
+    parser.add_argument('--medir', type=int, metavar='N', help="Mede p50/p95 da latência em N repetições")
+    parser.add_argument('--servir', action='store_true', help="Sobe o endpoint HTTP local")
+    parser.add_argument('--porta', type=int, default=8766)
+    args = parser.parse_args(argv)
+
+    previsor = Previsor(args.tipo)
+    if args.servir:
+        servidor = criar_servidor(previsor, args.porta)
+        print(f"Previsões em http://127.0.0.1:{args.porta}/previsao?uf=PE&horizonte={HORIZONTE_PADRAO}")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            servidor.shutdown()
+        return
+    if not args.uf:
+        parser.error("informe a UF ou use --servir")
+
+    if args.medir:
+        p50, p95 = medir_latencia(previsor, args.uf, args.horizonte, args.medir)
+        print(f"{args.uf.upper()}: p50 {p50:.1f} ms, p95 {p95:.1f} ms ({args.medir} repetições)")
+        return
+
+    df = para_dataframe(previsor.prever(args.uf, args.horizonte, args.limiar))
+    if args.saida:
+        df.to_csv(args.saida, index=False, encoding='utf-8-sig')
+        print(f"Previsões exportadas para {args.saida}")
+    print(f"{df['code_muni'].nunique()} municípios, {int(df['alerta'].sum())} alertas.")
+    print(df.head(10))
+
+if __name__ == "__main__":
+    main()
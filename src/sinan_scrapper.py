@@ -1,15 +1,35 @@
+import os
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import csv
-from urllib.parse import quote_plus
-from datetime import date
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus, urlsplit
+from datetime import date, datetime
+import argparse
 from epiweeks import Week
+import localidades
+import http_cache
+import metricas
+import diario
+import sinan_store
+import tabnet_prn
 
-# Solicitar a sigla do estado
-estado_sigla = input("Digite a sigla do estado (ex: PE, SP, RJ): ").strip().upper()
+# Endereço do TabNet (pode ser trocado por um servidor local, ex.: tabnet_local.py)
+TABNET_URL = "http://tabnet.datasus.gov.br/cgi/tabcgi.exe"
 
-# Função para montar e executar a requisição por ano
-def coletar_dados_ano(ano, estado):
+ESTADOS = list(localidades.ESTADOS)
+
+def criar_sessao(max_conexoes=8):
+    """Cria uma sessão HTTP com keep-alive e pool de conexões compartilhado entre threads."""
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
+
+# Função para montar e executar a requisição por ano (devolve o HTML bruto da resposta)
+def requisitar_pagina_ano(ano, estado, sessao=None, base_url=TABNET_URL, ttl=None):
     sufixo_ano = str(ano)[-2:]  # Ex: 2021 → '21'
     arquivos = f"deng{estado.lower()}{sufixo_ano}.dbf"
 
@@ -28,78 +48,304 @@ def coletar_dados_ano(ano, estado):
         f"formato=prn&mostre=Mostra"
     )
 
-    url = f"http://tabnet.datasus.gov.br/cgi/tabcgi.exe?sinannet/cnv/dengueb{estado.lower()}.def"
+    url = f"{base_url}?sinannet/cnv/dengueb{estado.lower()}.def"
     headers = {
         "Content-Type": "application/x-www-form-urlencoded",
         "User-Agent": "Mozilla/5.0",
     }
 
     try:
-        response = requests.post(url, headers=headers, data=payload.encode("iso-8859-1"))
+        # Sem sessão compartilhada, usa uma conexão por requisição
+        response = http_cache.post(url, data=payload.encode("iso-8859-1"), headers=headers,
+                                   source='tabnet', ttl=ttl, session=sessao, timeout=http_cache.TIMEOUTS['tabnet'],
+                                   valido=lambda resposta: tabnet_prn.tem_tabela(resposta.text))
         response.raise_for_status()
     except requests.RequestException as e:
         print(f"[{ano}] Erro na requisição: {e}")
-        return []
+        return None
+    return response.text
 
-    soup = BeautifulSoup(response.text, "html.parser")
-    pre_tag = soup.find("pre")
-    if not pre_tag:
-        print(f"[{ano}] Tabela não encontrada.")
-        return []
+def coletar_dados_ano(ano, estado, sessao=None, base_url=TABNET_URL, ttl=None):
+    """Baixa e converte a tabela de um ano em colunas (Ano, Semana, Municipio, Casos)."""
+    with metricas.contexto(fonte='tabnet', uf=estado.upper(), ano=ano):
+        pagina = requisitar_pagina_ano(ano, estado, sessao=sessao, base_url=base_url, ttl=ttl)
+        if pagina is None:
+            metricas.contar('erros')
+            return tabnet_prn.tabela_vazia()
+
+        with metricas.span('parse'):
+            tabela = tabnet_prn.parse_prn(pagina, ano)
+        if tabela is None:
+            print(f"[{ano}] Tabela não encontrada.")
+            metricas.contar('erros')
+            return tabnet_prn.tabela_vazia()
+
+        metricas.contar('linhas', tabnet_prn.n_registros(tabela))
+        print(f"[{ano}] {tabnet_prn.n_registros(tabela)} registros coletados para o estado {estado}.")
+        return tabela
+
+def coletar_tarefas(tarefas, max_workers=8, max_por_host=4, base_url=TABNET_URL, ttl=None, ao_concluir=None):
+    """Executa uma fila de tarefas (estado, ano) em paralelo e retorna {(estado, ano): tabela}.
+
+    Usa uma sessão keep-alive compartilhada e limita as conexões simultâneas por host.
+    `ao_concluir(estado, ano, tabela)`, se informado, roda na thread logo que cada par termina.
+    """
+    sessao = criar_sessao(max_conexoes=max(max_workers, max_por_host))
+    limites_host = {}
+    limites_lock = threading.Lock()
+
+    def limite_do_host(url):
+        host = urlsplit(url).netloc
+        with limites_lock:
+            if host not in limites_host:
+                limites_host[host] = threading.BoundedSemaphore(max_por_host)
+            return limites_host[host]
+
+    def executar(estado, ano):
+        with limite_do_host(base_url):
+            tabela = coletar_dados_ano(ano, estado, sessao=sessao, base_url=base_url, ttl=ttl)
+        if ao_concluir is not None:
+            ao_concluir(estado, ano, tabela)
+        return tabela
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {tarefa: executor.submit(executar, *tarefa) for tarefa in tarefas}
+            return {tarefa: futuro.result() for tarefa, futuro in futuros.items()}
+    finally:
+        sessao.close()
+
+def coletar_dados_concorrente(estados, anos, max_workers=8, max_por_host=4, base_url=TABNET_URL):
+    """Coleta vários (estado, ano) em paralelo com sessão keep-alive e limite de conexões por host.
+
+    Retorna um dicionário estado -> tabela colunar, com os anos concatenados em ordem crescente,
+    igual à consolidação feita na coleta sequencial.
+    """
+    # Fila de tarefas (estado, ano); o executor distribui entre os workers
+    tarefas = [(estado.upper(), ano) for estado in estados for ano in anos]
+    resultados = coletar_tarefas(tarefas, max_workers, max_por_host, base_url)
+
+    # Consolida na mesma ordem da coleta sequencial (ano a ano, por estado)
+    return {
+        estado.upper(): tabnet_prn.concatenar(resultados[(estado.upper(), ano)] for ano in anos)
+        for estado in estados
+    }
+
+def coletar_particoes(estados, anos, diario_execucao=None, max_workers=8, max_por_host=4, base_url=TABNET_URL):
+    """Coleta (estado, ano) gravando a partição Parquet de cada par assim que ele chega.
+
+    Cada par é uma unidade do `diario_execucao` (('tabnet', estado, ano)): é registrado ao ser
+    gravado, e os pares já concluídos numa execução anterior são pulados.
+    Retorna {estado: [partições existentes dos anos pedidos]}.
+    """
+    import dengue_dataset
+
+    estados = [estado.upper() for estado in estados]
+    tarefas = [(estado, ano) for estado in estados for ano in anos]
+    if diario_execucao is not None:
+        pendentes = [(estado, ano) for estado, ano in tarefas if not diario_execucao.concluida('tabnet', estado, ano)]
+        if len(pendentes) < len(tarefas):
+            print(f"Retomando: {len(tarefas) - len(pendentes)} pares (estado, ano) já concluídos serão pulados.")
+        tarefas = pendentes
+
+    def gravar(estado, ano, tabela):
+        if not tabnet_prn.n_registros(tabela):
+            if diario_execucao is not None:
+                diario_execucao.registrar(('tabnet', estado, ano), 'falhou', erro="nenhum registro coletado")
+            return
+        try:
+            with metricas.span('write', fonte='tabnet', uf=estado, ano=ano):
+                caminhos = dengue_dataset.salvar_particoes(estado, tabela)
+        except Exception as e:
+            print(f"[{estado} {ano}] Erro ao gravar a partição: {e}")
+            if diario_execucao is not None:
+                diario_execucao.registrar(('tabnet', estado, ano), 'falhou', erro=str(e))
+            return
+        if diario_execucao is not None:
+            diario_execucao.registrar(('tabnet', estado, ano), 'ok', artefatos=caminhos,
+                             linhas=tabnet_prn.n_registros(tabela))
+
+    coletar_tarefas(tarefas, max_workers, max_por_host, base_url, ao_concluir=gravar)
+
+    particoes = {}
+    for estado in estados:
+        particoes[estado] = [caminho for caminho in (dengue_dataset.caminho_particao(estado, ano) for ano in anos)
+                             if os.path.exists(caminho)]
+        print(f"{len(particoes[estado])} de {len(anos)} partições de {estado} em "
+              f"{dengue_dataset.DIRETORIO_PADRAO}/uf={estado}")
+    return particoes
+
+def numero_semana(semana):
+    """Extrai o número da semana de um rótulo do TabNet (ex.: 'SEMANA 07' -> 7)."""
+    digitos = ''.join(c for c in semana if c.isdigit())
+    return int(digitos) if digitos else None
+
+def semanas_desde(ultima, hoje, janela_semanas):
+    """Semanas {(ano, semana)} a atualizar desde a sincronização em `ultima` até `hoje`.
+
+    É a janela final de `janela_semanas` semanas, estendida para trás até cobrir a
+    janela da última sincronização: as semanas publicadas entre duas execuções
+    (ex.: depois de uma noite sem rodar ou na virada do ano) não se perdem.
+    """
+    semana_atual = Week.fromdate(hoje)
+    semana = min(semana_atual, Week.fromdate(ultima)) - (janela_semanas - 1)
+    semanas = set()
+    while semana <= semana_atual:
+        semanas.add((semana.year, semana.week))
+        semana += 1
+    return semanas
+
+def sincronizar_estados(conn, estados, ano_inicio=2021, janela_semanas=4, hoje=None,
+                        max_workers=8, max_por_host=4, base_url=TABNET_URL, ano_fim=None):
+    """Sincroniza incrementalmente o banco local com o TabNet.
+
+    Anos nunca sincronizados são baixados inteiros. Dos anos já presentes, só os que
+    ainda estão abertos (os que têm semanas desde a última sincronização, ver
+    semanas_desde) são consultados de novo, e apenas essas semanas são atualizadas
+    no banco. Anos depois de `ano_fim` (se informado) ficam de fora.
+    """
+    # A sincronização fica registrada no dia `hoje` (quando informado) para que a
+    # próxima janela parta dele
+    momento = datetime.now() if hoje is None else datetime.combine(hoje, datetime.min.time())
+    hoje = hoje or date.today()
+    ano_atual = Week.fromdate(hoje).year
+    ano_fim = ano_atual if ano_fim is None else min(ano_fim, ano_atual)
+
+    tarefas = []
+    janelas = {}
+    for estado in estados:
+        estado = estado.upper()
+        for ano in range(ano_inicio, ano_fim + 1):
+            ultima = sinan_store.ultima_sincronizacao(conn, estado, ano)
+            if ultima is None:
+                tarefas.append((estado, ano))
+                continue
+            janela = semanas_desde(ultima.date(), hoje, janela_semanas)
+            if any(ano_semana == ano for ano_semana, _ in janela):
+                tarefas.append((estado, ano))
+                janelas[(estado, ano)] = janela
+
+    print(f"Sincronizando {len(tarefas)} pares (estado, ano); janela de {janela_semanas} semanas.")
+    # A sincronização sempre consulta o TabNet de novo (ttl=0) para pegar o backfill
+    resultados = coletar_tarefas(tarefas, max_workers, max_por_host, base_url, ttl=0)
+
+    for (estado, ano), tabela in resultados.items():
+        if not tabnet_prn.n_registros(tabela):
+            # Falha na coleta: não marca como sincronizado para tentar de novo na próxima execução
+            continue
+        if (estado, ano) in janelas:
+            # Decide uma vez por rótulo de semana, não por registro
+            janela = janelas[(estado, ano)]
+            rotulos = {s for s in set(tabela['Semana']) if (ano, numero_semana(s)) in janela}
+            semanas = tabela['Semana']
+            tabela = tabnet_prn.filtrar(tabela, lambda i: semanas[i] in rotulos)
+        n = sinan_store.upsert_registros(conn, estado, tabnet_prn.linhas(tabela))
+        sinan_store.registrar_sincronizacao(conn, estado, ano, momento)
+        print(f"[{estado} {ano}] {n} registros atualizados no banco local.")
+    return tarefas
+
+def salvar_dados_estado(estado_sigla, tabela, ano_atual, ano_inicio=2021):
+    """Salva a tabela de um estado em um único CSV e exibe o resumo."""
+    # Verifica se houve dados encontrados
+    if not tabnet_prn.n_registros(tabela):
+        print(f"\nNenhum dado encontrado para o estado '{estado_sigla}'. Verifique a sigla ou a conexão.")
+        return None
 
-    table_data = pre_tag.text.strip().splitlines()
-
-    if table_data[-1].endswith('&'):
-        table_data[-1] = table_data[-1][:-1]
-
-    semanas = []
-    dados = []
-
-    for i, line in enumerate(table_data):
-        row = [item.strip('"') for item in line.split(';')]
-
-        if i == 0:
-            semanas = row[1:]
-        else:
-            municipio = row[0].strip().upper()
-            valores = row[1:]
-            for idx, val in enumerate(valores):
-                semana = semanas[idx].strip().upper()
-                if semana == 'TOTAL':  # Ignora a linha total na coluna semana
-                    continue
-                valor = val.strip()
-                if valor == '' or valor == '-':
-                    valor = '0'
-                dados.append([ano, semana, municipio, valor])
-    print(f"[{ano}] {len(dados)} registros coletados para o estado {estado}.")
-    return dados
-
-# Obtém o ano e semana epidemiológica atuais
-hoje = date.today()
-semana_epi = Week.fromdate(hoje)
-ano_atual = semana_epi.year
-
-# Coleta e consolida os dados de todos os anos
-todos_dados = []
-for ano in range(2021, ano_atual + 1):
-    dados_ano = coletar_dados_ano(ano, estado_sigla)
-    todos_dados.extend(dados_ano)
-
-# Verifica se houve dados encontrados
-if not todos_dados:
-    print(f"\nNenhum dado encontrado para o estado '{estado_sigla}'. Verifique a sigla ou a conexão.")
-else:
     # Contar municípios únicos
-    municipios_unicos = sorted(set([row[2] for row in todos_dados]))
+    municipios_unicos = sorted(set(tabela['Municipio']))
     print(f"\nEncontrados {len(municipios_unicos)} municípios únicos no estado {estado_sigla}.")
 
     # Salva todos os dados em um único arquivo CSV
-    nome_arquivo = f"dengue_{estado_sigla}_todos_municipios_2021-{ano_atual}.csv"
-    with open(nome_arquivo, mode='w', newline='', encoding='utf-8') as file:
+    nome_arquivo = f"dengue_{estado_sigla}_todos_municipios_{ano_inicio}-{ano_atual}.csv"
+    with metricas.span('write', fonte='tabnet', uf=estado_sigla), \
+            open(nome_arquivo, mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file, delimiter=';')
         writer.writerow(["Ano", "Semana", "Municipio", "Casos"])
-        writer.writerows(todos_dados)
+        writer.writerows(tabnet_prn.linhas(tabela))
 
     print(f"\nArquivo final salvo como: {nome_arquivo}")
-    print(f"Total de registros: {len(todos_dados)}")
-    print(f"Total de municípios: {len(municipios_unicos)}")
\ No newline at end of file
+    print(f"Total de registros: {tabnet_prn.n_registros(tabela)}")
+    print(f"Total de municípios: {len(municipios_unicos)}")
+    return nome_arquivo
+
+def salvar_parquet_estado(estado_sigla, tabela):
+    """Grava a tabela do estado no dataset Parquet particionado por estado e ano."""
+    import dengue_dataset
+
+    if not tabnet_prn.n_registros(tabela):
+        print(f"\nNenhum dado encontrado para o estado '{estado_sigla}'. Verifique a sigla ou a conexão.")
+        return []
+    with metricas.span('write', fonte='tabnet', uf=estado_sigla):
+        caminhos = dengue_dataset.salvar_particoes(estado_sigla, tabela)
+    print(f"\n{len(caminhos)} partições gravadas para {estado_sigla} em {dengue_dataset.DIRETORIO_PADRAO}/uf={estado_sigla}")
+    return caminhos
+
+def coletar_e_salvar(estados, ano_inicio, ano_fim, parquet=False, sincronizar=False, hoje=None,
+                     max_workers=8, base_url=TABNET_URL, diario_execucao=None):
+    """Coleta (ou sincroniza com o banco local) os estados e grava um CSV ou Parquet por estado.
+
+    Em Parquet (sem sincronizar), cada (estado, ano) é gravado e registrado no
+    `diario_execucao` assim que chega, e uma execução retomada pula os já concluídos.
+    Retorna {estado: arquivo CSV ou lista de partições Parquet}.
+    """
+    # Formato de saída: CSV (padrão) ou Parquet particionado
+    def salvar(estado, tabela):
+        if parquet:
+            return salvar_parquet_estado(estado, tabela)
+        return salvar_dados_estado(estado, tabela, ano_fim, ano_inicio)
+
+    estados = [estado.upper() for estado in estados]
+    if sincronizar:
+        # Modo incremental: atualiza o banco local e exporta o CSV a partir dele
+        conn = sinan_store.abrir_store()
+        try:
+            sincronizar_estados(conn, estados, ano_inicio=ano_inicio, hoje=hoje,
+                                max_workers=max_workers, base_url=base_url, ano_fim=ano_fim)
+            return {estado: salvar(estado, sinan_store.carregar_tabela(conn, estado, ano_inicio, ano_fim))
+                    for estado in estados}
+        finally:
+            conn.close()
+
+    # Coleta e consolida os dados de todos os anos
+    anos = list(range(ano_inicio, ano_fim + 1))
+    if parquet:
+        return coletar_particoes(estados, anos, diario_execucao, max_workers=max_workers, base_url=base_url)
+    todos_por_estado = coletar_dados_concorrente(estados, anos, max_workers=max_workers, base_url=base_url)
+    return {estado: salvar(estado, tabela) for estado, tabela in todos_por_estado.items()}
+
+def main(argv=None):
+    # Ano epidemiológico atual (padrão para o fim do intervalo)
+    ano_atual = Week.fromdate(date.today()).year
+
+    parser = argparse.ArgumentParser(description="Casos prováveis de dengue por município e semana (TabNet/SINAN).")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--ano-inicio', type=int, default=2021)
+    parser.add_argument('--ano-fim', type=int, default=ano_atual)
+    parser.add_argument('--parquet', action='store_true', help="grava o dataset Parquet particionado em vez do CSV")
+    parser.add_argument('--sincronizar', action='store_true',
+                        help="atualiza incrementalmente o banco local e exporta a partir dele")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--url', default=TABNET_URL, help="endereço do tabcgi.exe (ex.: servidor de tabnet_local)")
+    parser.add_argument('--retomar', '--resume', action='store_true',
+                        help="refaz só os pares (estado, ano) que faltam ou falharam na última execução (exige --parquet)")
+    args = parser.parse_args(argv)
+    if args.retomar and (not args.parquet or args.sincronizar):
+        parser.error("--retomar exige --parquet (cada ano gravado é um ponto de retomada) e não combina com --sincronizar")
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+
+    metricas.iniciar('sinan')
+    diario_execucao = diario.Diario('sinan', retomar=args.retomar)
+    try:
+        coletar_e_salvar(estados, args.ano_inicio, args.ano_fim, parquet=args.parquet,
+                         sincronizar=args.sincronizar, max_workers=args.workers, base_url=args.url,
+                         diario_execucao=diario_execucao)
+    finally:
+        diario_execucao.fechar()
+        metricas.encerrar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import sqlite3
+import sys
+from array import array
+from datetime import datetime
+
+# Armazenamento local dos casos de dengue (Ano, Semana, Municipio, Casos) por estado,
+# usado pela sincronização incremental do sinan_scrapper.
+
+ARQUIVO_PADRAO = "sinan_dengue.sqlite"
+
+def abrir_store(caminho=ARQUIVO_PADRAO):
+    """Abre (ou cria) o banco local com as tabelas de casos e de controle de sincronização."""
+    conn = sqlite3.connect(caminho)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS casos (
+            uf TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            semana TEXT NOT NULL,
+            municipio TEXT NOT NULL,
+            casos INTEGER NOT NULL,
+            PRIMARY KEY (uf, ano, semana, municipio)
+        );
+        CREATE TABLE IF NOT EXISTS sincronizacoes (
+            uf TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            sincronizado_em TEXT NOT NULL,
+            PRIMARY KEY (uf, ano)
+        );
+    """)
+    return conn
+
+def upsert_registros(conn, estado, registros):
+    """Insere ou atualiza registros [ano, semana, municipio, casos] de um estado."""
+    with conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO casos (uf, ano, semana, municipio, casos) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (uf, ano, semana, municipio) DO UPDATE SET casos = excluded.casos
+            """,
+            ((estado, int(ano), semana, municipio, int(casos)) for ano, semana, municipio, casos in registros)
+        )
+    return cursor.rowcount
+
+def registrar_sincronizacao(conn, estado, ano, momento=None):
+    """Guarda quando o par (estado, ano) foi sincronizado pela última vez."""
+    momento = momento or datetime.now()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO sincronizacoes (uf, ano, sincronizado_em) VALUES (?, ?, ?)
+            ON CONFLICT (uf, ano) DO UPDATE SET sincronizado_em = excluded.sincronizado_em
+            """,
+            (estado, int(ano), momento.isoformat(timespec='seconds'))
+        )
+
+def ultima_sincronizacao(conn, estado, ano):
+    """Retorna o datetime da última sincronização de (estado, ano) ou None."""
+    linha = conn.execute(
+        "SELECT sincronizado_em FROM sincronizacoes WHERE uf = ? AND ano = ?", (estado, int(ano))
+    ).fetchone()
+    return datetime.fromisoformat(linha[0]) if linha else None
+
+def carregar_tabela(conn, estado, ano_inicio=None, ano_fim=None):
+    """Lê os registros de um estado como tabela colunar (mesmo formato de tabnet_prn.parse_prn)."""
+    consulta = "SELECT ano, semana, municipio, casos FROM casos WHERE uf = ?"
+    parametros = [estado]
+    if ano_inicio is not None:
+        consulta += " AND ano >= ?"
+        parametros.append(int(ano_inicio))
+    if ano_fim is not None:
+        consulta += " AND ano <= ?"
+        parametros.append(int(ano_fim))
+    consulta += " ORDER BY ano, municipio, semana"
+
+    tabela = {'Ano': array('h'), 'Semana': [], 'Municipio': [], 'Casos': array('i')}
+    for ano, semana, municipio, casos in conn.execute(consulta, parametros):
+        tabela['Ano'].append(ano)
+        tabela['Semana'].append(sys.intern(semana))
+        tabela['Municipio'].append(sys.intern(municipio))
+        tabela['Casos'].append(casos)
+    return tabela
@@ -0,0 +1,98 @@
+import os
+import re
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import localidades
+
+# Servidor local que imita o tabcgi.exe do TabNet para testes e benchmarks sem rede.
+# Responde ao mesmo POST feito por sinan_scrapper.coletar_dados_ano, devolvendo
+# uma página com a tabela no formato PRN dentro de <pre>.
+
+def gerar_pagina_prn(estado, ano, n_municipios=185, n_semanas=52):
+    """Gera uma página HTML determinística no formato PRN do TabNet."""
+    rng = random.Random(f"{estado.upper()}-{ano}")
+    codigo_uf = localidades.ESTADOS.get(estado.upper(), (None, '99'))[1]
+
+    semanas = [f"Semana {s:02d}" for s in range(1, n_semanas + 1)]
+    linhas = ['"Município de notificação";' + ';'.join(f'"{s}"' for s in semanas) + ';"Total"']
+    totais = [0] * n_semanas
+    for m in range(n_municipios):
+        codigo = f"{codigo_uf}{m * 5 + 5:04d}"
+        valores = []
+        for s in range(n_semanas):
+            casos = rng.choice([0, 0, 0, rng.randint(1, 40)])
+            totais[s] += casos
+            valores.append(str(casos) if casos else '-')
+        total = sum(int(v) for v in valores if v != '-')
+        linhas.append(f'"{codigo} MUNICIPIO {m + 1:03d}";' + ';'.join(valores) + f';{total}')
+    linhas.append('"Total";' + ';'.join(str(t) for t in totais) + f';{sum(totais)}')
+
+    return (
+        "<html><head><title>TabNet Win32 3.0</title></head><body>\n"
+        "<center>PROVÁVEIS CASOS DE DENGUE</center>\n"
+        "<PRE>\n" + '\n'.join(linhas) + "\n&</PRE>\n"
+        "</body></html>\n"
+    )
+
+class TabnetHandler(BaseHTTPRequestHandler):
+    """Responde POSTs no formato do tabcgi.exe com páginas geradas ou gravadas."""
+
+    diretorio_gravacoes = None
+    atraso = 0.0
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = self.rfile.read(tamanho).decode('iso-8859-1')
+        campos = parse_qs(corpo, encoding='iso-8859-1')
+
+        # Arquivos=dengpe21.dbf -> estado 'pe', ano 2021
+        arquivo = campos.get('Arquivos', [''])[0]
+        match = re.match(r'deng([a-z]{2})(\d{2})\.dbf', arquivo)
+        if not self.path.startswith('/cgi/tabcgi.exe') or not match:
+            self.send_error(404)
+            return
+        estado, ano = match.group(1), 2000 + int(match.group(2))
+
+        if self.atraso:
+            time.sleep(self.atraso)
+
+        pagina = None
+        if self.diretorio_gravacoes:
+            gravacao = os.path.join(self.diretorio_gravacoes, f"dengueb{estado}_{ano}.html")
+            if os.path.exists(gravacao):
+                with open(gravacao, encoding='iso-8859-1') as f:
+                    pagina = f.read()
+        if pagina is None:
+            pagina = gerar_pagina_prn(estado, ano)
+
+        dados = pagina.encode('iso-8859-1')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=iso-8859-1')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, format, *args):
+        pass
+
+def iniciar_servidor(porta=0, diretorio_gravacoes=None, atraso=0.0):
+    """Sobe o servidor em uma thread e retorna (servidor, base_url) para usar em coletar_dados_ano."""
+    handler = type('TabnetHandlerConfigurado', (TabnetHandler,), {
+        'diretorio_gravacoes': diretorio_gravacoes,
+        'atraso': atraso,
+    })
+    servidor = ThreadingHTTPServer(('127.0.0.1', porta), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{servidor.server_address[1]}/cgi/tabcgi.exe"
+    return servidor, base_url
+
+if __name__ == "__main__":
+    servidor, base_url = iniciar_servidor(porta=8765)
+    print(f"TabNet local em {base_url} (Ctrl+C para encerrar)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
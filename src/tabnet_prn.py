@@ -0,0 +1,136 @@
+import re
+import sys
+import html
+from array import array
+
+# Parser das respostas do TabNet no formato PRN (tabela separada por ';' dentro de <pre>).
+# Evita montar o DOM inteiro com BeautifulSoup e já devolve colunas tipadas:
+#   'Ano' e 'Casos' como array de inteiros, 'Semana' e 'Municipio' como listas de
+#   rótulos internados (cada rótulo existe uma única vez na memória).
+
+COLUNAS = ['Ano', 'Semana', 'Municipio', 'Casos']
+
+_INICIO_PRE = re.compile(r'<pre[^>]*>', re.IGNORECASE)
+_FIM_PRE = re.compile(r'</pre\s*>', re.IGNORECASE)
+
+def tabela_vazia():
+    """Retorna uma tabela colunar sem registros."""
+    return {'Ano': array('h'), 'Semana': [], 'Municipio': [], 'Casos': array('i')}
+
+def n_registros(tabela):
+    """Número de registros de uma tabela colunar."""
+    return len(tabela['Casos'])
+
+def tem_tabela(pagina):
+    """True se a página tem um bloco <pre> (o TabNet responde erros com HTTP 200 e sem tabela)."""
+    return _INICIO_PRE.search(pagina) is not None
+
+def extrair_pre(pagina):
+    """Retorna o texto do primeiro bloco <pre> da página, ou None se não houver."""
+    inicio = _INICIO_PRE.search(pagina)
+    if not inicio:
+        return None
+    fim = _FIM_PRE.search(pagina, inicio.end())
+    bloco = pagina[inicio.end():fim.start() if fim else len(pagina)]
+    return html.unescape(bloco) if '&' in bloco else bloco
+
+def _para_inteiro(valor):
+    """Contagem de uma célula; vazia, '-' ou qualquer outro texto não numérico vale 0."""
+    valor = valor.strip().strip('"')
+    if valor == '' or valor == '-':
+        return 0
+    try:
+        return int(valor)
+    except ValueError:
+        pass
+    try:
+        # Separador de milhar eventual (ex.: '1.234')
+        return int(valor.replace('.', ''))
+    except ValueError:
+        # Marcadores como '...' ou '?': sem contagem publicada, como '-'
+        return 0
+
+class _CacheInteiros(dict):
+    """Dicionário texto -> inteiro que converte (e guarda) só na primeira ocorrência.
+
+    As contagens se repetem muito ('-', '1', '2', ...), então quase toda célula vira
+    uma consulta ao dicionário em vez de strip + int.
+    """
+
+    def __missing__(self, valor):
+        inteiro = self[valor] = _para_inteiro(valor)
+        return inteiro
+
+def parse_prn(pagina, ano):
+    """Converte a página PRN de um ano em uma tabela colunar (Ano, Semana, Municipio, Casos)."""
+    bloco = extrair_pre(pagina)
+    if bloco is None:
+        return None
+
+    linhas = bloco.strip().splitlines()
+    if not linhas:
+        return tabela_vazia()
+    if linhas[-1].endswith('&'):
+        linhas[-1] = linhas[-1][:-1]
+
+    # Cabeçalho: rótulos das semanas, ignorando a coluna de total
+    cabecalho = linhas[0].split(';')[1:]
+    semanas = [sys.intern(s.strip('"').strip().upper()) for s in cabecalho]
+    indices = [i for i, s in enumerate(semanas) if s != 'TOTAL']
+    semanas_validas = [semanas[i] for i in indices]
+
+    # Caso comum: o total é a última coluna, então basta fatiar a linha
+    n_semanas = len(semanas)
+    contiguo = indices == list(range(len(indices)))
+    n_validas = len(indices)
+
+    inteiros = _CacheInteiros()
+    semana_col = []
+    municipio_col = []
+    casos_col = array('i')
+    for linha in linhas[1:]:
+        campos = linha.split(';')
+        municipio = sys.intern(campos[0].strip('"').strip().upper())
+        if len(campos) > n_semanas:
+            if contiguo:
+                casos_col.extend([inteiros[v] for v in campos[1:n_validas + 1]])
+            else:
+                casos_col.extend([inteiros[campos[i + 1]] for i in indices])
+            semana_col.extend(semanas_validas)
+            municipio_col.extend([municipio] * n_validas)
+        else:
+            # Linha truncada: mantém só as semanas presentes
+            for i in indices:
+                if i + 1 < len(campos):
+                    casos_col.append(inteiros[campos[i + 1]])
+                    semana_col.append(semanas[i])
+                    municipio_col.append(municipio)
+
+    return {
+        'Ano': array('h', [ano]) * len(casos_col),
+        'Semana': semana_col,
+        'Municipio': municipio_col,
+        'Casos': casos_col,
+    }
+
+def concatenar(tabelas):
+    """Concatena tabelas colunares na ordem recebida."""
+    resultado = tabela_vazia()
+    for tabela in tabelas:
+        for coluna in COLUNAS:
+            resultado[coluna].extend(tabela[coluna])
+    return resultado
+
+def filtrar(tabela, manter):
+    """Retorna só os registros cujo índice satisfaz `manter(i)`."""
+    indices = [i for i in range(n_registros(tabela)) if manter(i)]
+    return {
+        'Ano': array('h', [tabela['Ano'][i] for i in indices]),
+        'Semana': [tabela['Semana'][i] for i in indices],
+        'Municipio': [tabela['Municipio'][i] for i in indices],
+        'Casos': array('i', [tabela['Casos'][i] for i in indices]),
+    }
+
+def linhas(tabela):
+    """Itera os registros como [ano, semana, municipio, casos] (formato do CSV)."""
+    return map(list, zip(tabela['Ano'], tabela['Semana'], tabela['Municipio'], tabela['Casos']))
@@ -0,0 +1,279 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sklearn.linear_model import PoissonRegressor, SGDRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+import localidades
+import painel
+import features
+import model_store
+
+# Treino de um modelo por município (ou por grupo de municípios) sobre a série
+# semanal de casos do painel, em um pool de processos.
+#
+# O painel é convertido uma vez num cubo float32 (variável × município × semana)
+# gravado em .npy; cada processo abre o arquivo com memory-map na inicialização e
+# as tarefas levam só os índices das linhas, sem serializar o painel a cada envio.
+# Uma série que falha vira uma linha de erro no relatório, sem derrubar o lote.
+#
+# atualizar_semanal() mantém os modelos em model_store: ajusta os que não existem,
+# atualiza a partir do modelo salvo os que só ganharam semanas novas (partial_fit
+# ou warm start) e reajusta do zero os que tiveram semanas antigas revisadas.
+
+VARIAVEIS = ('casos', 'tavg', 'tmin', 'tmax', 'prcp', 'populacao')
+MIN_AMOSTRAS = 20
+
+_cubo = None
+
+def cubo_do_painel(df_painel, arquivo):
+    """Grava o painel (denso, uma linha por município e semana) como cubo .npy.
+
+    Retorna (arquivo, codigos, chaves): os códigos IBGE na ordem das linhas do cubo
+    e as semanas das colunas como ano_epi * 100 + semana_epi.
+    """
+    codigos, chaves, dados = painel.matrizes(df_painel, VARIAVEIS)
+    cubo = np.lib.format.open_memmap(arquivo, mode='w+', dtype='float32',
+                                     shape=(len(VARIAVEIS),) + dados['casos'].shape)
+    for k, variavel in enumerate(VARIAVEIS):
+        cubo[k] = dados[variavel]
+    cubo.flush()
+    del cubo
+    return arquivo, codigos, chaves
+
+def _abrir_cubo(arquivo):
+    """Inicializador dos processos: abre o cubo uma vez, só leitura."""
+    global _cubo
+    _cubo = np.load(arquivo, mmap_mode='r')
+
+def amostras(cubo, linhas, desde=0):
+    """Matriz de preditores (features.gerar) e alvo das linhas (municípios) pedidas, empilhadas.
+
+    Os preditores da semana t usam só semanas anteriores; o alvo são os casos em t.
+    Com `desde`, só entram as semanas a partir dessa coluna (o histórico anterior
+    ainda alimenta as defasagens). Semanas com qualquer valor ausente ficam de fora.
+    """
+    matrizes = {variavel: np.asarray(cubo[k, linhas]) for k, variavel in enumerate(VARIAVEIS)}
+    tensor = features.gerar(matrizes)[:, desde:]
+    X = tensor.reshape(-1, tensor.shape[-1])
+    y = matrizes['casos'][:, desde:].reshape(-1)
+    validas = np.isfinite(X).all(axis=1) & np.isfinite(y)
+    return X[validas], y[validas]
+
+class RegressorIncremental:
+    """SGDRegressor sobre log1p(casos) com padronização, atualizável com partial_fit."""
+
+    def __init__(self):
+        self.escala = StandardScaler()
+        self.regressor = SGDRegressor(alpha=1e-4, learning_rate='invscaling', eta0=0.01, max_iter=1000, tol=1e-4)
+
+    def fit(self, X, y):
+        self.regressor.fit(self.escala.fit_transform(X), np.log1p(y))
+        return self
+
+    def partial_fit(self, X, y):
+        self.escala.partial_fit(X)
+        self.regressor.partial_fit(self.escala.transform(X), np.log1p(y))
+        return self
+
+    def predict(self, X):
+        return np.clip(np.expm1(self.regressor.predict(self.escala.transform(X))), 0, None)
+
+def _poisson():
+    # warm_start: na atualização, o ajuste parte dos coeficientes salvos
+    return make_pipeline(StandardScaler(), PoissonRegressor(alpha=1e-3, max_iter=300, warm_start=True))
+
+# Tipos de modelo disponíveis: os com partial_fit são atualizados só com as semanas
+# novas; os demais são reajustados na série inteira partindo do modelo salvo.
+TIPOS_MODELO = {
+    'poisson': _poisson,
+    'sgd': RegressorIncremental,
+}
+
+def criar_modelo(tipo='poisson'):
+    """Modelo novo do tipo pedido (ver TIPOS_MODELO)."""
+    return TIPOS_MODELO[tipo]()
+
+def _treinar_tarefa(rotulo, linhas, tipo='poisson', modelo=None, desde=0):
+    """Executa no processo filho: ajusta o modelo de um município/grupo e mede o tempo.
+
+    Sem `modelo`, ajusta do zero. Com ele, atualiza: partial_fit nas semanas a partir
+    de `desde`, se o modelo suportar, ou novo ajuste partindo do estado salvo.
+    """
+    inicio = time.perf_counter()
+    try:
+        if modelo is not None and hasattr(modelo, 'partial_fit'):
+            X, y = amostras(_cubo, linhas, desde)
+            if len(y):
+                modelo.partial_fit(X, y)
+        else:
+            X, y = amostras(_cubo, linhas)
+            if len(y) < MIN_AMOSTRAS:
+                raise ValueError(f"série curta ({len(y)} semanas válidas)")
+            modelo = (modelo if modelo is not None else criar_modelo(tipo)).fit(X, y)
+        erro = None
+    except Exception as e:
+        modelo, erro, y = None, f"{type(e).__name__}: {e}", []
+    return {'rotulo': rotulo, 'modelo': modelo, 'n_amostras': len(y),
+            'segundos': time.perf_counter() - inicio, 'erro': erro}
+
+def tarefas(codigos, grupos=None):
+    """Lista [(rotulo, linhas)]: uma por município ou, com `grupos` ({code_muni: grupo}), uma por grupo."""
+    if grupos is None:
+        return [(int(codigo), [linha]) for linha, codigo in enumerate(codigos)]
+    por_grupo = {}
+    for linha, codigo in enumerate(codigos):
+        por_grupo.setdefault(grupos.get(int(codigo), int(codigo)), []).append(linha)
+    return list(por_grupo.items())
+
+def _executar(arquivo, lista, max_workers):
+    """Roda as tarefas [(rotulo, linhas, tipo, modelo, desde)] no pool; devolve os resultados."""
+    resultados = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_abrir_cubo, initargs=(arquivo,)) as executor:
+        futuros = {executor.submit(_treinar_tarefa, *tarefa): tarefa[0] for tarefa in lista}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                # Falha do próprio processo (ex.: morto pelo sistema)
+                resultado = {'rotulo': futuros[futuro], 'modelo': None, 'n_amostras': 0,
+                             'segundos': float('nan'), 'erro': f"{type(e).__name__}: {e}"}
+            resultados.append(resultado)
+            if resultado['erro']:
+                print(f"[{concluidos}/{len(lista)}] {resultado['rotulo']}: falhou ({resultado['erro']})")
+    return resultados
+
+def treinar(df_painel, max_workers=None, grupos=None, diretorio=None, tipo='poisson'):
+    """Treina um modelo por município (ou grupo) em paralelo.
+
+    Retorna (modelos, relatorio): modelos {rotulo: modelo ajustado} e um DataFrame
+    com rotulo, n_amostras, segundos e erro de cada tarefa.
+    """
+    max_workers = max_workers or os.cpu_count()
+    with tempfile.TemporaryDirectory(dir=diretorio) as pasta:
+        arquivo, codigos, _ = cubo_do_painel(df_painel, os.path.join(pasta, "painel.npy"))
+        lista = [(rotulo, linhas, tipo) for rotulo, linhas in tarefas(codigos, grupos)]
+        resultados = _executar(arquivo, lista, max_workers)
+
+    modelos = {r['rotulo']: r['modelo'] for r in resultados if r['modelo'] is not None}
+    relatorio = pd.DataFrame([{k: v for k, v in r.items() if k != 'modelo'} for r in resultados])
+    return modelos, relatorio
+
+def planejar_atualizacao(cubo, codigos, chaves, indice):
+    """Decide o que fazer com cada município na atualização semanal.
+
+    A impressão digital cobre todas as variáveis do cubo (casos, clima e população)
+    até a última semana com casos publicados: revisões em qualquer uma delas mudam os
+    preditores já usados no ajuste.
+    Retorna {code_muni: (modo, desde, metadados novos)}, com modo 'novo' (sem modelo
+    salvo), 'reajuste' (semanas já usadas foram revisadas ou o eixo mudou),
+    'incremental' (só há semanas novas) ou 'inalterado'.
+    """
+    casos = cubo[VARIAVEIS.index('casos')]
+    plano = {}
+    for linha, codigo in enumerate(codigos):
+        historico = cubo[:, linha]
+        publicadas = np.flatnonzero(np.isfinite(casos[linha]))
+        ultima = int(publicadas[-1]) if len(publicadas) else -1
+        novos = {'impressao': model_store.impressao(historico[:, :ultima + 1]),
+                 'inicio': int(chaves[0]), 'fim': int(chaves[ultima]) if ultima >= 0 else None}
+
+        anterior = indice.get(str(int(codigo)))
+        if anterior is None:
+            plano[int(codigo)] = ('novo', 0, novos)
+            continue
+        fim_anterior = np.flatnonzero(chaves == anterior['fim'])
+        if anterior['inicio'] != novos['inicio'] or len(fim_anterior) == 0 or fim_anterior[0] > ultima:
+            plano[int(codigo)] = ('reajuste', 0, novos)
+        elif model_store.impressao(historico[:, :fim_anterior[0] + 1]) != anterior['impressao']:
+            plano[int(codigo)] = ('reajuste', 0, novos)
+        elif fim_anterior[0] == ultima:
+            plano[int(codigo)] = ('inalterado', 0, novos)
+        else:
+            plano[int(codigo)] = ('incremental', int(fim_anterior[0]) + 1, novos)
+    return plano
+
+def atualizar_semanal(df_painel, tipo='poisson', max_workers=None, diretorio_modelos=model_store.DIRETORIO_PADRAO,
+                      diretorio=None):
+    """Atualiza os modelos salvos com o painel mais recente (um modelo por município).
+
+    Retorna o relatório com o modo de cada município (novo, reajuste, incremental,
+    inalterado), n_amostras, segundos e erro.
+    """
+    max_workers = max_workers or os.cpu_count()
+    indice = model_store.carregar_indice(tipo, diretorio_modelos)
+    with tempfile.TemporaryDirectory(dir=diretorio) as pasta:
+        arquivo, codigos, chaves = cubo_do_painel(df_painel, os.path.join(pasta, "painel.npy"))
+        plano = planejar_atualizacao(np.load(arquivo, mmap_mode='r'), codigos, chaves, indice)
+
+        lista = []
+        for linha, codigo in enumerate(codigos):
+            modo, desde, _ = plano[int(codigo)]
+            if modo == 'inalterado':
+                continue
+            modelo = model_store.carregar_modelo(tipo, int(codigo), indice, diretorio_modelos) if modo == 'incremental' else None
+            if modo == 'incremental' and modelo is None:
+                # Arquivo do modelo sumiu: ajusta do zero
+                plano[int(codigo)] = ('reajuste', 0, plano[int(codigo)][2])
+                desde = 0
+            lista.append((int(codigo), [linha], tipo, modelo, desde))
+        resultados = _executar(arquivo, lista, max_workers) if lista else []
+
+    for resultado in resultados:
+        if resultado['modelo'] is not None:
+            metadados = dict(plano[resultado['rotulo']][2], n_amostras=resultado['n_amostras'])
+            model_store.salvar_modelo(tipo, resultado['rotulo'], resultado['modelo'], metadados, indice, diretorio_modelos)
+    model_store.salvar_indice(tipo, indice, diretorio_modelos)
+
+    relatorio = pd.DataFrame([{k: v for k, v in r.items() if k != 'modelo'} for r in resultados],
+                             columns=['rotulo', 'n_amostras', 'segundos', 'erro'])
+    relatorio['modo'] = [plano[rotulo][0] for rotulo in relatorio['rotulo']]
+    inalterados = [rotulo for rotulo, (modo, _, _) in plano.items() if modo == 'inalterado']
+    if inalterados:
+        relatorio = pd.concat([relatorio, pd.DataFrame({'rotulo': inalterados, 'modo': 'inalterado'})],
+                              ignore_index=True)
+    relatorio['n_amostras'] = relatorio['n_amostras'].astype('Int64')
+    return relatorio
+
+def resumo(relatorio):
+    """Texto curto com contagens e tempos das tarefas."""
+    ok = relatorio[relatorio['erro'].isna()]
+    tempos = ok['segundos']
+    texto = f"{len(ok)} de {len(relatorio)} modelos ajustados; {len(relatorio) - len(ok)} falhas."
+    if len(tempos):
+        texto += (f" Tempo por tarefa: mediana {tempos.median():.3f}s, p95 {tempos.quantile(0.95):.3f}s,"
+                  f" máximo {tempos.max():.3f}s (soma {tempos.sum():.1f}s).")
+    return texto
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Treino dos modelos por município sobre o painel (painel.py).")
+    parser.add_argument('estados', nargs='+', help="siglas ou nomes das UFs com painel montado (ex.: PE SP, PE,SP ou TODOS)")
+    parser.add_argument('--atualizar', action='store_true',
+                        help="atualização semanal dos modelos salvos (model_store) em vez do treino completo")
+    parser.add_argument('--tipo', default='poisson', choices=sorted(TIPOS_MODELO), help="tipo de modelo")
+    parser.add_argument('--workers', type=int, help="processos do pool (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+
+    try:
+        estados = localidades.resolver_estados(args.estados)
+    except ValueError as e:
+        parser.error(str(e))
+    df_painel = pd.concat([painel.carregar_painel(sigla) for sigla in estados], ignore_index=True)
+
+    inicio = time.perf_counter()
+    if args.atualizar:
+        # Atualização semanal dos modelos salvos (model_store)
+        relatorio = atualizar_semanal(df_painel, tipo=args.tipo, max_workers=args.workers)
+        print(relatorio['modo'].value_counts().to_string())
+        relatorio = relatorio[relatorio['modo'] != 'inalterado']
+    else:
+        modelos, relatorio = treinar(df_painel, max_workers=args.workers, tipo=args.tipo)
+    print(resumo(relatorio))
+    print(f"Tempo total: {time.perf_counter() - inicio:.1f}s")
+
+if __name__ == "__main__":
+    main()
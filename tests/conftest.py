@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import pytest
+
+# Os módulos do projeto ficam soltos em src/ e se importam pelo nome
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import localidades
+import retentativas
+import tabnet_local
+
+@pytest.fixture(autouse=True)
+def diretorio_isolado(tmp_path, monkeypatch):
+    """Cada teste roda num diretório vazio (cache HTTP, diários e datasets ficam nele)."""
+    monkeypatch.chdir(tmp_path)
+    # Sem esperas entre retentativas
+    monkeypatch.setattr(retentativas, 'espera', lambda *args, **kwargs: 0.0)
+    return tmp_path
+
+@pytest.fixture
+def registro_local(diretorio_isolado, monkeypatch):
+    """Registro de localidades com os municípios que tabnet_local gera para PE e AC (sem rede)."""
+    municipios = []
+    for sigla in ('PE', 'AC'):
+        codigo_uf = localidades.ESTADOS[sigla][1]
+        for m in range(185):
+            # Código de 6 dígitos do TabNet + dígito verificador fictício
+            municipios.append((int(f"{codigo_uf}{m * 5 + 5:04d}") * 10 + 1, f"Municipio {m + 1:03d}"))
+    os.makedirs(os.path.dirname(localidades.CACHE_FILE), exist_ok=True)
+    with open(localidades.CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(municipios, f)
+    monkeypatch.setattr(localidades, '_registro', None)
+    return municipios
+
+@pytest.fixture
+def gravacoes(diretorio_isolado):
+    """Diretório de respostas gravadas servidas por tabnet_local no lugar das geradas."""
+    pasta = diretorio_isolado / "gravacoes"
+    pasta.mkdir()
+    return pasta
+
+@pytest.fixture
+def tabnet(gravacoes):
+    """Servidor local do TabNet; devolve a base_url do tabcgi.exe."""
+    servidor, base_url = tabnet_local.iniciar_servidor(diretorio_gravacoes=str(gravacoes))
+    yield base_url
+    servidor.shutdown()
+    servidor.server_close()
+
+def pagina_de_erro(gravacoes, estado, ano):
+    """Grava uma resposta de erro do TabNet (HTTP 200, sem tabela) para (estado, ano)."""
+    caminho = gravacoes / f"dengueb{estado.lower()}_{ano}.html"
+    caminho.write_text("<html><body>Erro ao processar a tabela</body></html>", encoding='iso-8859-1')
+    return caminho
@@ -0,0 +1,16 @@
+import sys
+import pytest
+import tabnet_prn
+import tabnet_local
+import benchmark_coleta
+
+def test_parser_atual_igual_ao_legado():
+    pytest.importorskip('bs4')
+    pagina = tabnet_local.gerar_pagina_prn('AC', 2023, n_municipios=5, n_semanas=52)
+    atual = [[a, s, m, str(c)] for a, s, m, c in tabnet_prn.linhas(tabnet_prn.parse_prn(pagina, 2023))]
+    assert atual == benchmark_coleta.parse_legado(pagina, 2023)
+
+def test_comparacao_ignorada_sem_bs4(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, 'bs4', None)
+    assert benchmark_coleta.comparar_bs4("fixtures") is None
+    assert "bs4 não está instalado" in capsys.readouterr().out
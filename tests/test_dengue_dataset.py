@@ -0,0 +1,27 @@
+import os
+import localidades
+import tabnet_prn
+import tabnet_local
+import dengue_dataset
+
+def _tabela(ano=2023):
+    return tabnet_prn.parse_prn(tabnet_local.gerar_pagina_prn('PE', ano, n_municipios=3, n_semanas=4), ano)
+
+def test_particao_tipada_sem_linha_total(registro_local):
+    caminhos = dengue_dataset.salvar_particoes('PE', _tabela())
+    assert caminhos == [dengue_dataset.caminho_particao('PE', 2023)]
+    df = dengue_dataset.carregar('PE', 2023)
+    assert len(df) == 3 * 4
+    assert df['CodMunicipio'].unique().tolist() == [260005, 260010, 260015]
+    assert df['code_muni'].unique().tolist() == [2600051, 2600101, 2600151]
+    assert df['NumSemana'].unique().tolist() == [1, 2, 3, 4]
+
+def test_cache_de_localidades_corrompido_deixa_code_muni_vazio(diretorio_isolado, monkeypatch):
+    os.makedirs(os.path.dirname(localidades.CACHE_FILE), exist_ok=True)
+    with open(localidades.CACHE_FILE, 'w', encoding='utf-8') as f:
+        f.write('[[2600054, "Abreu')
+    monkeypatch.setattr(localidades, '_registro', None)
+    tabela = dengue_dataset.tabela_para_arrow(_tabela())
+    assert tabela.num_rows == 3 * 4
+    assert tabela.column('code_muni').null_count == tabela.num_rows
+    assert tabela.column('CodMunicipio').null_count == 0
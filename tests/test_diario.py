@@ -0,0 +1,105 @@
+import json
+import random
+import pytest
+import diario
+import retentativas
+import dengue_dataset
+import sinan_scrapper
+from conftest import pagina_de_erro
+
+# A fixture diretorio_isolado zera as esperas; aqui interessa a função real
+espera_real = retentativas.espera
+
+def test_retomada_pula_concluidas(diretorio_isolado):
+    artefato = diretorio_isolado / "PE_2022.parquet"
+    artefato.write_bytes(b"dados")
+    with diario.Diario('teste') as d:
+        d.registrar(('tabnet', 'PE', 2022), 'ok', artefatos=[str(artefato)])
+        d.registrar(('tabnet', 'PE', 2023), 'falhou', erro="timeout")
+
+    with diario.Diario('teste', retomar=True) as d:
+        assert d.concluida('tabnet', 'PE', 2022)
+        assert not d.concluida('tabnet', 'PE', 2023)
+        assert d.pendentes([('tabnet', 'PE', 2022), ('tabnet', 'PE', 2023), ('tabnet', 'PE', 2024)]) == [
+            ('tabnet', 'PE', 2023), ('tabnet', 'PE', 2024)]
+        assert d.falhas('tabnet', 'PE') == [('tabnet', 'PE', 2023)]
+        assert d.artefatos('tabnet', 'PE', 2022) == [str(artefato)]
+
+def test_ultimo_registro_prevalece(diretorio_isolado):
+    with diario.Diario('teste') as d:
+        d.registrar(('ibge', 'PE', '2021'), 'falhou')
+        d.registrar(('ibge', 'PE', '2021'), 'ok')
+    with diario.Diario('teste', retomar=True) as d:
+        assert d.concluida('ibge', 'PE', '2021')
+        assert d.resumo() == {'ok': 1}
+
+def test_artefato_apagado_refaz_unidade(diretorio_isolado):
+    artefato = diretorio_isolado / "PE_2022.parquet"
+    artefato.write_bytes(b"dados")
+    with diario.Diario('teste') as d:
+        d.registrar(('tabnet', 'PE', 2022), 'ok', artefatos=[str(artefato)])
+    artefato.unlink()
+    with diario.Diario('teste', retomar=True) as d:
+        assert not d.concluida('tabnet', 'PE', 2022)
+
+def test_linha_cortada_no_fim_e_ignorada(diretorio_isolado):
+    with diario.Diario('teste') as d:
+        d.registrar(('tabnet', 'PE', 2022), 'ok')
+        caminho = d.caminho
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write('{"unidade": ["tabnet", "PE", 20')
+    with diario.Diario('teste', retomar=True) as d:
+        assert d.concluida('tabnet', 'PE', 2022)
+        assert d.resumo() == {'ok': 1}
+
+def test_sem_retomar_comeca_diario_novo(diretorio_isolado):
+    with diario.Diario('teste') as d:
+        d.registrar(('tabnet', 'PE', 2022), 'ok')
+        caminho = d.caminho
+    with diario.Diario('teste') as d:
+        assert not d.concluida('tabnet', 'PE', 2022)
+    with open(f"{caminho}.anterior", encoding='utf-8') as f:
+        assert [json.loads(linha)['unidade'] for linha in f] == [['tabnet', 'PE', 2022]]
+
+def test_particoes_retomadas_refazem_so_o_que_falhou(tabnet, gravacoes, registro_local):
+    erro = pagina_de_erro(gravacoes, 'PE', 2023)
+    with diario.Diario('sinan') as d:
+        particoes = sinan_scrapper.coletar_particoes(['PE'], [2022, 2023], d, base_url=tabnet)
+    assert particoes == {'PE': [dengue_dataset.caminho_particao('PE', 2022)]}
+
+    erro.unlink()
+    with diario.Diario('sinan', retomar=True) as d:
+        particoes = sinan_scrapper.coletar_particoes(['PE'], [2022, 2023], d, base_url=tabnet)
+        caminho = d.caminho
+    assert particoes == {'PE': [dengue_dataset.caminho_particao('PE', ano) for ano in (2022, 2023)]}
+    with open(caminho, encoding='utf-8') as f:
+        registros = [json.loads(linha) for linha in f]
+    # 2022 só foi baixado na primeira execução; 2023 falhou e foi refeito na retomada
+    assert sorted((r['unidade'][2], r['status']) for r in registros) == [(2022, 'ok'), (2023, 'falhou'), (2023, 'ok')]
+    assert (registros[-1]['unidade'], registros[-1]['status']) == (['tabnet', 'PE', 2023], 'ok')
+
+def test_espera_limitada_e_sorteada():
+    rng = random.Random(1)
+    esperas = [espera_real(tentativa, base=1.0, maxima=8.0, rng=rng) for tentativa in range(10)]
+    assert all(0 <= e <= min(8.0, 2 ** t) for t, e in enumerate(esperas))
+    assert len(set(esperas)) == len(esperas)
+
+def test_repetir_ate_dar_certo_e_propaga_a_ultima():
+    falhas = iter([OSError("reset"), OSError("reset")])
+    def instavel():
+        erro = next(falhas, None)
+        if erro:
+            raise erro
+        return "ok"
+    assert retentativas.repetir(instavel, tentativas=3) == "ok"
+
+    chamadas = []
+    def sempre_falha():
+        chamadas.append(1)
+        raise TimeoutError("lento")
+    with pytest.raises(TimeoutError):
+        retentativas.repetir(sempre_falha, tentativas=3)
+    assert len(chamadas) == 3
+
+    with pytest.raises(KeyError):
+        retentativas.repetir(lambda: {}['x'], tentativas=3, repetir_em=(OSError,))
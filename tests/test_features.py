@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import features
+
+def _matriz(seed=3, forma=(4, 70), ausentes=0.1):
+    rng = np.random.default_rng(seed)
+    matriz = rng.gamma(2.0, 5.0, forma).astype('float32')
+    matriz[rng.random(forma) < ausentes] = np.nan
+    return matriz
+
+def test_defasagens_iguais_ao_shift():
+    matriz = _matriz()
+    lags = (1, 3, 12)
+    tensor = features.defasagens(matriz, lags)
+    assert tensor.shape == matriz.shape + (len(lags),)
+    for j, lag in enumerate(lags):
+        esperado = pd.DataFrame(matriz).T.shift(lag).T.to_numpy()
+        np.testing.assert_array_equal(tensor[..., j], esperado)
+
+def test_somas_moveis_so_com_semanas_anteriores_completas():
+    matriz = _matriz()
+    for janela in features.JANELAS_PRCP:
+        # Soma de t-janela .. t-1, nula se faltar qualquer semana
+        esperado = pd.DataFrame(matriz).T.shift(1).rolling(janela, min_periods=janela).sum().T.to_numpy()
+        np.testing.assert_allclose(features.somas_moveis(matriz, janela), esperado, rtol=1e-5)
+
+def test_anomalia_contra_media_das_semanas_anteriores():
+    matriz = _matriz(ausentes=0.0)
+    janela = 8
+    anterior = pd.DataFrame(matriz).T.shift(1)
+    esperado = (anterior - anterior.rolling(janela, min_periods=janela // 2).mean()).T.to_numpy()
+    np.testing.assert_allclose(features.anomalia(matriz, janela), esperado, rtol=1e-4, atol=1e-4)
+
+def test_tensor_sem_vazamento_e_em_blocos():
+    matrizes = {variavel: _matriz(seed=k) for k, variavel in enumerate(('casos', 'tavg', 'tmin', 'tmax', 'prcp'))}
+    tensor = features.gerar(matrizes)
+    assert tensor.shape == (4, 70, len(features.nomes_features()))
+    assert tensor.dtype == np.float32
+
+    # Mudar a semana t não altera nenhum preditor até a semana t
+    alteradas = {variavel: matriz.copy() for variavel, matriz in matrizes.items()}
+    for matriz in alteradas.values():
+        matriz[:, 40] = 1e6
+    np.testing.assert_array_equal(features.gerar(alteradas)[:, :41], tensor[:, :41])
+
+    np.testing.assert_array_equal(features.gerar_em_blocos(matrizes, tamanho_bloco=3), tensor)
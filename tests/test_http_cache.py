@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import http_cache
+
+class _Origem(BaseHTTPRequestHandler):
+    """Servidor de teste: /dados com ETag, /instavel com 503 nas primeiras chamadas, /erro com 200 sem tabela."""
+
+    def do_GET(self):
+        self.server.pedidos.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/dados':
+            if self.headers.get('If-None-Match') == self.server.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._responder(200, self.server.corpo, {'ETag': self.server.etag})
+        elif self.path == '/instavel':
+            falhas = sum(1 for caminho, _ in self.server.pedidos if caminho == '/instavel')
+            self._responder(503 if falhas <= 2 else 200, b'estavel')
+        elif self.path == '/erro':
+            self._responder(200, b'<html>Erro ao processar a tabela</html>')
+        else:
+            self._responder(404, b'')
+
+    def _responder(self, status, corpo, cabecalhos=None):
+        self.send_response(status)
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def origem(monkeypatch):
+    monkeypatch.setattr(http_cache, '_offline', False)
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), _Origem)
+    servidor.pedidos, servidor.etag, servidor.corpo = [], '"v1"', b'{"valor": 1}'
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}"
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+def test_dentro_do_ttl_nao_vai_a_rede(origem):
+    primeira = http_cache.get(origem.url + '/dados', ttl=3600)
+    segunda = http_cache.get(origem.url + '/dados', ttl=3600)
+    assert not primeira.from_cache and segunda.from_cache
+    assert segunda.json() == {'valor': 1}
+    assert len(origem.pedidos) == 1
+
+def test_vencida_revalida_com_etag(origem):
+    http_cache.get(origem.url + '/dados', ttl=0)
+    resposta = http_cache.get(origem.url + '/dados', ttl=0)
+    assert resposta.from_cache and resposta.json() == {'valor': 1}
+    assert origem.pedidos == [('/dados', None), ('/dados', '"v1"')]
+
+    # Conteúdo novo no servidor: o ETag muda e o corpo guardado é substituído
+    origem.etag, origem.corpo = '"v2"', b'{"valor": 2}'
+    resposta = http_cache.get(origem.url + '/dados', ttl=0)
+    assert not resposta.from_cache and resposta.json() == {'valor': 2}
+    assert http_cache.get(origem.url + '/dados', ttl=3600).json() == {'valor': 2}
+
+def test_offline_serve_copia_vencida_e_falha_sem_copia(origem, monkeypatch):
+    http_cache.get(origem.url + '/dados', ttl=0)
+    monkeypatch.setattr(http_cache, '_offline', True)
+    assert http_cache.get(origem.url + '/dados', ttl=0).json() == {'valor': 1}
+    with pytest.raises(http_cache.CacheMiss):
+        http_cache.get(origem.url + '/outra')
+    assert len(origem.pedidos) == 1
+
+def test_respostas_transitorias_repetidas(origem):
+    resposta = http_cache.get(origem.url + '/instavel', tentativas=4)
+    assert resposta.status_code == 200 and resposta.text == 'estavel'
+    assert len(origem.pedidos) == 3
+
+def test_resposta_invalida_nao_entra_no_cache(origem):
+    valido = lambda resposta: 'Erro' not in resposta.text
+    assert not valido(http_cache.get(origem.url + '/erro', valido=valido))
+    http_cache.get(origem.url + '/erro', valido=valido)
+    assert len(origem.pedidos) == 2
+    # Sem o predicado, a mesma página é guardada como qualquer 200
+    http_cache.get(origem.url + '/erro')
+    assert http_cache.get(origem.url + '/erro').from_cache
+
+def test_stream_le_o_corpo_do_cache(origem):
+    resposta = http_cache.get(origem.url + '/dados', stream=True)
+    assert b''.join(resposta.iter_content(4)) == b'{"valor": 1}'
+    assert resposta.from_cache and resposta.body_path is not None
@@ -0,0 +1,76 @@
+import json
+import threading
+import pandas as pd
+import localidades
+
+def test_indices_nos_dois_sentidos(registro_local):
+    codigo = registro_local[0][0]
+    assert localidades.codigo7(codigo // 10) == codigo
+    assert localidades.nome_municipio(codigo) == "Municipio 001"
+    assert localidades.nome_municipio(codigo // 10) == "Municipio 001"
+    assert localidades.codigo_municipio("MUNICÍPIO 001", 'pe') == codigo
+    assert len(localidades.municipios_do_estado('AC')) == 185
+
+def test_registro_montado_uma_vez_entre_threads(registro_local, monkeypatch):
+    leituras = []
+    carregar = localidades.carregar_municipios
+    def carregar_contando(*args, **kwargs):
+        leituras.append(1)
+        return carregar(*args, **kwargs)
+    monkeypatch.setattr(localidades, 'carregar_municipios', carregar_contando)
+
+    barreira = threading.Barrier(8)
+    registros = []
+    def consultar():
+        barreira.wait()
+        registros.append(localidades.registro())
+    threads = [threading.Thread(target=consultar) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(leituras) == 1
+    assert all(r is registros[0] for r in registros)
+
+class _Resposta:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return [{'id': 2600054, 'nome': 'Abreu e Lima'}]
+
+def test_cache_gravado_sem_temporarios(diretorio_isolado, monkeypatch):
+    monkeypatch.setattr(localidades.http_cache, 'get', lambda *args, **kwargs: _Resposta())
+    cache = diretorio_isolado / "cache" / "municipios.json"
+    assert localidades.carregar_municipios(str(cache), atualizar=True) == [(2600054, 'Abreu e Lima')]
+    assert json.loads(cache.read_text(encoding='utf-8')) == [[2600054, 'Abreu e Lima']]
+    assert [p.name for p in cache.parent.iterdir()] == ['municipios.json']
+
+def _registro_pe(monkeypatch, municipios):
+    cache = "municipios_pe.json"
+    with open(cache, 'w', encoding='utf-8') as f:
+        json.dump(municipios, f)
+    monkeypatch.setattr(localidades, '_registro', None)
+    localidades.registro(cache)
+
+def test_casar_exato_aproximado_e_codigo_ja_usado(diretorio_isolado, monkeypatch):
+    _registro_pe(monkeypatch, [[2611606, 'Recife'], [2609600, 'Olinda'],
+                               [2607901, 'Jaboatão dos Guararapes'], [2613701, 'São Lourenço da Mata']])
+    nomes = pd.Series(['RECIFE', ' olinda', 'Jaboatao dos Guararapis', 'Recif', 'Lugar Nenhum'],
+                      index=[10, 11, 12, 13, 14])
+    codigos, estatisticas = localidades.casar_municipios(nomes, 'pe')
+
+    assert codigos.index.tolist() == [10, 11, 12, 13, 14]
+    assert codigos.tolist()[:3] == [2611606, 2609600, 2607901]
+    # 'Recif' só se pareceria com Recife, que já foi atribuído ao nome exato
+    assert codigos.isna().tolist()[3:] == [True, True]
+    assert estatisticas['exatos'] == 2
+    assert estatisticas['aproximados'] == [('Jaboatao dos Guararapis', 'JABOATAO DOS GUARARAPES')]
+    assert estatisticas['sem_correspondencia'] == ['Recif', 'Lugar Nenhum']
+
+def test_casar_aproximado_nao_repete_codigo(diretorio_isolado, monkeypatch):
+    _registro_pe(monkeypatch, [[2611606, 'Recife'], [2609600, 'Olinda']])
+    codigos, estatisticas = localidades.casar_municipios(pd.Series(['Recifee', 'Recif', 'Olindaa']), 'PE')
+    assert codigos.tolist()[0] == 2611606 and pd.isna(codigos.tolist()[1])
+    assert codigos.tolist()[2] == 2609600
+    assert len(estatisticas['aproximados']) == 2
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import painel
+
+def test_populacao_interpolada_entre_julhos():
+    populacao = pd.DataFrame({'code_muni': [1, 1, 2], 'ano': [2022, 2023, 2023],
+                              'populacao': [1000.0, 2000.0, 500.0]})
+    # Meio da semana (início + 3 dias) em 1º/jul/2022, no meio do caminho até 1º/jul/2023, antes e depois
+    inicios = np.array(['2022-06-28', '2022-12-28', '2021-01-01', '2024-06-01'], dtype='datetime64[D]')
+    matriz = painel.matriz_populacao(populacao, np.array([1, 2, 3], dtype='int32'), inicios)
+
+    np.testing.assert_allclose(matriz[0], [1000.0, 1000.0 + 1000 * 183 / 365, 1000.0, 2000.0], rtol=1e-5)
+    # Município com um só ano: constante; sem dado: nulo
+    np.testing.assert_allclose(matriz[1], 500.0)
+    assert np.isnan(matriz[2]).all()
+
+def test_painel_denso_do_estado(registro_local):
+    codigos = [codigo for codigo, _ in registro_local[:185]]
+    casos = pd.DataFrame({'code_muni': [codigos[0], codigos[0], codigos[1]], 'Ano': [2023, 2023, 2023],
+                          'NumSemana': [1, 2, 2], 'Casos': [3, 4, 5]})
+    clima = pd.DataFrame({'date': pd.date_range('2023-01-01', '2023-01-07'), 'code_muni': codigos[0],
+                          'tavg': 25.0, 'tmin': 20.0, 'tmax': 30.0, 'prcp': 2.0})
+    populacao = pd.DataFrame({'code_muni': codigos, 'ano': 2023, 'populacao': 100000.0})
+    idhm = pd.Series([0.7], index=[codigos[0]])
+
+    tabela = painel.construir_painel_estado('pe', 2023, 2023, casos=casos, clima=clima, populacao=populacao,
+                                            idhm=idhm)
+    assert tabela.schema == painel.ESQUEMA
+    assert tabela.num_rows == 185 * 52
+    df = tabela.to_pandas()
+
+    primeiro = df[df['code_muni'] == codigos[0]].set_index('semana_epi')
+    assert primeiro.loc[[1, 2], 'casos'].tolist() == [3, 4]
+    # Semanas fora do que o TabNet publicou ficam nulas, não zero
+    assert primeiro.loc[3:, 'casos'].isna().all()
+    assert primeiro.loc[1, ['tavg', 'tmin', 'tmax', 'prcp']].tolist() == [25.0, 20.0, 30.0, 14.0]
+    assert primeiro.loc[1, 'dias_prcp'] == 7 and primeiro.loc[2, 'dias_prcp'] == 0
+    assert primeiro.loc[2, 'incidencia_100k'] == 4.0
+    assert (primeiro['idhm_2010'] == np.float32(0.7)).all()
+
+    # Município sem linha numa semana publicada tem zero casos
+    segundo = df[df['code_muni'] == codigos[2]].set_index('semana_epi')
+    assert segundo.loc[[1, 2], 'casos'].tolist() == [0, 0]
+    assert segundo['idhm_2010'].isna().all()
+
+    codigos_matriz, chaves, dados = painel.matrizes(df, ['casos'])
+    assert codigos_matriz.tolist() == sorted(codigos)
+    assert chaves[[0, -1]].tolist() == [202301, 202352]
+    assert dados['casos'].shape == (185, 52)
@@ -0,0 +1,91 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+import treinamento
+import scoring
+
+def _dados(n_municipios=3, n_semanas=80, publicadas=75, seed=11):
+    """Matrizes município × semana sintéticas (treinamento.VARIAVEIS), casos nulos após `publicadas`."""
+    rng = np.random.default_rng(seed)
+    forma = (n_municipios, n_semanas)
+    dados = {
+        'casos': rng.poisson(6, forma).astype('float32'),
+        'tavg': rng.normal(25, 1, forma).astype('float32'),
+        'tmin': rng.normal(21, 1, forma).astype('float32'),
+        'tmax': rng.normal(30, 1, forma).astype('float32'),
+        'prcp': rng.gamma(1.5, 8, forma).astype('float32'),
+        'populacao': np.full(forma, 100000, dtype='float32'),
+    }
+    dados['casos'][:, publicadas:] = np.nan
+    chaves = np.array([(2021 + t // 52) * 100 + t % 52 + 1 for t in range(n_semanas)], dtype='int32')
+    return dados, chaves
+
+def _modelos(dados, codigos, tipo):
+    cubo = np.stack([dados[v] for v in treinamento.VARIAVEIS])
+    return {int(codigo): treinamento.criar_modelo(tipo).fit(*treinamento.amostras(cubo, [linha]))
+            for linha, codigo in enumerate(codigos)}
+
+@pytest.mark.parametrize('tipo', sorted(treinamento.TIPOS_MODELO))
+def test_parametros_empilhados_iguais_ao_predict(tipo):
+    dados, _ = _dados()
+    codigos = np.array([2600054, 2600104, 2600203], dtype='int32')
+    modelos = _modelos(dados, codigos, tipo)
+    parametros = scoring.ParametrosLineares(codigos, modelos)
+    assert parametros.disponivel.all() and not parametros.outros
+
+    cubo = np.stack([dados[v] for v in treinamento.VARIAVEIS])
+    X = np.stack([treinamento.amostras(cubo, [linha])[0][-1] for linha in range(len(codigos))]).astype('float64')
+    esperado = [modelos[int(codigo)].predict(X[linha][None])[0] for linha, codigo in enumerate(codigos)]
+    np.testing.assert_allclose(parametros.prever(X), esperado, rtol=1e-6)
+
+def test_prever_horizonte_e_municipio_sem_modelo():
+    dados, chaves = _dados()
+    codigos = np.array([2600054, 2600104, 2600203], dtype='int32')
+    modelos = _modelos(dados, codigos, 'poisson')
+    del modelos[2600203]
+    resultado = scoring.prever(dados, chaves, scoring.ParametrosLineares(codigos, modelos), horizonte=4, limiar=5.0)
+
+    # Última semana publicada é a 75ª (2022 semana 23); previsões nas quatro seguintes
+    assert resultado['semanas'] == [202224, 202225, 202226, 202227]
+    assert resultado['previsao'].shape == (3, 4)
+    assert np.isfinite(resultado['previsao'][:2]).all() and (resultado['previsao'][:2] >= 0).all()
+    assert np.isnan(resultado['previsao'][2]).all()
+    np.testing.assert_array_equal(resultado['alerta'], resultado['previsao'] > 5.0)
+
+    df = scoring.para_dataframe(resultado)
+    assert len(df) == 12
+    assert df['horizonte'].tolist()[:4] == [1, 2, 3, 4]
+
+class _PrevisorFalho:
+    def prever(self, uf, horizonte, limiar):
+        if uf == 'XX':
+            raise FileNotFoundError("painel_parquet/uf=XX/part-0.parquet")
+        raise RuntimeError("modelo corrompido")
+
+@pytest.fixture
+def servidor():
+    servidor = scoring.criar_servidor(_PrevisorFalho(), porta=0)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.mark.parametrize('consulta, status', [
+    ('/previsao?horizonte=4', 400),
+    ('/previsao?uf=PE&horizonte=quatro', 400),
+    ('/previsao?uf=XX', 404),
+    ('/previsao?uf=PE', 500),
+])
+def test_erros_do_endpoint_em_json(servidor, consulta, status):
+    with pytest.raises(urllib.error.HTTPError) as erro:
+        urllib.request.urlopen(servidor + consulta, timeout=5)
+    assert erro.value.code == status
+    assert 'erro' in json.loads(erro.value.read().decode('utf-8'))
+
+def test_main_exige_uf():
+    with pytest.raises(SystemExit):
+        scoring.main([])
@@ -0,0 +1,29 @@
+import tabnet_prn
+import sinan_scrapper
+from conftest import pagina_de_erro
+
+def _registros(tabela):
+    return list(tabnet_prn.linhas(tabela))
+
+def test_concorrente_igual_ao_sequencial(tabnet):
+    anos = [2022, 2023]
+    concorrente = sinan_scrapper.coletar_dados_concorrente(['pe', 'AC'], anos, max_workers=4, max_por_host=2,
+                                                           base_url=tabnet)
+    assert sorted(concorrente) == ['AC', 'PE']
+    for estado in ('PE', 'AC'):
+        sequencial = tabnet_prn.concatenar(sinan_scrapper.coletar_dados_ano(ano, estado, base_url=tabnet)
+                                           for ano in anos)
+        assert tabnet_prn.n_registros(concorrente[estado]) == 2 * 186 * 52
+        assert _registros(concorrente[estado]) == _registros(sequencial)
+
+def test_falha_de_um_ano_nao_derruba_os_outros(tabnet, gravacoes):
+    pagina_de_erro(gravacoes, 'PE', 2023)
+    resultados = sinan_scrapper.coletar_tarefas([('PE', 2022), ('PE', 2023)], max_workers=2, base_url=tabnet)
+    assert tabnet_prn.n_registros(resultados[('PE', 2022)]) == 186 * 52
+    assert tabnet_prn.n_registros(resultados[('PE', 2023)]) == 0
+
+def test_pagina_de_erro_nao_fica_no_cache(tabnet, gravacoes):
+    erro = pagina_de_erro(gravacoes, 'PE', 2023)
+    assert tabnet_prn.n_registros(sinan_scrapper.coletar_dados_ano(2023, 'PE', base_url=tabnet)) == 0
+    erro.unlink()
+    assert tabnet_prn.n_registros(sinan_scrapper.coletar_dados_ano(2023, 'PE', base_url=tabnet)) == 186 * 52
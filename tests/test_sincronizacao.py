@@ -0,0 +1,60 @@
+from datetime import date, datetime
+import sinan_store
+import sinan_scrapper
+
+def test_semanas_desde_a_ultima_sincronizacao():
+    # Última sincronização na semana 9 de 2024, hoje na semana 22: janela estendida até a semana 6
+    assert sinan_scrapper.semanas_desde(date(2024, 3, 1), date(2024, 6, 1), 4) == {
+        (2024, semana) for semana in range(6, 23)}
+    # Sincronização recente: só a janela final
+    assert sinan_scrapper.semanas_desde(date(2024, 5, 31), date(2024, 6, 1), 4) == {
+        (2024, semana) for semana in range(19, 23)}
+
+def test_semanas_desde_na_virada_do_ano():
+    assert sinan_scrapper.semanas_desde(date(2023, 12, 28), date(2024, 1, 10), 4) == {
+        (2023, 49), (2023, 50), (2023, 51), (2023, 52), (2024, 1), (2024, 2)}
+
+def _semanas_no_banco(conn, estado, ano):
+    return {sinan_scrapper.numero_semana(semana) for (semana,) in conn.execute(
+        "SELECT DISTINCT semana FROM casos WHERE uf = ? AND ano = ?", (estado, ano))}
+
+def test_sincronizacao_cobre_o_intervalo_entre_execucoes(tabnet):
+    conn = sinan_store.abrir_store("casos.db")
+    try:
+        sinan_scrapper.sincronizar_estados(conn, ['PE'], ano_inicio=2024, hoje=date(2024, 3, 1), base_url=tabnet)
+        assert _semanas_no_banco(conn, 'PE', 2024) == set(range(1, 53))
+
+        # Simula semanas publicadas depois da primeira sincronização
+        with conn:
+            conn.execute("DELETE FROM casos WHERE uf = 'PE' AND ano = 2024")
+        tarefas = sinan_scrapper.sincronizar_estados(conn, ['PE'], ano_inicio=2024, hoje=date(2024, 6, 1),
+                                                     base_url=tabnet)
+        assert tarefas == [('PE', 2024)]
+        # Da janela da última sincronização (semana 9 - 3) até a semana de hoje
+        assert _semanas_no_banco(conn, 'PE', 2024) == set(range(6, 23))
+    finally:
+        conn.close()
+
+def test_sincronizacao_respeita_ano_fim(tabnet):
+    conn = sinan_store.abrir_store("casos.db")
+    try:
+        tarefas = sinan_scrapper.sincronizar_estados(conn, ['PE'], ano_inicio=2022, ano_fim=2022,
+                                                     hoje=date(2024, 6, 1), base_url=tabnet)
+        assert tarefas == [('PE', 2022)]
+        assert _semanas_no_banco(conn, 'PE', 2024) == set()
+    finally:
+        conn.close()
+
+def test_upsert_substitui_semanas_revisadas():
+    conn = sinan_store.abrir_store("casos.db")
+    try:
+        sinan_store.upsert_registros(conn, 'PE', [[2024, 'SEMANA 01', '260005 RECIFE', 3],
+                                                  [2024, 'SEMANA 02', '260005 RECIFE', 4]])
+        sinan_store.upsert_registros(conn, 'PE', [[2024, 'SEMANA 02', '260005 RECIFE', 9]])
+        tabela = sinan_store.carregar_tabela(conn, 'PE', 2024, 2024)
+        assert list(tabela['Casos']) == [3, 9]
+        assert sinan_store.ultima_sincronizacao(conn, 'PE', 2024) is None
+        sinan_store.registrar_sincronizacao(conn, 'PE', 2024, datetime(2024, 6, 1, 12, 0))
+        assert sinan_store.ultima_sincronizacao(conn, 'PE', 2024) == datetime(2024, 6, 1, 12, 0)
+    finally:
+        conn.close()
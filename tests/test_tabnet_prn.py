@@ -0,0 +1,57 @@
+import tabnet_prn
+import tabnet_local
+
+def _pagina(*linhas, fim='&'):
+    return "<html><body><PRE>\n" + "\n".join(linhas) + f"\n{fim}</PRE></body></html>"
+
+def test_pagina_sem_tabela():
+    pagina = "<html><body>Erro ao processar a tabela</body></html>"
+    assert not tabnet_prn.tem_tabela(pagina)
+    assert tabnet_prn.parse_prn(pagina, 2023) is None
+
+def test_bloco_vazio():
+    tabela = tabnet_prn.parse_prn("<pre>\n\n</pre>", 2023)
+    assert tabnet_prn.n_registros(tabela) == 0
+
+def test_valores_vazios_tracos_e_milhar():
+    pagina = _pagina('"Município";"Semana 01";"Semana 02";"Semana 03";"Total"',
+                     '"260005 Recife";-;;1.234;1234')
+    tabela = tabnet_prn.parse_prn(pagina, 2023)
+    assert list(tabela['Casos']) == [0, 0, 1234]
+    assert tabela['Semana'] == ['SEMANA 01', 'SEMANA 02', 'SEMANA 03']
+    assert list(tabela['Ano']) == [2023, 2023, 2023]
+
+def test_celulas_nao_numericas_valem_zero():
+    pagina = _pagina('"Município";"Semana 01";"Semana 02";"Semana 03";"Total"',
+                     '"260005 Recife";...;?;"7";7')
+    assert list(tabnet_prn.parse_prn(pagina, 2023)['Casos']) == [0, 0, 7]
+
+def test_coluna_total_ignorada_fora_do_fim():
+    pagina = _pagina('"Município";"Total";"Semana 01";"Semana 02"',
+                     '"260005 Recife";7;3;4')
+    tabela = tabnet_prn.parse_prn(pagina, 2022)
+    assert tabela['Semana'] == ['SEMANA 01', 'SEMANA 02']
+    assert list(tabela['Casos']) == [3, 4]
+
+def test_linha_truncada_mantem_semanas_presentes():
+    pagina = _pagina('"Município";"Semana 01";"Semana 02";"Semana 03";"Total"',
+                     '"260005 Recife";1;2;3;6',
+                     '"260010 Olinda";5')
+    tabela = tabnet_prn.parse_prn(pagina, 2023)
+    assert list(tabnet_prn.linhas(tabela))[3:] == [[2023, 'SEMANA 01', '260010 OLINDA', 5]]
+
+def test_entidades_html_e_maiusculas():
+    pagina = _pagina('"Município";"Semana 01";"Total"', '"261160 S&atilde;o Lourenço da Mata";2;2')
+    tabela = tabnet_prn.parse_prn(pagina, 2023)
+    assert tabela['Municipio'] == ['261160 SÃO LOURENÇO DA MATA']
+
+def test_sem_e_comercial_final():
+    pagina = _pagina('"Município";"Semana 01";"Total"', '"260005 Recife";2;2', fim='')
+    assert list(tabnet_prn.parse_prn(pagina, 2023)['Casos']) == [2]
+
+def test_pagina_gerada_completa():
+    pagina = tabnet_local.gerar_pagina_prn('PE', 2023, n_municipios=10, n_semanas=52)
+    tabela = tabnet_prn.parse_prn(pagina, 2023)
+    # 10 municípios mais a linha de total, 52 semanas cada
+    assert tabnet_prn.n_registros(tabela) == 11 * 52
+    assert 'TOTAL' not in tabela['Semana']
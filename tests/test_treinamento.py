@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import model_store
+import treinamento
+
+N_SEMANAS = 80
+
+def _painel(publicadas=N_SEMANAS, seed=7):
+    """Painel denso sintético de dois municípios; casos nulos depois de `publicadas` semanas."""
+    rng = np.random.default_rng(seed)
+    semanas = [(2021 + t // 52, t % 52 + 1) for t in range(N_SEMANAS)]
+    linhas = []
+    for codigo in (2600054, 2600104):
+        for t, (ano, semana) in enumerate(semanas):
+            casos = float(rng.poisson(5 + 3 * np.sin(t / 8)))
+            linhas.append({'code_muni': codigo, 'ano_epi': ano, 'semana_epi': semana,
+                           'casos': casos if t < publicadas else np.nan,
+                           'tavg': 25 + rng.normal(), 'tmin': 21 + rng.normal(), 'tmax': 30 + rng.normal(),
+                           'prcp': rng.gamma(1.5, 8), 'populacao': 100000.0})
+    return pd.DataFrame(linhas)
+
+def _cubo(df_painel):
+    codigos, chaves, dados = treinamento.painel.matrizes(df_painel, treinamento.VARIAVEIS)
+    return np.stack([dados[v] for v in treinamento.VARIAVEIS]), codigos, chaves
+
+def _modos(plano):
+    return {codigo: modo for codigo, (modo, _, _) in plano.items()}
+
+def _indice(plano):
+    return {str(codigo): metadados for codigo, (_, _, metadados) in plano.items()}
+
+def test_plano_novo_inalterado_e_incremental():
+    cubo, codigos, chaves = _cubo(_painel(publicadas=70))
+    plano = treinamento.planejar_atualizacao(cubo, codigos, chaves, {})
+    assert set(_modos(plano).values()) == {'novo'}
+    indice = _indice(plano)
+    assert treinamento.planejar_atualizacao(cubo, codigos, chaves, indice) == {
+        codigo: ('inalterado', 0, metadados) for codigo, (_, _, metadados) in plano.items()}
+
+    cubo, codigos, chaves = _cubo(_painel(publicadas=N_SEMANAS))
+    plano = treinamento.planejar_atualizacao(cubo, codigos, chaves, indice)
+    assert {modo for modo, _, _ in plano.values()} == {'incremental'}
+    assert {desde for _, desde, _ in plano.values()} == {70}
+
+def test_revisao_de_qualquer_variavel_forca_reajuste():
+    df_painel = _painel()
+    cubo, codigos, chaves = _cubo(df_painel)
+    indice = _indice(treinamento.planejar_atualizacao(cubo, codigos, chaves, {}))
+
+    for variavel in ('casos', 'tavg', 'populacao'):
+        revisado = df_painel.copy()
+        revisado.loc[10, variavel] += 1
+        cubo, codigos, chaves = _cubo(revisado)
+        assert _modos(treinamento.planejar_atualizacao(cubo, codigos, chaves, indice)) == {
+            2600054: 'reajuste', 2600104: 'inalterado'}
+
+def test_modelo_salvo_e_substituido(diretorio_isolado):
+    indice = {}
+    model_store.salvar_modelo('poisson', 2600054, {'coef': [1, 2]}, {'impressao': 'a' * 64}, indice)
+    model_store.salvar_modelo('poisson', 2600054, {'coef': [3, 4]}, {'impressao': 'b' * 64}, indice)
+    model_store.salvar_indice('poisson', indice)
+
+    indice = model_store.carregar_indice('poisson')
+    assert indice['2600054']['arquivo'] == f"2600054-{'b' * 12}.joblib"
+    assert model_store.carregar_modelo('poisson', 2600054) == {'coef': [3, 4]}
+    assert model_store.carregar_modelo('poisson', 2600104) is None
+    assert sorted(p.name for p in (diretorio_isolado / "modelos" / "poisson").iterdir()) == [
+        f"2600054-{'b' * 12}.joblib", "indice.json"]
+
+def test_atualizacao_semanal_de_ponta_a_ponta(diretorio_isolado):
+    relatorio = treinamento.atualizar_semanal(_painel(publicadas=70), tipo='sgd', max_workers=1)
+    assert relatorio['modo'].tolist() == ['novo', 'novo']
+    assert relatorio['erro'].isna().all()
+
+    relatorio = treinamento.atualizar_semanal(_painel(publicadas=N_SEMANAS), tipo='sgd', max_workers=1)
+    assert relatorio['modo'].tolist() == ['incremental', 'incremental']
+    assert relatorio['n_amostras'].tolist() == [10, 10]
+    assert model_store.carregar_indice('sgd')['2600054']['fim'] == 202228